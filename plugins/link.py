@@ -83,7 +83,6 @@ import platform
 import re
 
 from poezio.plugin import BasePlugin
-from poezio.xhtml import clean_text
 from poezio import common
 from poezio import tabs
 
@@ -114,7 +113,7 @@ class Plugin(BasePlugin):
         if not messages:
             return None
         for message in messages[::-1]:
-            matches = url_pattern.findall(clean_text(message.txt))
+            matches = url_pattern.findall(message.plain)
             if matches:
                 for url in matches[::-1]:
                     if nb == 1:
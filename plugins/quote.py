@@ -46,7 +46,6 @@ Options
 
 from poezio.core.structs import Completion
 from poezio.plugin import BasePlugin
-from poezio.xhtml import clean_text
 from poezio import common
 from poezio import tabs
 
@@ -85,7 +84,7 @@ class Plugin(BasePlugin):
             self.core.insert_input_text(
                 '%(before)s%(quote)s%(after)s' % {
                     'before': before.replace('\\n', '\n').replace('[SP]', ' '),
-                    'quote': clean_text(message.txt),
+                    'quote': message.plain,
                     'after': after.replace('\\n', '\n').replace('[SP]', ' ')
                 })
         else:
@@ -96,13 +95,13 @@ class Plugin(BasePlugin):
         if not messages:
             return None
         for message in messages[::-1]:
-            if clean_text(message.txt) == txt:
+            if message.plain == txt:
                 return message
         return None
 
     def completion_quote(self, the_input):
         def message_match(msg):
-            return input_message.lower() in clean_text(msg.txt).lower()
+            return input_message.lower() in msg.plain.lower()
 
         messages = self.api.get_conversation_messages()
         if not messages:
@@ -115,4 +114,4 @@ class Plugin(BasePlugin):
         elif len(args) > 1:
             return False
         return Completion(the_input.auto_completion,
-                          [clean_text(msg.txt) for msg in messages[::-1]], '')
+                          [msg.plain for msg in messages[::-1]], '')
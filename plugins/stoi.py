@@ -20,7 +20,6 @@ You only have to load the plugin:
 from poezio.plugin import BasePlugin
 from poezio import tabs
 import string
-from poezio import xhtml
 import random
 
 char_we_dont_want = string.punctuation + ' ’„“”…«»'
@@ -45,7 +44,7 @@ class Plugin(BasePlugin):
             # Do nothing if the conversation doesn’t contain any message
             return
         last_message = messages[-1]
-        txt = xhtml.clean_text(last_message.txt)
+        txt = last_message.plain
         for char in char_we_dont_want:
             txt = txt.replace(char, ' ')
         if txt.strip():
@@ -36,6 +36,7 @@ from slixmpp import JID
 from slixmpp.plugins.xep_0048 import Bookmarks, Conference, URL
 from poezio.common import safeJID
 from poezio.config import config
+from poezio.prefix_tree import PrefixTree
 
 log = logging.getLogger(__name__)
 
@@ -66,6 +67,13 @@ class Bookmark:
             return
         self._method = value
 
+    @property
+    def full_jid(self) -> str:
+        """The JID of the room, with the nick if there is one"""
+        if self.nick:
+            return '%s/%s' % (self.jid, self.nick)
+        return str(self.jid)
+
     def __repr__(self) -> str:
         return '<%s%s|%s>' % (self.jid, ('/' + self.nick)
                               if self.nick else '', self.method)
@@ -131,6 +139,10 @@ class Bookmark:
 class BookmarkList:
     def __init__(self):
         self.bookmarks = []  # type: List[Bookmark]
+        # the full_jid of the bookmarks, for the completion of /join: kept
+        # up to date by the methods changing the list, and by changed()
+        # when bookmarks are edited in place
+        self.jids = PrefixTree()
         preferred = config.get('use_bookmarks_method').lower()
         if preferred not in ('pep', 'privatexml'):
             preferred = 'privatexml'
@@ -163,8 +175,14 @@ class BookmarkList:
             for i in self.bookmarks[:]:
                 if i.jid == key:
                     self.bookmarks.remove(i)
+                    self.jids.discard(i.full_jid)
         else:
             self.bookmarks.remove(key)
+            self.jids.discard(key.full_jid)
+
+    def changed(self):
+        """Update the JIDs to complete, after editing bookmarks"""
+        self.jids.sync(bookmark.full_jid for bookmark in self.bookmarks)
 
     def __iter__(self):
         return iter(self.bookmarks)
@@ -177,6 +195,7 @@ class BookmarkList:
 
     def set(self, new: List[Bookmark]):
         self.bookmarks = new
+        self.changed()
 
     def append(self, bookmark: Bookmark):
         bookmark_exists = self[bookmark.jid]
@@ -184,7 +203,9 @@ class BookmarkList:
             self.bookmarks.append(bookmark)
         else:
             self.bookmarks.remove(bookmark_exists)
+            self.jids.discard(bookmark_exists.full_jid)
             self.bookmarks.append(bookmark)
+        self.jids.add(bookmark.full_jid)
 
     def set_bookmarks_method(self, value: str):
         if self.available_storage.get(value):
@@ -8,7 +8,7 @@
 Various useful functions.
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
@@ -194,9 +194,12 @@ def get_utc_time(local_time: Optional[datetime] = None) -> datetime:
     """
     Get the current UTC time
 
-    :param datetime local_time: The current local time
+    :param datetime local_time: The current local time (or any aware
+        datetime)
     :return: The current UTC time
     """
+    if local_time is not None and local_time.tzinfo is not None:
+        return local_time.astimezone(timezone.utc).replace(tzinfo=None)
     if local_time is None:
         local_time = datetime.now()
         isdst = time.localtime().tm_isdst
@@ -362,6 +365,26 @@ def parse_str_to_secs(duration='') -> int:
     return result
 
 
+def parse_str_to_date(date: str) -> Optional[datetime]:
+    """
+    Parse a date of the form YYYY-MM-DD, YYYY-MM-DDTHH:MM or
+    YYYY-MM-DDTHH:MM:SS.
+
+    :param str date: The formatted string.
+    :return: The date, or None if it could not be parsed.
+    :rtype: :py:class:`datetime.datetime`
+
+    >>> parse_str_to_date("2017-09-09T10:30")
+    datetime.datetime(2017, 9, 9, 10, 30)
+    """
+    for date_format in ('%Y-%m-%d', '%Y-%m-%dT%H:%M', '%Y-%m-%dT%H:%M:%S'):
+        try:
+            return datetime.strptime(date, date_format)
+        except ValueError:
+            pass
+    return None
+
+
 def parse_secs_to_str(duration=0) -> str:
     """
     Do the reverse operation of :py:func:`parse_str_to_secs`.
@@ -19,7 +19,8 @@ import pkg_resources
 from configparser import RawConfigParser, NoOptionError, NoSectionError
 from pathlib import Path
 from shutil import copy2
-from typing import Callable, Dict, List, Optional, Union, Tuple
+from typing import (Callable, Dict, List, NamedTuple, Optional, Union,
+                    Tuple)
 
 from poezio.args import parse_args
 from poezio import xdg
@@ -28,6 +29,12 @@ ConfigValue = Union[str, int, float, bool]
 
 DEFSECTION = "Poezio"
 
+# returned by the lookups of the options which were not resolved yet
+NOT_CACHED = object()
+
+CacheInfo = NamedTuple('CacheInfo', [('hits', int), ('misses', int),
+                                     ('size', int)])
+
 DEFAULT_CONFIG = {
     'Poezio': {
         'ack_message_receipts': True,
@@ -88,13 +95,21 @@ DEFAULT_CONFIG = {
         'jid': '',
         'keyfile': '',
         'lang': 'en',
+        'lazy_background_tabs': True,
+        'lazy_layout': True,
         'lazy_resize': True,
         'load_log': 10,
         'log_dir': '',
+        'log_buffer_size': 65536,
         'log_errors': True,
+        'log_flush_interval': 0,
+        'log_index': False,
+        'log_search': False,
+        'max_fps': 30,
         'max_lines_in_memory': 2048,
         'max_messages_in_memory': 2048,
         'max_nick_length': 25,
+        'max_open_log_files': 128,
         'muc_history_length': 50,
         'notify_messages': True,
         'open_all_bookmarks': False,
@@ -103,6 +118,7 @@ DEFAULT_CONFIG = {
         'plugins_conf_dir': '',
         'plugins_dir': '',
         'popup_time': 4,
+        'presence_batch_delay': 0.2,
         'private_auto_response': '',
         'remote_fifo_path': './',
         'request_message_receipts': True,
@@ -144,7 +160,9 @@ DEFAULT_CONFIG = {
         'vertical_tab_list_size': 20,
         'vertical_tab_list_sort': 'desc',
         'whitespace_interval': 300,
-        'words': ''
+        'words': '',
+        'xml_capture_size': 10000,
+        'xml_capture_spill_file': ''
     },
     'bindings': {
         'M-i': '^I'
@@ -163,6 +181,21 @@ class Config(RawConfigParser):
     """
 
     def __init__(self, file_name: Path, default=None) -> None:
+        # the values already resolved by get() and get_by_tabname(), by
+        # their arguments, until the config changes
+        self._values = {}  # type: Dict[Tuple, ConfigValue]
+        self._tab_values = {}  # type: Dict[Tuple, ConfigValue]
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # the lines of the file, and the [begin, end) lines of its sections,
+        # edited by write_in_file and remove_in_file, and the modification
+        # time and size of the file they were read from
+        self._lines = None  # type: Optional[List[str]]
+        self._line_sections = {}  # type: Dict[str, List[int]]
+        self._lines_stamp = None  # type: Optional[Tuple[int, int]]
+        # the lines were edited since they were written
+        self._dirty = False
+        self._batch_depth = 0
         RawConfigParser.__init__(self, None)
         # make the options case sensitive
         self.optionxform = lambda param: str(param)
@@ -170,7 +203,30 @@ class Config(RawConfigParser):
         self.read_file()
         self.default = default
 
+    def invalidate_cache(self) -> None:
+        """Forget the resolved values, after a change of the config"""
+        self._values.clear()
+        self._tab_values.clear()
+
+    def cache_info(self) -> CacheInfo:
+        """The hits and misses of the resolved values, and their number"""
+        return CacheInfo(self.cache_hits, self.cache_misses,
+                         len(self._values) + len(self._tab_values))
+
+    def add_section(self, section: str) -> None:
+        RawConfigParser.add_section(self, section)
+        self.invalidate_cache()
+
+    def remove_section(self, section: str) -> bool:
+        self.invalidate_cache()
+        return RawConfigParser.remove_section(self, section)
+
+    def remove_option(self, section: str, option: str) -> bool:
+        self.invalidate_cache()
+        return RawConfigParser.remove_option(self, section, option)
+
     def read_file(self):
+        self.invalidate_cache()
         RawConfigParser.read(self, str(self.file_name), encoding='utf-8')
         # Check config integrity and fix it if it’s wrong
         # only when the object is the main config
@@ -189,6 +245,22 @@ class Config(RawConfigParser):
         The type of default defines the type
         returned
         """
+        # the type is part of the key, because True == 1
+        key = (option, section, default.__class__, default)
+        try:
+            value = self._values.get(key, NOT_CACHED)
+        except TypeError:
+            return self._resolve(option, default, section)
+        if value is NOT_CACHED:
+            self.cache_misses += 1
+            value = self._values[key] = self._resolve(option, default,
+                                                      section)
+        else:
+            self.cache_hits += 1
+        return value
+
+    def _resolve(self, option: str, default: Optional[ConfigValue],
+                 section: str) -> ConfigValue:
         if default is None:
             if self.default:
                 default = self.default.get(section, {}).get(option)
@@ -223,6 +295,23 @@ class Config(RawConfigParser):
         in the section, we search for the global option if fallback is
         True. And we return `default` as a fallback as a last resort.
         """
+        key = (option, str(tabname), fallback, fallback_server,
+               default.__class__, default)
+        try:
+            value = self._tab_values.get(key, NOT_CACHED)
+        except TypeError:
+            return self._resolve_by_tabname(option, tabname, fallback,
+                                            fallback_server, default)
+        if value is NOT_CACHED:
+            self.cache_misses += 1
+            value = self._tab_values[key] = self._resolve_by_tabname(
+                option, tabname, fallback, fallback_server, default)
+        else:
+            self.cache_hits += 1
+        return value
+
+    def _resolve_by_tabname(self, option, tabname, fallback, fallback_server,
+                            default):
         if self.default and (not default) and fallback:
             default = self.default.get(DEFSECTION, {}).get(option, '')
         if tabname in self.sections():
@@ -292,35 +381,33 @@ class Config(RawConfigParser):
         Just find the right section, and then find the
         right option, and edit it.
         """
-        result = self._parse_file()
-        if not result:
+        if not self._load_lines():
             return False
-        else:
-            sections, result_lines = result
+        lines, sections = self._lines, self._line_sections
+        line = '%s = %s' % (option, value)
 
         if section not in sections:
-            result_lines.append('[%s]' % section)
-            result_lines.append('%s = %s' % (option, value))
+            sections[section] = [len(lines), len(lines) + 2]
+            lines.append('[%s]' % section)
+            lines.append(line)
         else:
             begin, end = sections[section]
-            pos = find_line(result_lines, begin, end, option)
+            pos = find_line(lines, begin, end, option)
 
-            if pos is -1:
-                result_lines.insert(end, '%s = %s' % (option, value))
+            if pos == -1:
+                self._insert_line(end, line)
             else:
-                result_lines[pos] = '%s = %s' % (option, value)
+                lines[pos] = line
 
-        return self._write_file(result_lines)
+        return self._save_lines()
 
     def remove_in_file(self, section: str, option: str) -> bool:
         """
         Our own way to remove an option from the file.
         """
-        result = self._parse_file()
-        if not result:
+        if not self._load_lines():
             return False
-        else:
-            sections, result_lines = result
+        lines, sections = self._lines, self._line_sections
 
         if section not in sections:
             log.error(
@@ -329,17 +416,87 @@ class Config(RawConfigParser):
             return True
         else:
             begin, end = sections[section]
-            pos = find_line(result_lines, begin, end, option)
+            pos = find_line(lines, begin, end, option)
 
-            if pos is -1:
+            if pos == -1:
                 log.error(
                     'Tried to remove a non-existing option %s'
                     ' from section %s', option, section)
                 return True
             else:
-                del result_lines[pos]
+                self._delete_line(pos)
+
+        return self._save_lines()
 
-        return self._write_file(result_lines)
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat_result = self.file_name.stat()
+        except OSError:
+            return None
+        return stat_result.st_mtime_ns, stat_result.st_size
+
+    def _load_lines(self) -> bool:
+        """
+        Read the lines of the file, unless they are already in memory and
+        the file was not changed since
+        """
+        stamp = self._file_stamp()
+        if self._lines is not None and stamp == self._lines_stamp:
+            return True
+        if self._dirty:
+            log.error('The config file %s was changed while poezio was '
+                      'editing it, the changes of poezio are lost',
+                      self.file_name)
+            self._dirty = False
+        result = self._parse_file()
+        if not result:
+            self._lines = None
+            return False
+        self._line_sections, self._lines = result
+        self._lines_stamp = stamp
+        return True
+
+    def _insert_line(self, pos: int, line: str) -> None:
+        self._lines.insert(pos, line)
+        for bounds in self._line_sections.values():
+            if bounds[0] >= pos:
+                bounds[0] += 1
+            if bounds[1] >= pos:
+                bounds[1] += 1
+
+    def _delete_line(self, pos: int) -> None:
+        del self._lines[pos]
+        for bounds in self._line_sections.values():
+            if bounds[0] > pos:
+                bounds[0] -= 1
+            if bounds[1] > pos:
+                bounds[1] -= 1
+
+    def _save_lines(self) -> bool:
+        """Write the lines, or wait for the end of the batch"""
+        self._dirty = True
+        if self._batch_depth:
+            return True
+        return self.flush()
+
+    def batch(self) -> 'WriteBatch':
+        """
+        Group the writes in the file: the file is only written once at
+        the end of the with block
+        """
+        return WriteBatch(self)
+
+    def flush(self) -> bool:
+        """Write the pending changes in the file"""
+        if not self._dirty or self._lines is None:
+            return True
+        self._dirty = False
+        if not self._write_file(self._lines):
+            # read the file again on the next change
+            self._lines = None
+            return False
+        self._lines_stamp = self._file_stamp()
+        return True
 
     def _write_file(self, lines: List[str]) -> bool:
         """
@@ -444,6 +601,7 @@ class Config(RawConfigParser):
         else:
             self.add_section(section)
             RawConfigParser.set(self, section, option, value)
+        self.invalidate_cache()
         if not self.write_in_file(section, option, value):
             return ('Unable to write in the config file', 'Error')
         return ("%s=%s" % (option, value), 'Info')
@@ -455,6 +613,7 @@ class Config(RawConfigParser):
         """
         if self.has_section(section):
             RawConfigParser.remove_option(self, section, option)
+        self.invalidate_cache()
         if not self.remove_in_file(section, option):
             return ('Unable to save the config file', 'Error')
         return ('Option %s deleted' % option, 'Info')
@@ -468,6 +627,7 @@ class Config(RawConfigParser):
         else:
             self.add_section(section)
             RawConfigParser.set(self, section, option, value)
+        self.invalidate_cache()
         return self.write_in_file(section, option, value)
 
     def set(self, option: str, value: ConfigValue, section=DEFSECTION):
@@ -478,6 +638,7 @@ class Config(RawConfigParser):
             RawConfigParser.set(self, section, option, value)
         except NoSectionError:
             pass
+        self.invalidate_cache()
 
     def to_dict(self) -> Dict[str, Dict[str, ConfigValue]]:
         """
@@ -491,6 +652,26 @@ class Config(RawConfigParser):
         return res
 
 
+class WriteBatch:
+    """
+    Defers the writes of a Config in its file to the end of a with
+    block. success tells if they were written, after the block.
+    """
+
+    def __init__(self, config_obj: Config) -> None:
+        self.config = config_obj
+        self.success = True
+
+    def __enter__(self) -> 'WriteBatch':
+        self.config._batch_depth += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.config._batch_depth -= 1
+        if not self.config._batch_depth:
+            self.success = self.config.flush()
+
+
 def find_line(lines: List[str], start: int, end: int, option: str) -> int:
     """
     Get the number of the line containing the option in the
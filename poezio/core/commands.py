@@ -20,6 +20,8 @@ from poezio import tabs
 from poezio.bookmarks import Bookmark
 from poezio.common import safeJID
 from poezio.config import config, DEFAULT_CONFIG, options as config_opts
+from poezio.log_search import LogSearchError
+from poezio.logger import logger
 from poezio import multiuserchat as muc
 from poezio.plugin import PluginConfig
 from poezio.roster import roster
@@ -275,6 +277,56 @@ class CommandCore:
         cb = list_tab.on_muc_list_item_received
         self.core.xmpp.plugin['xep_0030'].get_items(jid=jid, callback=cb)
 
+    @command_args_parser.raw
+    def search(self, args):
+        """
+        /search <terms>
+        Opens a LogSearchTab containing the logged messages matching the terms
+        """
+        if not args.strip():
+            return self.help('search')
+        if not config.get('log_search'):
+            return self.core.information(
+                'Searching the logs requires the log_search option', 'Error')
+        try:
+            results = logger.search(args)
+        except LogSearchError as exn:
+            return self.core.information(str(exn), 'Error')
+        search_tab = tabs.LogSearchTab(self.core, args.strip(), results)
+        self.core.add_tab(search_tab, True)
+
+    @command_args_parser.quoted(0, 1)
+    def eventstats(self, args):
+        """
+        /eventstats [on|off|reset]
+        """
+        if args is None:
+            return self.help('eventstats')
+        events = self.core.events
+        if args:
+            if args[0] == 'on':
+                events.enable_stats()
+                return self.core.information(
+                    'Measuring the event handlers', 'Info')
+            elif args[0] == 'off':
+                events.disable_stats()
+                return self.core.information(
+                    'Stopped measuring the event handlers', 'Info')
+            elif args[0] == 'reset':
+                events.reset_stats()
+                return self.core.information(
+                    'Event handler stats reset', 'Info')
+            return self.help('eventstats')
+        if events.stats is None:
+            return self.core.information(
+                'The event handlers are not measured, use /eventstats on',
+                'Info')
+        lines = events.format_stats()
+        if not lines:
+            return self.core.information('No event handler was called yet',
+                                         'Info')
+        self.core.information('Event handlers:\n' + '\n'.join(lines), 'Info')
+
     @command_args_parser.quoted(1)
     def version(self, args):
         """
@@ -446,6 +498,7 @@ class CommandCore:
         bookmark.autojoin = autojoin
         if nick:
             bookmark.nick = nick
+            self.core.bookmarks.changed()
         if password:
             bookmark.password = password
 
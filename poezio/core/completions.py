@@ -15,19 +15,55 @@ from poezio import tabs
 from poezio import xdg
 from poezio.common import safeJID
 from poezio.config import config
+from poezio.prefix_tree import PrefixTree
 from poezio.roster import roster
 
 from poezio.core.structs import POSSIBLE_SHOW, Completion
 
 
+def current_argument(the_input, position, quoted=True):
+    """The argument being completed, as split by Input.new_completion"""
+    if quoted:
+        args = common.shell_split(the_input.text)
+    else:
+        args = the_input.text.split()
+    return args[position] if position < len(args) else ''
+
+
 class CompletionCore:
     def __init__(self, core):
         self.core = core
+        # Prefix trees of the candidates of the completions, so that only
+        # the ones starting with the argument are listed (the bookmarks
+        # have theirs, see BookmarkList.jids). The roster JIDs are updated
+        # by the roster handler, and synced again when items were added to
+        # the roster otherwise (see roster_tree). The commands are added
+        # and removed with them. The option names are synced when /set is
+        # completed.
+        self.roster_jids = PrefixTree()
+        self._roster_items = 0
+        self.commands = PrefixTree()
+        self.config_keys = PrefixTree()
+
+    def roster_tree(self) -> PrefixTree:
+        """
+        The tree of the roster JIDs, synced with the roster if the number
+        of its items changed since then
+        """
+        nb_items = roster.nb_items
+        if nb_items != self._roster_items:
+            self.roster_jids.sync(roster.jids())
+            self._roster_items = nb_items
+        return self.roster_jids
 
     def help(self, the_input):
         """Completion for /help."""
-        commands = sorted(self.core.commands.keys()) + sorted(
-            self.core.tabs.current_tab.commands.keys())
+        if the_input.last_completion:
+            return Completion(the_input.new_completion, [], 1, quotify=False)
+        prefix = current_argument(the_input, 1, quoted=False)
+        commands = self.commands.complete(prefix) + sorted(
+            name for name in self.core.tabs.current_tab.commands
+            if name.lower().startswith(prefix.lower()))
         return Completion(the_input.new_completion, commands, 1, quotify=False)
 
     def status(self, the_input):
@@ -113,20 +149,15 @@ class CompletionCore:
         if args[1].endswith('@') and not jid.user and not jid.server:
             jid.user = args[1][:-1]
 
+        if the_input.last_completion:
+            return Completion(the_input.new_completion, [], 1, quotify=True)
+
         relevant_rooms = []
         relevant_rooms.extend(sorted(self.core.pending_invites.keys()))
-        bookmarks = [(str(elem.jid)
-                      if not elem.nick else '%s/%s' % (elem.jid, elem.nick))
-                     for elem in self.core.bookmarks]
-        to_suggest = []
-        for bookmark in bookmarks:
+        for bookmark in self.core.bookmarks.jids.complete(args[1]):
             tab = self.core.tabs.by_name_and_class(bookmark, tabs.MucTab)
             if not tab or (tab and not tab.joined):
-                to_suggest.append(bookmark)
-        relevant_rooms.extend(sorted(to_suggest))
-
-        if the_input.last_completion:
-            return Completion(the_input.new_completion, [], 1, quotify=True)
+                relevant_rooms.append(bookmark)
 
         if jid.user:
             # we are writing the server: complete the server
@@ -185,6 +216,12 @@ class CompletionCore:
         list_.extend(self.core.tabs.current_tab.key_func.keys())
         return Completion(the_input.new_completion, list_, 1, quotify=False)
 
+    def eventstats(self, the_input):
+        """Completion for /eventstats"""
+        return Completion(
+            the_input.new_completion, ['on', 'off', 'reset'], 1,
+            quotify=False)
+
     def bookmark(self, the_input):
         """Completion for /bookmark"""
         args = common.shell_split(the_input.text)
@@ -256,10 +293,17 @@ class CompletionCore:
         n = the_input.get_argument_position(quoted=True)
         if n >= 2:
             return False
+        if the_input.last_completion:
+            return Completion(
+                the_input.new_completion, [], 1, '', quotify=True)
         online = []
         offline = []
-        for jid in sorted(roster.jids()):
-            if len(roster[jid]) > 0:
+        prefix = current_argument(the_input, 1)
+        for jid in self.roster_tree().complete(prefix):
+            contact = roster[jid]
+            if not contact:
+                continue
+            if len(contact) > 0:
                 online.append(jid)
             else:
                 offline.append(jid)
@@ -270,15 +314,25 @@ class CompletionCore:
         """Completion for /invite"""
         n = the_input.get_argument_position(quoted=True)
         if n == 1:
-            comp = reduce(lambda x, y: x + [i.jid for i in y],
-                          (roster[jid].resources for jid in roster.jids()
-                           if len(roster[jid])), [])
-            comp = sorted(comp)
-            bares = sorted(roster[contact].bare_jid
-                           for contact in roster.jids()
-                           if len(roster[contact]))
-            off = sorted(jid for jid in roster.jids() if jid not in bares)
-            comp = comp + bares + off
+            if the_input.last_completion:
+                return Completion(
+                    the_input.new_completion, [], n, quotify=True)
+            prefix = current_argument(the_input, n)
+            lowered = prefix.lower()
+            comp = []
+            bares = []
+            off = []
+            for jid in self.roster_tree().complete(prefix.split('/', 1)[0]):
+                contact = roster[jid]
+                if not contact:
+                    continue
+                if len(contact):
+                    comp.extend(resource.jid for resource in contact.resources
+                                if resource.jid.lower().startswith(lowered))
+                    bares.append(contact.bare_jid)
+                else:
+                    off.append(jid)
+            comp = sorted(comp) + bares + off
             return Completion(the_input.new_completion, comp, n, quotify=True)
         elif n == 2:
             rooms = []
@@ -355,10 +409,10 @@ class CompletionCore:
                     for section in plugin.config.sections()
                 ]
             else:
-                end_list = set(config.options('Poezio'))
-                end_list.update(config.default.get('Poezio', {}))
-                end_list = list(end_list)
-                end_list.sort()
+                keys = set(config.options('Poezio'))
+                keys.update(config.default.get('Poezio', {}))
+                self.config_keys.sync(keys)
+                end_list = self.config_keys.complete(args[1])
         elif n == 2:
             if '|' in args[1]:
                 plugin_name, section = args[1].split('|')[:2]
@@ -12,6 +12,7 @@ import os
 import pipes
 import sys
 import shutil
+import sqlite3
 import time
 from collections import defaultdict
 from typing import Callable, Dict, List, Optional, Tuple, Type
@@ -35,7 +36,9 @@ from poezio.config import config, firstrun
 from poezio.contact import Contact, Resource
 from poezio.daemon import Executor
 from poezio.fifo import Fifo
+from poezio.frames import FrameScheduler
 from poezio.logger import logger
+from poezio.log_search import LogSearchError
 from poezio.plugin_manager import PluginManager
 from poezio.roster import roster
 from poezio.size_manager import SizeManager
@@ -54,6 +57,10 @@ from poezio.core.structs import POSSIBLE_SHOW, DEPRECATED_ERRORS, \
 
 log = logging.getLogger(__name__)
 
+# seconds between two updates of the /search index, once the logs are
+# indexed
+LOG_SEARCH_INTERVAL = 60
+
 
 class Core:
     """
@@ -74,6 +81,9 @@ class Core:
         status = POSSIBLE_SHOW.get(status, None)
         self.status = Status(show=status, message=config.get('status_message'))
         self.running = True
+        self.frames = FrameScheduler(self._render_frame,
+                                     config.get('max_fps'))
+        self.timers = timed_events.TimerWheel()
         self.xmpp = connection.Connection()
         self.xmpp.core = self
         self.keyboard = keyboard.Keyboard()
@@ -288,6 +298,9 @@ class Core:
 
         self.pending_invites = {}
 
+        # whether the logs are being indexed for /search
+        self._indexing_logs = False
+
         # a dict of the form {'config_option': [list, of, callbacks]}
         # Whenever a configuration option is changed (using /set or by
         # reloading a new config using a signal), all the associated
@@ -312,6 +325,9 @@ class Core:
             ('enable_vertical_tab_list',
              self.on_vertical_tab_list_config_change),
             ('hide_user_list', self.on_hide_user_list_change),
+            ('highlight_on', self.on_highlight_config_change),
+            ('log_search', self.on_log_search_config_change),
+            ('max_fps', self.on_max_fps_config_change),
             ('password', self.on_password_change),
             ('plugins_conf_dir',
              self.plugin_manager.on_plugins_conf_dir_change),
@@ -330,6 +346,12 @@ class Core:
     def on_tab_change(self, old_tab: tabs.Tab, new_tab: tabs.Tab):
         """Whenever the current tab changes, change focus and refresh"""
         old_tab.on_lose_focus()
+        old_text_win = old_tab.get_text_window()
+        if old_text_win and config.get('lazy_background_tabs'):
+            old_text_win.defer()
+        new_text_win = new_tab.get_text_window()
+        if new_text_win:
+            new_text_win.resume()
         new_tab.on_gain_focus()
         self.refresh_window()
 
@@ -368,6 +390,12 @@ class Core:
         """
         self.call_for_resize()
 
+    def on_max_fps_config_change(self, option, value):
+        """
+        Called when the max_fps option changes
+        """
+        self.frames.max_fps = config.get('max_fps')
+
     def on_bookmarks_method_config_change(self, option, value):
         """
         Called when the use_bookmarks_method option changes
@@ -384,6 +412,22 @@ class Core:
         """
         self.tabs.update_gaps(value.lower() != "false")
 
+    def on_highlight_config_change(self, option, value):
+        """
+        Called when the highlight_on option is changed.
+        Recompile the highlight regex of the rooms.
+        """
+        for tab in self.tabs.by_class(tabs.MucTab):
+            tab.reset_highlight_regex()
+
+    def on_log_search_config_change(self, option, value):
+        """
+        Called when the log_search option is changed.
+        Start indexing the logs if it is enabled.
+        """
+        if value.lower() != 'false':
+            self.index_logs()
+
     def on_request_receipts_config_change(self, option, value):
         """
         Called when the request_message_receipts option changes
@@ -490,6 +534,7 @@ class Core:
         }
 
         log.error("%s received. Exiting…", signals[sig])
+        logger.flush_all()
         if config.get('enable_user_mood'):
             self.xmpp.plugin['xep_0107'].stop()
         if config.get('enable_user_activity'):
@@ -536,9 +581,14 @@ class Core:
                 ' \x19b/set use_log false\x19o', 'Help')
         self.refresh_window()
         self.xmpp.plugin['xep_0012'].begin_idle(jid=self.xmpp.boundjid)
+        if config.get('log_search'):
+            self.index_logs()
 
     def exit(self, event=None):
         log.debug("exit(%s)", event)
+        logger.flush_all()
+        if self.xml_tab:
+            self.xml_tab.capture.close()
         asyncio.get_event_loop().stop()
 
     def on_exception(self, typ, value, trace):
@@ -609,16 +659,18 @@ class Core:
                 self.do_command(''.join(char_list), True)
         if self.status.show not in ('xa', 'away'):
             self.xmpp.plugin['xep_0319'].idle()
-        self.doupdate()
+        # draw what was typed right away
+        self.frames.flush()
 
     def save_config(self):
         """
         Save config in the file just before exit
         """
-        ok = roster.save_to_config_file()
-        ok = ok and config.silent_set('info_win_height',
-                                      self.information_win_size, 'var')
-        if not ok:
+        with config.batch() as batch:
+            ok = roster.save_to_config_file()
+            ok = ok and config.silent_set('info_win_height',
+                                          self.information_win_size, 'var')
+        if not ok or not batch.success:
             self.information(
                 'Unable to save runtime preferences'
                 ' in the config file', 'Error')
@@ -783,8 +835,35 @@ class Core:
 
     def add_timed_event(self, event: DelayedEvent) -> None:
         """Add a new timed event"""
-        event.handler = asyncio.get_event_loop().call_later(
-            event.delay, event.callback, *event.args)
+        self.timers.add(event)
+
+    def index_logs(self) -> None:
+        """
+        Start indexing the logs for /search, a part at a time when the
+        loop is idle, until everything is indexed. The messages logged
+        afterwards are indexed regularly.
+        """
+        if self._indexing_logs:
+            return
+        self._indexing_logs = True
+        asyncio.get_event_loop().idle_call(self._index_logs_step)
+
+    def _index_logs_step(self) -> None:
+        if not config.get('log_search'):
+            self._indexing_logs = False
+            return
+        try:
+            more = logger.update_search()
+        except (LogSearchError, sqlite3.Error) as exn:
+            log.error('Unable to index the logs', exc_info=True)
+            self.information('Unable to index the logs: %s' % exn, 'Error')
+            self._indexing_logs = False
+            return
+        if more:
+            asyncio.get_event_loop().idle_call(self._index_logs_step)
+        else:
+            self.add_timed_event(
+                DelayedEvent(LOG_SEARCH_INTERVAL, self._index_logs_step))
 
 ####################### XMPP-related actions ##################################
 
@@ -802,10 +881,11 @@ class Core:
         """
         self.status = Status(show=pres, message=msg)
         if config.get('save_status'):
-            ok = config.silent_set('status', pres if pres else '')
-            msg = msg.replace('\n', '|') if msg else ''
-            ok = ok and config.silent_set('status_message', msg)
-            if not ok:
+            with config.batch() as batch:
+                ok = config.silent_set('status', pres if pres else '')
+                msg = msg.replace('\n', '|') if msg else ''
+                ok = ok and config.silent_set('status_message', msg)
+            if not ok or not batch.success:
                 self.information(
                     'Unable to save the status in '
                     'the config file', 'Error')
@@ -958,6 +1038,10 @@ class Core:
         self.tabs.append(new_tab)
         if focus:
             self.tabs.set_current_tab(new_tab)
+        elif config.get('lazy_background_tabs'):
+            text_win = new_tab.get_text_window()
+            if text_win:
+                text_win.defer()
 
     def insert_tab(self, old_pos: int, new_pos: int = 99999) -> bool:
         """
@@ -1230,10 +1314,32 @@ class Core:
 ####################### Curses and ui-related stuff ###########################
 
     def doupdate(self) -> None:
-        "Do a curses update"
+        "Do a curses update, in the next frame"
         if not self.running:
             return
+        self.frames.request()
+
+    def _render_frame(self, full: bool,
+                      redraws: Dict[Callable, Optional[tabs.Tab]]) -> None:
+        """
+        Draw a frame: the whole current tab, or the parts of it marked
+        dirty, then update the terminal
+        """
+        if not self.running:
+            return
+        current = self.tabs.current_tab
+        nocursor = None
+        if full:
+            nocursor = curses.curs_set(0)
+            current.state = 'current'
+            current.refresh()
+        else:
+            for redraw, tab in redraws.items():
+                if tab is None or tab is current:
+                    redraw()
         curses.doupdate()
+        if nocursor is not None:
+            curses.curs_set(nocursor)
 
     def information(self, msg: str, typ: str = '') -> bool:
         """
@@ -1296,13 +1402,9 @@ class Core:
 
     def refresh_window(self) -> None:
         """
-        Refresh everything
+        Refresh everything, in the next frame
         """
-        nocursor = curses.curs_set(0)
-        self.tabs.current_tab.state = 'current'
-        self.tabs.current_tab.refresh()
-        self.doupdate()
-        curses.curs_set(nocursor)
+        self.frames.mark_full()
 
     def refresh_tab_win(self) -> None:
         """
@@ -1564,6 +1666,7 @@ class Core:
         if not desc and shortdesc:
             desc = shortdesc
         self.commands[name] = Command(func, desc, completion, shortdesc, usage)
+        self.completion.commands.add(name)
 
     def register_initial_commands(self):
         """
@@ -1719,6 +1822,14 @@ class Core:
             " on the specified server.",
             shortdesc='List the rooms.',
             completion=self.completion.list)
+        self.register_command(
+            'search',
+            self.command.search,
+            usage='<terms>',
+            desc='Search the logs for the messages containing all the terms'
+            ' (a term ending with * matches the words starting with it), and'
+            ' open a tab listing them.',
+            shortdesc='Search the logs.')
         self.register_command(
             'message',
             self.command.message,
@@ -1814,6 +1925,18 @@ class Core:
             completion=self.completion.runkey)
         self.register_command(
             'self', self.command.self_, shortdesc='Remind you of who you are.')
+        self.register_command(
+            'eventstats',
+            self.command.eventstats,
+            usage='[on|off|reset]',
+            desc='Measure the time spent in the handlers of the poezio '
+            'events (by the plugins, mostly). With no argument, show the '
+            'number of calls, and the total, mean and 99th percentile '
+            'durations of each handler; on and off start and stop the '
+            'measuring (the measures are kept when it stops), and reset '
+            'forgets the measures.',
+            shortdesc='Show the time spent in the event handlers.',
+            completion=self.completion.eventstats)
         self.register_command(
             'last_activity',
             self.command.last_activity,
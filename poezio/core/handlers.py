@@ -20,8 +20,7 @@ import pyasn1.codec.der.decoder
 import pyasn1.codec.der.encoder
 import pyasn1_modules.rfc2459
 from slixmpp import InvalidJID
-from slixmpp.xmlstream.stanzabase import StanzaBase, ElementBase
-from xml.etree import ElementTree as ET
+from slixmpp.xmlstream.stanzabase import StanzaBase
 
 from poezio import common
 from poezio import fixes
@@ -40,16 +39,6 @@ from poezio.theming import dump_tuple, get_theme
 
 from poezio.core.commands import dumb_callback
 
-try:
-    from pygments import highlight
-    from pygments.lexers import get_lexer_by_name
-    from pygments.formatters import HtmlFormatter
-    LEXER = get_lexer_by_name('xml')
-    FORMATTER = HtmlFormatter(noclasses=True)
-    PYGMENTS = True
-except ImportError:
-    PYGMENTS = False
-
 CERT_WARNING_TEXT = """
 WARNING: CERTIFICATE FOR %s CHANGED
 
@@ -664,6 +653,8 @@ class HandlerCore:
                 self.core.xmpp, room_from, self.core.own_nick, msg='')
             return
 
+        # the users who joined just before the message must be known
+        tab.process_presence_batch()
         nick_from = message['mucnick']
         user = tab.get_user_by_name(nick_from)
         if user and user in tab.ignores:
@@ -711,16 +702,9 @@ class HandlerCore:
             tab.last_sent_message = message
 
         if tab is self.core.tabs.current_tab:
-            tab.text_win.refresh()
-            tab.info_header.refresh(tab, tab.text_win, user=tab.own_user)
-            tab.input.refresh()
-            self.core.doupdate()
+            self.core.frames.mark_dirty(tab, tab.refresh_after_message)
         elif tab.state != old_state:
-            self.core.refresh_tab_win()
-            current = self.core.tabs.current_tab
-            if hasattr(current, 'input') and current.input:
-                current.input.refresh()
-            self.core.doupdate()
+            self.core.frames.mark_dirty(None, self.core.refresh_tab_win)
 
         if 'message' in config.get('beep_on').split():
             if (not config.get_by_tabname('disable_beep', room_from)
@@ -926,8 +910,11 @@ class HandlerCore:
             else:
                 if item['subscription'] == 'remove':
                     del roster[jid]
+                    self.core.completion.roster_jids.discard(jid.bare)
                 else:
                     roster.update_contact_groups(jid)
+                    if jid.bare != roster.jid:
+                        self.core.completion.roster_jids.add(jid.bare)
         roster.update_size()
         if isinstance(self.core.tabs.current_tab, tabs.RosterInfoTab):
             self.core.refresh_window()
@@ -1416,59 +1403,29 @@ class HandlerCore:
 
     def outgoing_stanza(self, stanza):
         """
-        We are sending a new stanza, write it in the xml buffer if needed.
+        We are sending a new stanza, capture it for the XMLTab if needed.
         """
         if self.core.xml_tab:
-            if PYGMENTS:
-                xhtml_text = highlight(str(stanza), LEXER, FORMATTER)
-                poezio_colored = xhtml.xhtml_to_poezio_colors(
-                    xhtml_text, force=True).rstrip('\x19o').strip()
-            else:
-                poezio_colored = str(stanza)
-            self.core.add_message_to_text_buffer(
-                self.core.xml_buffer,
-                poezio_colored,
-                nickname=get_theme().CHAR_XML_OUT)
-            try:
-                if self.core.xml_tab.match_stanza(
-                        ElementBase(ET.fromstring(stanza))):
-                    self.core.add_message_to_text_buffer(
-                        self.core.xml_tab.filtered_buffer,
-                        poezio_colored,
-                        nickname=get_theme().CHAR_XML_OUT)
-            except:
-                log.debug('', exc_info=True)
-
-            if isinstance(self.core.tabs.current_tab, tabs.XMLTab):
-                self.core.tabs.current_tab.refresh()
-                self.core.doupdate()
+            self.capture_stanza(str(stanza), incoming=False)
 
     def incoming_stanza(self, stanza):
         """
-        We are receiving a new stanza, write it in the xml buffer if needed.
+        We are receiving a new stanza, capture it for the XMLTab if needed.
         """
         if self.core.xml_tab:
-            if PYGMENTS:
-                xhtml_text = highlight(str(stanza), LEXER, FORMATTER)
-                poezio_colored = xhtml.xhtml_to_poezio_colors(
-                    xhtml_text, force=True).rstrip('\x19o').strip()
-            else:
-                poezio_colored = str(stanza)
-            self.core.add_message_to_text_buffer(
-                self.core.xml_buffer,
-                poezio_colored,
-                nickname=get_theme().CHAR_XML_IN)
-            try:
-                if self.core.xml_tab.match_stanza(stanza):
-                    self.core.add_message_to_text_buffer(
-                        self.core.xml_tab.filtered_buffer,
-                        poezio_colored,
-                        nickname=get_theme().CHAR_XML_IN)
-            except:
-                log.debug('', exc_info=True)
-            if isinstance(self.core.tabs.current_tab, tabs.XMLTab):
-                self.core.tabs.current_tab.refresh()
-                self.core.doupdate()
+            self.capture_stanza(str(stanza), incoming=True)
+
+    def capture_stanza(self, text, incoming):
+        """
+        Only keep the raw stanza, the XMLTab highlights and filters it when
+        it is displayed
+        """
+        if not text.strip():
+            return
+        self.core.xml_tab.capture.add(text, incoming)
+        if isinstance(self.core.tabs.current_tab, tabs.XMLTab):
+            self.core.tabs.current_tab.refresh()
+            self.core.doupdate()
 
     def ssl_invalid_chain(self, tb):
         self.core.information('The certificate sent by the server is invalid.',
@@ -24,10 +24,15 @@ have become [0|1|2|3], with the tab "4" renumbered to "3" if gap tabs are
 disabled.
 """
 
-from typing import List, Dict, Type, Optional, Union
+from bisect import bisect_right
+from datetime import datetime
+from typing import List, Dict, Type, Optional, Tuple, Union
 from collections import defaultdict
 from poezio import tabs
 from poezio.events import EventHandler
+from poezio.roster import roster
+
+MatchIndex = Tuple[str, List[int], List[tabs.Tab]]
 
 
 class Tabs:
@@ -40,6 +45,9 @@ class Tabs:
         '_tabs',
         '_tab_types',
         '_tab_names',
+        '_tab_keys',
+        '_match_index',
+        '_match_index_built',
         '_previous_tab',
         '_events',
     ]
@@ -59,6 +67,14 @@ class Tabs:
         self._tab_types = defaultdict(
             list)  # type: Dict[Type[tabs.Tab], List[tabs.Tab]]
         self._tab_names = dict()  # type: Dict[str, tabs.Tab]
+        # (class, name) -> first tab of that class with that name
+        self._tab_keys = dict(
+        )  # type: Dict[Tuple[Type[tabs.Tab], str], tabs.Tab]
+        # all the lowercased matching names of the tabs, separated by
+        # newlines, with the offset at which the names of each tab start
+        # (see find_match)
+        self._match_index = None  # type: Optional[MatchIndex]
+        self._match_index_built = datetime.min
         self._events = events  # type: EventHandler
 
     def __len__(self):
@@ -119,35 +135,96 @@ class Tabs:
         """Get all the tabs of a class"""
         return self._tab_types.get(cls, [])
 
-    def find_match(self, name: str) -> Optional[tabs.Tab]:
-        """Get a tab using extended matching (tab.matching_name())"""
-
-        def transform(tab_index):
-            """Wrap the value of the range around the current index"""
-            return (tab_index + self._current_index + 1) % len(self._tabs)
+    def _get_match_index(self) -> MatchIndex:
+        """
+        Build the index of the matching names, if the tabs or the roster
+        changed since it was last built
+        """
+        if (self._match_index is None or
+            (roster is not None
+             and roster.last_modified >= self._match_index_built)):
+            names = []  # type: List[str]
+            starts = []  # type: List[int]
+            owners = []  # type: List[tabs.Tab]
+            position = 0
+            for tab in self._tabs:
+                for _, tab_name in tab.matching_names():
+                    if not tab_name:
+                        continue
+                    tab_name = tab_name.lower()
+                    names.append(tab_name)
+                    starts.append(position)
+                    owners.append(tab)
+                    position += len(tab_name) + 1
+            self._match_index = ('\n'.join(names), starts, owners)
+            self._match_index_built = datetime.now()
+        return self._match_index
 
-        for i in map(transform, range(len(self._tabs) - 1)):
-            for tab_name in self._tabs[i].matching_names():
-                if tab_name[1] and name in tab_name[1].lower():
-                    return self._tabs[i]
-        return None
+    def find_match(self, name: str) -> Optional[tabs.Tab]:
+        """
+        Get a tab using extended matching (tab.matching_name()): the first
+        tab after the current one with a name containing name
+        """
+        if not name or '\n' in name or not self._tabs:
+            return None
+        haystack, starts, owners = self._get_match_index()
+        nb_tabs = len(self._tabs)
+        best = None  # type: Optional[tabs.Tab]
+        best_distance = nb_tabs
+        index = haystack.find(name)
+        while index != -1:
+            i = bisect_right(starts, index) - 1
+            tab = owners[i]
+            # the distance to the right of the current tab, wrapping around
+            distance = (tab.nb - self._current_index - 1) % nb_tabs
+            if distance < best_distance and tab is not self._current_tab:
+                best, best_distance = tab, distance
+            if i + 1 == len(starts):
+                break
+            index = haystack.find(name, starts[i + 1])
+        return best
 
     def by_name_and_class(self, name: str,
                           cls: Type[tabs.Tab]) -> Optional[tabs.Tab]:
         """Get a tab with its name and class"""
-        cls_tabs = self._tab_types.get(cls, [])
-        for tab in cls_tabs:
-            if tab.name == name:
-                return tab
-        return None
+        return self._tab_keys.get((cls, name))
+
+    def _add_keys(self, tab: tabs.Tab):
+        for cls in _get_tab_types(tab):
+            self._tab_keys.setdefault((cls, tab.name), tab)
+
+    def _remove_keys(self, tab: tabs.Tab):
+        for cls in _get_tab_types(tab):
+            key = (cls, tab.name)
+            if self._tab_keys.get(key) is not tab:
+                continue
+            del self._tab_keys[key]
+            # another tab with the same class and name
+            for other in self._tab_types.get(cls, []):
+                if other is not tab and other.name == tab.name:
+                    self._tab_keys[key] = other
+                    break
+
+    def rename_tab(self, tab: tabs.Tab, name: str):
+        """Change the name of a tab of the list"""
+        self._remove_keys(tab)
+        if self._tab_names.get(tab.name) is tab:
+            del self._tab_names[tab.name]
+        tab.name = name
+        self._tab_names[name] = tab
+        self._add_keys(tab)
+        self._match_index = None
 
     def _rebuild(self):
         self._tab_types = defaultdict(list)
         self._tab_names = dict()
+        self._tab_keys = dict()
+        self._match_index = None
         for tab in self._tabs:
             for cls in _get_tab_types(tab):
                 self._tab_types[cls].append(tab)
             self._tab_names[tab.name] = tab
+            self._add_keys(tab)
         self._update_numbers()
 
     def replace_tabs(self, new_tabs: List[tabs.Tab]) -> bool:
@@ -207,6 +284,8 @@ class Tabs:
         for cls in _get_tab_types(tab):
             self._tab_types[cls].append(tab)
         self._tab_names[tab.name] = tab
+        self._add_keys(tab)
+        self._match_index = None
 
     def delete(self, tab: tabs.Tab, gap=False):
         """Remove a tab"""
@@ -223,6 +302,8 @@ class Tabs:
         for cls in _get_tab_types(tab):
             self._tab_types[cls].remove(tab)
         del self._tab_names[tab.name]
+        self._remove_keys(tab)
+        self._match_index = None
 
         if gap:
             self._collect_trailing_gaptabs()
@@ -7,9 +7,61 @@
 Defines the EventHandler class.
 The list of available events is here:
 http://poezio.eu/doc/en/plugins.html#_poezio_events
+
+The time spent in each handler can be measured (see
+EventHandler.enable_stats and the /eventstats command), to find which
+plugin slows down the processing of the messages.
 """
 
-from typing import Callable, Dict, List
+from collections import deque
+from time import perf_counter
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+# number of durations kept per handler to compute the percentiles
+STATS_SAMPLES = 1000
+
+# (event, plugin or module, handler)
+StatsKey = Tuple[str, str, str]
+
+
+class HandlerStats:
+    """
+    The calls of an event handler, and the time they took
+    """
+    __slots__ = ('calls', 'total', 'samples')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total = 0.0
+        # the durations of the last calls
+        self.samples = deque(maxlen=STATS_SAMPLES)  # type: Deque[float]
+
+    def record(self, duration: float) -> None:
+        self.calls += 1
+        self.total += duration
+        self.samples.append(duration)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+    def percentile(self, percent: float) -> float:
+        """The percentile of the durations of the last calls"""
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        index = max(int(len(samples) * percent / 100 + 0.5) - 1, 0)
+        return samples[min(index, len(samples) - 1)]
+
+
+def handler_key(name: str, callback: Callable) -> StatsKey:
+    """
+    The key of the stats of a handler: the plugins are loaded as modules
+    named after them, so the module of a handler tells its plugin
+    """
+    module = getattr(callback, '__module__', None) or '?'
+    handler = getattr(callback, '__qualname__', None) or repr(callback)
+    return name, module, handler
 
 
 class EventHandler:
@@ -47,6 +99,9 @@ class EventHandler:
             'ignored_private': [],
             'tab_change': [],
         }  # type: Dict[str, List[Callable]]
+        # the stats of each handler, None until they are first measured
+        self.stats = None  # type: Optional[Dict[StatsKey, HandlerStats]]
+        self.measuring = False
 
     def add_event_handler(self, name: str, callback: Callable,
                           position=0) -> bool:
@@ -71,12 +126,62 @@ class EventHandler:
         """
         Call all the callbacks associated to the given event name.
         """
-        callbacks = self.events.get(name, None)
-        if callbacks is None:
+        callbacks = self.events.get(name)
+        if not callbacks:
             return
+        if self.measuring:
+            return self._trigger_measured(name, callbacks, args, kwargs)
         for callback in callbacks:
             callback(*args, **kwargs)
 
+    def _trigger_measured(self, name: str, callbacks: List[Callable], args,
+                          kwargs):
+        stats = self.stats
+        for callback in callbacks:
+            start = perf_counter()
+            try:
+                callback(*args, **kwargs)
+            finally:
+                duration = perf_counter() - start
+                key = handler_key(name, callback)
+                handler_stats = stats.get(key)
+                if handler_stats is None:
+                    handler_stats = stats[key] = HandlerStats()
+                handler_stats.record(duration)
+
+    def enable_stats(self) -> None:
+        """Start measuring the handlers (keeping the previous stats)"""
+        if self.stats is None:
+            self.stats = {}
+        self.measuring = True
+
+    def disable_stats(self) -> None:
+        """Stop measuring the handlers (keeping their stats)"""
+        self.measuring = False
+
+    def reset_stats(self) -> None:
+        if self.stats is not None:
+            self.stats = {}
+
+    def format_stats(self) -> List[str]:
+        """
+        The stats of the handlers as lines of text, the ones which took
+        the most time first
+        """
+        if not self.stats:
+            return []
+        lines = []
+        stats = sorted(
+            self.stats.items(), key=lambda item: item[1].total, reverse=True)
+        for (event, module, handler), handler_stats in stats:
+            lines.append(
+                '%s: %s.%s — %d calls, %.1f ms total, %.3f ms mean, '
+                '%.3f ms p99' % (event, module, handler, handler_stats.calls,
+                                 handler_stats.total * 1000,
+                                 handler_stats.mean * 1000,
+                                 handler_stats.percentile(99) * 1000))
+        return lines
+
     def del_event_handler(self, name: str, callback: Callable):
         """
         Remove the callback from the list of callbacks of the given event
@@ -0,0 +1,89 @@
+"""
+The text of a message, with its formatting compiled.
+
+The text of the messages holds its formatting inline: \x19b for bold,
+\x19196} or \x1912,-1,b} for a color, \x19o to reset, etc. Instead of
+scanning it again each time it is wrapped, drawn, cleaned or searched, a
+Message compiles it once (see Message.formatted) into its plain text and
+the formatting codes, with their positions in the plain text.
+"""
+
+from bisect import bisect_left
+from typing import List, Sequence, Tuple
+
+FORMAT_CHAR = '\x19'
+COLOR_START = '0123456789-'
+# the other codes (\x19a for example) are not displayed, and dropped
+SIMPLE_CODES = {'o', 'u', 'b', 'i'}
+
+
+def compile_formatting(txt: str) -> Tuple[str, List[int], List[str]]:
+    """
+    Split a text into its plain text, the offsets in the plain text of
+    its formatting codes, and those codes: 'o', 'u', 'b', 'i', or a color
+    (what is between \x19 and }).
+    """
+    plain = []  # type: List[str]
+    offsets = []  # type: List[int]
+    codes = []  # type: List[str]
+    length = 0
+    pos = 0
+    find = txt.find
+    while True:
+        next_code = find(FORMAT_CHAR, pos)
+        if next_code == -1:
+            plain.append(txt[pos:])
+            break
+        if next_code != pos:
+            plain.append(txt[pos:next_code])
+            length += next_code - pos
+        code = txt[next_code + 1:next_code + 2]
+        end = find('}', next_code) if code and code in COLOR_START else -1
+        if end != -1:
+            offsets.append(length)
+            codes.append(txt[next_code + 1:end])
+            pos = end + 1
+        else:
+            # an unknown code, or a color without its }
+            code = code.lower()
+            if code in SIMPLE_CODES:
+                offsets.append(length)
+                codes.append(code)
+            pos = next_code + 2
+    return ''.join(plain), offsets, codes
+
+
+def apply_codes(attrs: List[str], codes: Sequence[str]) -> List[str]:
+    """
+    The formatting codes in effect after codes, when attrs were: the
+    ones since the last reset
+    """
+    for code in codes:
+        if code == 'o':
+            attrs = []
+        else:
+            attrs.append(code)
+    return attrs
+
+
+class FormattedText:
+    """
+    The plain text of a formatted text, and its formatting codes sorted
+    by offset
+    """
+    __slots__ = ('source', 'plain', 'offsets', 'codes')
+
+    def __init__(self, txt: str) -> None:
+        # the text this was compiled from
+        self.source = txt
+        self.plain, self.offsets, self.codes = compile_formatting(txt)
+
+    def codes_between(self, start: int, end: int) -> Tuple[int, int]:
+        """
+        The range of the codes at offsets in [start, end), or after start
+        if end is the end of the text
+        """
+        first = bisect_left(self.offsets, start)
+        if end >= len(self.plain):
+            return first, len(self.offsets)
+        return first, bisect_left(self.offsets, end, first)
@@ -0,0 +1,95 @@
+"""
+Coalescing of the screen updates.
+
+Instead of redrawing the screen after each stanza, the handlers mark
+what needs to be redrawn (the whole current tab, or some of its windows)
+and a frame is scheduled with the idle_call() of the event loop (see
+poezio.asyncio): it runs once the stanzas already received have been
+handled, redraws what was marked once, and updates the terminal once.
+The frames are limited to max_fps per second, the user input being the
+exception, as it is drawn right away (see FrameScheduler.flush).
+"""
+
+import asyncio
+from time import monotonic
+from typing import Callable, Dict, Optional
+
+# render(full, redraws): full is True if the whole current tab must be
+# redrawn, redraws maps the functions redrawing parts of a tab to that
+# tab (None if they are not specific to a tab), in the order they were
+# marked
+Render = Callable[[bool, Dict[Callable, Optional[object]]], None]
+
+
+class FrameScheduler:
+    """
+    Collects the redraws requested by the handlers, and runs them all in
+    one frame
+    """
+
+    def __init__(self, render: Render, max_fps: float = 0,
+                 loop=None) -> None:
+        self.render = render
+        # 0 for no limit: one frame per iteration of the loop at most
+        self.max_fps = max_fps
+        self._loop = loop
+        self._full = False
+        self._redraws = {}  # type: Dict[Callable, Optional[object]]
+        # a frame was requested since the last one
+        self._pending = False
+        # a frame is scheduled in the loop
+        self._scheduled = False
+        self._rendering = False
+        self._last_frame = 0.0
+
+    def mark_dirty(self, tab, redraw: Callable) -> None:
+        """
+        Request a frame calling redraw, if tab is still the current tab
+        by then (or whatever tab if it is None). redraw runs once per
+        frame, after the ones marked before it.
+        """
+        if not self._full:
+            self._redraws.pop(redraw, None)
+            self._redraws[redraw] = tab
+        self.request()
+
+    def mark_full(self) -> None:
+        """Request a frame redrawing the whole current tab"""
+        self._full = True
+        self._redraws.clear()
+        self.request()
+
+    def request(self) -> None:
+        """Request a frame, updating the terminal"""
+        if self._rendering:
+            return
+        self._pending = True
+        if self._scheduled:
+            return
+        self._scheduled = True
+        loop = self._loop or asyncio.get_event_loop()
+        delay = 0.0
+        if self.max_fps > 0:
+            delay = self._last_frame + 1 / self.max_fps - monotonic()
+        if delay > 0:
+            loop.call_later(delay, loop.idle_call, self._on_tick)
+        else:
+            loop.idle_call(self._on_tick)
+
+    def _on_tick(self) -> None:
+        self._scheduled = False
+        if self._pending:
+            self.flush()
+
+    def flush(self) -> None:
+        """Draw the requested frame now"""
+        full, redraws = self._full, self._redraws
+        self._full = False
+        self._redraws = {}
+        self._pending = False
+        self._last_frame = monotonic()
+        self._rendering = True
+        try:
+            self.render(full, redraws)
+        finally:
+            self._rendering = False
@@ -0,0 +1,404 @@
+"""
+The poezio-log-archive tool, to export the poezio logs (the MR/MI files
+of the log directory, one per JID) to JSON Lines or SQLite, and to
+import them back.
+
+Everything is streamed, one message at a time, through generators built
+on parse_log_line and build_log_message, so that years of logs can be
+moved in constant memory. The log files are exported in parallel (one
+process per file, at most --jobs at the same time), each one to a
+temporary JSON Lines file which is then appended to the output.
+
+Each exported message is a JSON object (or a row of the messages table)
+with the following keys:
+    jid: the JID (the name of the log file)
+    time: the UTC time of the message, as YYYY-MM-DDTHH:MM:SSZ
+    type: 'message' (MR lines) or 'info' (MI lines)
+    nick: the nick of the author of the message (null for info)
+    text: the text of the message
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from collections import OrderedDict
+from datetime import datetime, timezone
+from multiprocessing import Pool
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from poezio.common import get_utc_time, parse_str_to_date
+from poezio.logger import LogMessage, build_log_message, parse_log_line
+
+log = logging.getLogger(__name__)
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    jid TEXT NOT NULL,
+    time TEXT NOT NULL,
+    type TEXT NOT NULL,
+    nick TEXT,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_jid_time ON messages (jid, time);
+"""
+
+# rows inserted in the SQLite database at once
+BATCH_SIZE = 1000
+
+# log files written to at the same time by an import
+MAX_OPEN_FILES = 64
+
+Record = Dict[str, Any]
+DateRange = Tuple[Optional[datetime], Optional[datetime]]
+
+
+def read_log(path: Path) -> Iterator[Record]:
+    """
+    Read the messages of a log file, one at a time
+    """
+    jid = path.name
+    with path.open(encoding='utf-8', errors='replace') as fd:
+        record = None  # type: Optional[Record]
+        remaining = 0
+        for line in fd:
+            line = line.rstrip('\n')
+            if record is not None and remaining:
+                record['text'] += '\n' + line[1:]
+                remaining -= 1
+                continue
+            if record is not None:
+                yield record
+                record = None
+            if line.startswith(' '):  # should not happen ; skip
+                continue
+            log_item = parse_log_line(line)
+            if log_item is None:
+                continue
+            is_message = isinstance(log_item, LogMessage)
+            record = {
+                'jid': jid,
+                'time': log_item.time.strftime(TIME_FORMAT),
+                'type': 'message' if is_message else 'info',
+                'nick': log_item.nick if is_message else None,
+                'text': log_item.text,
+            }
+            remaining = log_item.nb_lines
+        if record is not None:
+            yield record
+
+
+def in_range(records: Iterable[Record],
+             date_range: DateRange) -> Iterator[Record]:
+    """
+    Keep only the records between the two UTC dates of date_range
+    """
+    since, until = date_range
+    since_str = since.strftime(TIME_FORMAT) if since else None
+    until_str = until.strftime(TIME_FORMAT) if until else None
+    for record in records:
+        # the times are formatted so that they sort chronologically
+        if since_str is not None and record['time'] < since_str:
+            continue
+        if until_str is not None and record['time'] >= until_str:
+            continue
+        yield record
+
+
+def write_log_message(fd: IO[str], record: Record) -> None:
+    """
+    Write a record in a log file, in the poezio format
+    """
+    utc_time = datetime.strptime(record['time'], TIME_FORMAT)
+    typ = 1 if record['type'] == 'message' else 2
+    fd.write(
+        build_log_message(
+            record.get('nick') or '',
+            record['text'],
+            date=utc_time.replace(tzinfo=timezone.utc),
+            typ=typ))
+
+
+def log_files(paths: Iterable[str]) -> Iterator[Path]:
+    """
+    List the log files of the given files and directories
+    """
+    for name in paths:
+        path = Path(name)
+        if path.is_dir():
+            for child in sorted(path.iterdir()):
+                if child.is_file() and not child.name.startswith('.'):
+                    yield child
+        else:
+            yield path
+
+
+def export_file(args: Tuple[Path, DateRange]) -> str:
+    """
+    Export a log file to a temporary JSON Lines file, and return its name
+    (run in the worker processes)
+    """
+    path, date_range = args
+    with tempfile.NamedTemporaryFile(
+            'w', encoding='utf-8', suffix='.jsonl', delete=False) as output:
+        for record in in_range(read_log(path), date_range):
+            output.write(json.dumps(record, ensure_ascii=False))
+            output.write('\n')
+    return output.name
+
+
+def exported_files(paths: Iterable[Path], date_range: DateRange,
+                   jobs: int) -> Iterator[str]:
+    """
+    Export the log files in parallel, and yield the temporary JSON Lines
+    files in the order of paths
+    """
+    tasks = ((path, date_range) for path in paths)
+    if jobs <= 1:
+        yield from map(export_file, tasks)
+        return
+    with Pool(jobs) as pool:
+        yield from pool.imap(export_file, tasks)
+
+
+def read_jsonl(fd: IO[str]) -> Iterator[Record]:
+    for line in fd:
+        if line.strip():
+            yield json.loads(line)
+
+
+def export_logs(paths: Iterable[str], output: str, output_format: str,
+                date_range: DateRange, jobs: int) -> int:
+    """
+    Export the log files to output, and return the number of files
+    """
+    nb_files = 0
+    db = None  # type: Optional[sqlite3.Connection]
+    if output_format == 'sqlite':
+        db = sqlite3.connect(output)
+        db.executescript(SCHEMA)
+        out = None  # type: Optional[IO[str]]
+    elif output == '-':
+        out = sys.stdout
+    else:
+        out = open(output, 'a', encoding='utf-8')
+    try:
+        for name in exported_files(log_files(paths), date_range, jobs):
+            nb_files += 1
+            with open(name, encoding='utf-8') as exported:
+                if db is not None:
+                    insert_records(db, read_jsonl(exported))
+                else:
+                    shutil.copyfileobj(exported, out)
+            os.unlink(name)
+    finally:
+        if db is not None:
+            db.close()
+        elif out is not sys.stdout:
+            out.close()
+    return nb_files
+
+
+def insert_records(db: sqlite3.Connection, records: Iterable[Record]) -> None:
+    """
+    Insert the records in the database, by batches
+    """
+    batch = []  # type: List[Tuple]
+    with db:
+        for record in records:
+            batch.append((record['jid'], record['time'], record['type'],
+                          record.get('nick'), record['text']))
+            if len(batch) == BATCH_SIZE:
+                db.executemany('INSERT INTO messages VALUES (?, ?, ?, ?, ?)',
+                               batch)
+                batch = []
+        db.executemany('INSERT INTO messages VALUES (?, ?, ?, ?, ?)', batch)
+
+
+def read_sqlite(database: str, jid: Optional[str] = None,
+                date_range: DateRange = (None, None)) -> Iterator[Record]:
+    """
+    Read the records of an exported database, optionally only the ones
+    of a jid, ordered by jid and time
+    """
+    db = sqlite3.connect(database)
+    try:
+        sql = 'SELECT jid, time, type, nick, text FROM messages WHERE 1'
+        args = []  # type: List[str]
+        if jid is not None:
+            sql += ' AND jid = ?'
+            args.append(jid)
+        since, until = date_range
+        if since is not None:
+            sql += ' AND time >= ?'
+            args.append(since.strftime(TIME_FORMAT))
+        if until is not None:
+            sql += ' AND time < ?'
+            args.append(until.strftime(TIME_FORMAT))
+        sql += ' ORDER BY jid, time'
+        for jid, time, typ, nick, text in db.execute(sql, args):
+            yield {
+                'jid': jid,
+                'time': time,
+                'type': typ,
+                'nick': nick,
+                'text': text
+            }
+    finally:
+        db.close()
+
+
+def log_filename(jid: str) -> str:
+    return jid.replace('/', '\\')
+
+
+def import_records(records: Iterable[Record], log_dir: Path) -> int:
+    """
+    Append the records to the log files of their jid, and return their
+    number
+    """
+    fds = OrderedDict()  # type: OrderedDict[str, IO[str]]
+    nb = 0
+    try:
+        for record in records:
+            jid = log_filename(record['jid'])
+            fd = fds.get(jid)
+            if fd is None:
+                if len(fds) == MAX_OPEN_FILES:
+                    fds.popitem(last=False)[1].close()
+                fd = fds[jid] = (log_dir / jid).open('a', encoding='utf-8')
+            else:
+                fds.move_to_end(jid)
+            write_log_message(fd, record)
+            nb += 1
+    finally:
+        for fd in fds.values():
+            fd.close()
+    return nb
+
+
+def import_jid(args: Tuple[str, str, Path, DateRange]) -> int:
+    """
+    Import the records of one jid of a database (run in the worker
+    processes)
+    """
+    database, jid, log_dir, date_range = args
+    return import_records(read_sqlite(database, jid, date_range), log_dir)
+
+
+def import_logs(source: str, input_format: str, log_dir: Path,
+                date_range: DateRange, jobs: int) -> int:
+    """
+    Import the records of source in the log files of log_dir, and return
+    their number
+    """
+    log_dir.mkdir(parents=True, exist_ok=True)
+    if input_format == 'jsonl':
+        if source == '-':
+            records = in_range(read_jsonl(sys.stdin), date_range)
+            return import_records(records, log_dir)
+        with open(source, encoding='utf-8') as fd:
+            return import_records(
+                in_range(read_jsonl(fd), date_range), log_dir)
+    db = sqlite3.connect(source)
+    try:
+        jids = [jid for jid, in db.execute(
+            'SELECT DISTINCT jid FROM messages ORDER BY jid')]
+    finally:
+        db.close()
+    tasks = [(source, jid, log_dir, date_range) for jid in jids]
+    if jobs <= 1:
+        return sum(map(import_jid, tasks))
+    with Pool(jobs) as pool:
+        return sum(pool.imap_unordered(import_jid, tasks))
+
+
+def parse_date(date: str) -> datetime:
+    """
+    Parse a local date given on the command line, to UTC
+    """
+    parsed = parse_str_to_date(date)
+    if parsed is None:
+        raise argparse.ArgumentTypeError(
+            'invalid date %r (expected YYYY-MM-DD, YYYY-MM-DDTHH:MM or '
+            'YYYY-MM-DDTHH:MM:SS)' % date)
+    return get_utc_time(parsed)
+
+
+def guess_format(name: str) -> str:
+    if name.endswith(('.db', '.sqlite', '.sqlite3')):
+        return 'sqlite'
+    return 'jsonl'
+
+
+def run(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        'poezio-log-archive',
+        description='Export the poezio logs to JSON Lines or SQLite, '
+        'and import them back.')
+    parser.add_argument(
+        '--since',
+        type=parse_date,
+        help='only the messages from that local date (YYYY-MM-DD, '
+        'YYYY-MM-DDTHH:MM or YYYY-MM-DDTHH:MM:SS)')
+    parser.add_argument(
+        '--until',
+        type=parse_date,
+        help='only the messages before that local date')
+    parser.add_argument(
+        '-f',
+        '--format',
+        choices=('jsonl', 'sqlite'),
+        help='format of the export (guessed from the file name by default)')
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=os.cpu_count() or 1,
+        help='number of files processed in parallel (default: the number '
+        'of CPUs)')
+    subparsers = parser.add_subparsers(dest='action')
+    subparsers.required = True
+    export_parser = subparsers.add_parser(
+        'export', help='export log files (or log directories)')
+    export_parser.add_argument('logs', nargs='+', help='log files or dirs')
+    export_parser.add_argument(
+        '-o',
+        '--output',
+        default='-',
+        help='the JSON Lines file (appended to) or SQLite database to '
+        'write to (default: stdout)')
+    import_parser = subparsers.add_parser(
+        'import',
+        help='append exported messages to the log files of a directory')
+    import_parser.add_argument(
+        'input', help='the JSON Lines file (or - for stdin) or SQLite '
+        'database to read from')
+    import_parser.add_argument(
+        '-d', '--log-dir', required=True, help='the log directory')
+    args = parser.parse_args(argv)
+
+    date_range = (args.since, args.until)
+    if args.action == 'export':
+        output_format = args.format or guess_format(args.output)
+        if output_format == 'sqlite' and args.output == '-':
+            parser.error('an output file is needed for SQLite')
+        nb = export_logs(args.logs, args.output, output_format, date_range,
+                         args.jobs)
+        print('%d log files exported' % nb, file=sys.stderr)
+    else:
+        input_format = args.format or guess_format(args.input)
+        nb = import_logs(args.input, input_format, Path(args.log_dir),
+                         date_range, args.jobs)
+        print('%d messages imported' % nb, file=sys.stderr)
+
+
+if __name__ == '__main__':
+    run()
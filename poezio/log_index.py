@@ -0,0 +1,184 @@
+"""
+Sidecar indexes for the conversation logs.
+
+For each log file, an index file (in the .index directory of the log
+directory) holds one fixed-size record per logged message: its time, its
+byte offset in the log file, and a hash of its id. Finding the messages
+around a date is then a binary search, and finding a message id is a
+search over these small records, instead of parsing the whole log file.
+
+The index is only ever appended to, and catches up with the log file
+(for example if messages were logged while log_index was disabled) by
+parsing what was written after its last record.
+"""
+
+import hashlib
+import logging
+import mmap
+import re
+import struct
+from calendar import timegm
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# time (UTC timestamp), offset in the log file, hash of the message id.
+# The times are kept non-decreasing (a delayed message gets the time of the
+# previous record), so that they can be searched with a bisection.
+RECORD = struct.Struct('<qqQ')
+HASH_POSITION = 16
+
+HEADER_RE = re.compile(rb'^M[RI] (\d{4})(\d{2})(\d{2})T'
+                       rb'(\d{2}):(\d{2}):(\d{2})Z ', re.MULTILINE)
+
+
+def hash_id(identifier: Optional[str]) -> int:
+    """
+    Hash a message id into 64 bits (0 means no id)
+    """
+    if not identifier:
+        return 0
+    digest = hashlib.sha1(identifier.encode()).digest()[:8]
+    return int.from_bytes(digest, 'little') or 1
+
+
+def to_timestamp(utc_time: datetime) -> int:
+    """
+    Convert a naive UTC datetime (as written in the logs) to a timestamp
+    """
+    return timegm(utc_time.timetuple())
+
+
+class LogIndex:
+    """
+    The index of one log file
+    """
+
+    def __init__(self, log_path: Path, index_path: Path) -> None:
+        self.log_path = log_path
+        self.index_path = index_path
+        self._fd = None  # type: Optional[IO[Any]]
+        # time and offset of the last record, read lazily
+        self._last = None  # type: Optional[Tuple[int, int]]
+
+    def close(self) -> None:
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+    def _open(self) -> IO[Any]:
+        if self._fd is None:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            self._fd = self.index_path.open('ab')
+        return self._fd
+
+    def _last_record(self) -> Tuple[int, int]:
+        """
+        Return the time and offset of the last record, or (0, -1) if the
+        index is empty
+        """
+        if self._last is None:
+            self._last = (0, -1)
+            try:
+                with self.index_path.open('rb') as fd:
+                    size = fd.seek(0, 2)
+                    size -= size % RECORD.size
+                    if size:
+                        fd.seek(size - RECORD.size)
+                        time, offset, _ = RECORD.unpack(
+                            fd.read(RECORD.size))
+                        self._last = (time, offset)
+            except FileNotFoundError:
+                pass
+        return self._last
+
+    def add(self, offset: int, utc_time: datetime,
+            identifier: Optional[str] = None) -> None:
+        """
+        Add the record of a message written at offset in the log file
+        """
+        last_time, last_offset = self._last_record()
+        if offset <= last_offset:
+            return
+        time = max(to_timestamp(utc_time), last_time)
+        self._open().write(RECORD.pack(time, offset, hash_id(identifier)))
+        self._last = (time, offset)
+
+    def flush(self) -> None:
+        if self._fd is not None:
+            self._fd.flush()
+
+    def update(self) -> None:
+        """
+        Add the records of the messages written in the log file after the
+        last record (or of the whole file, if the index is new)
+        """
+        _, last_offset = self._last_record()
+        try:
+            with self.log_path.open('rb') as fd:
+                if fd.seek(0, 2) <= last_offset + 1:
+                    return
+                with mmap.mmap(fd.fileno(), 0, prot=mmap.PROT_READ) as m:
+                    for match in HEADER_RE.finditer(m, last_offset + 1):
+                        self.add(match.start(),
+                                 datetime(*map(int, match.groups())))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            log.error(
+                'Unable to index the log file %s',
+                self.log_path,
+                exc_info=True)
+        self.flush()
+
+    def _map(self) -> Optional[mmap.mmap]:
+        self.flush()
+        try:
+            with self.index_path.open('rb') as fd:
+                if fd.seek(0, 2) < RECORD.size:
+                    return None
+                return mmap.mmap(fd.fileno(), 0, prot=mmap.PROT_READ)
+        except FileNotFoundError:
+            return None
+
+    def find_date(self, utc_time: datetime) -> Optional[int]:
+        """
+        Return the offset of the first message logged at or after
+        utc_time, or None if there is none
+        """
+        index = self._map()
+        if index is None:
+            return None
+        with index:
+            time = to_timestamp(utc_time)
+            low, high = 0, len(index) // RECORD.size
+            while low < high:
+                middle = (low + high) // 2
+                if RECORD.unpack_from(index, middle * RECORD.size)[0] < time:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == len(index) // RECORD.size:
+                return None
+            return RECORD.unpack_from(index, low * RECORD.size)[1]
+
+    def find_id(self, identifier: str) -> Optional[int]:
+        """
+        Return the offset of the last message logged with that id,
+        or None if there is none
+        """
+        index = self._map()
+        if index is None:
+            return None
+        with index:
+            packed = struct.pack('<Q', hash_id(identifier))
+            end = len(index)
+            while True:
+                pos = index.rfind(packed, 0, end)
+                if pos == -1:
+                    return None
+                if pos % RECORD.size == HASH_POSITION:
+                    return RECORD.unpack_from(index, pos - HASH_POSITION)[1]
+                end = pos + len(packed) - 1
@@ -0,0 +1,252 @@
+"""
+Full-text index of the conversation logs, used by /search.
+
+The index is a SQLite FTS5 database (log_dir/.index/search.db) holding the
+text, nick, time and byte offset of each message of the log files. For
+each log file, the offset up to which it has been indexed is kept, so
+that the index is only ever brought up to date by parsing what was
+written after it: the files written to by the Logger are marked as
+dirty, and all the others are read once by the background backfill.
+
+The work is split in small steps (see LogSearch.step), so that it can be
+done when poezio is idle without freezing the interface.
+"""
+
+import logging
+import mmap
+import re
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from poezio.log_index import to_timestamp
+
+log = logging.getLogger(__name__)
+
+# Only the messages (MR) are indexed, not the status changes (MI).
+# The nick is separated from the text by a space and a no-break space.
+MESSAGE_RE = re.compile(rb'^MR (\d{4})(\d{2})(\d{2})T'
+                        rb'(\d{2}):(\d{2}):(\d{2})Z '
+                        rb'\d+ <([^\n]*?)> \xc2\xa0', re.MULTILINE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    jid TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    text,
+    nick UNINDEXED,
+    jid UNINDEXED,
+    time UNINDEXED,
+    offset UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# bytes of logs parsed by each step of the indexing
+STEP_SIZE = 1 << 18
+
+
+class LogSearchError(Exception):
+    pass
+
+
+SearchResult = NamedTuple('SearchResult', [('jid', str), ('time', datetime),
+                                           ('nick', str), ('text', str),
+                                           ('offset', int)])
+
+
+def build_query(terms: str) -> str:
+    """
+    Turn the terms typed by the user into a FTS5 query matching the
+    messages containing all of them (a term ending with a * matches
+    all the words starting with it)
+    """
+    query = []
+    for term in terms.split():
+        prefix = term.endswith('*')
+        term = term.rstrip('*')
+        if not term:
+            continue
+        term = '"%s"' % term.replace('"', '""')
+        query.append(term + '*' if prefix else term)
+    return ' '.join(query)
+
+
+class LogSearch:
+    """
+    The full-text index of the log files of a directory
+    """
+
+    def __init__(self, log_dir: Path, db_path: Path) -> None:
+        self.log_dir = log_dir
+        self.db_path = db_path
+        self._db = None  # type: Optional[sqlite3.Connection]
+        # jid -> indexed size of its log file
+        self._offsets = {}  # type: Dict[str, int]
+        # log files written since they were last indexed
+        self._dirty = set()  # type: Set[str]
+        # log files left to backfill
+        self._backfill = []  # type: List[str]
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                db = sqlite3.connect(str(self.db_path))
+                db.executescript(SCHEMA)
+            except sqlite3.Error as exn:
+                raise LogSearchError(
+                    'Unable to open the search index: %s' % exn)
+            self._offsets = dict(db.execute('SELECT jid, offset FROM files'))
+            self._db = db
+        return self._db
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    @property
+    def pending(self) -> bool:
+        """
+        Whether some logs are not indexed yet
+        """
+        return bool(self._dirty or self._backfill)
+
+    def notify(self, jid: str) -> None:
+        """
+        Mark a log file as written to
+        """
+        self._dirty.add(jid)
+
+    def backfill(self) -> None:
+        """
+        Queue all the log files of the directory for indexing
+        """
+        try:
+            names = [
+                path.name for path in self.log_dir.iterdir()
+                if '@' in path.name and path.is_file()
+            ]
+        except OSError:
+            log.error('Unable to list the log dir', exc_info=True)
+            return
+        self._backfill = sorted(names, reverse=True)
+
+    def _index_file(self, jid: str, budget: int) -> bool:
+        """
+        Index up to budget bytes of messages of a log file, starting at
+        the offset it was last indexed to, and return whether there is
+        more to index in it
+        """
+        db = self._connect()
+        offset = self._offsets.get(jid, 0)
+        try:
+            with (self.log_dir / jid).open('rb') as fd:
+                size = fd.seek(0, 2)
+                if size < offset:
+                    # the file was truncated or replaced: start over
+                    log.debug('Log file %s shrunk, reindexing it', jid)
+                    offset = 0
+                    self._write(db, jid, [], offset)
+                if size == offset:
+                    return False
+                with mmap.mmap(fd.fileno(), 0, prot=mmap.PROT_READ) as m:
+                    end = size
+                    if offset + budget < size:
+                        # stop at the start of a message
+                        end = m.find(b'\nM', offset + budget) + 1 or size
+                    rows = []
+                    for match in MESSAGE_RE.finditer(m, offset, end):
+                        stop = m.find(b'\nM', match.end(), end)
+                        if stop == -1:
+                            stop = end
+                        text = m[match.end():stop].rstrip(b'\n').replace(
+                            b'\n ', b'\n').decode(errors='replace')
+                        groups = match.groups()
+                        time = to_timestamp(datetime(*map(int, groups[:6])))
+                        nick = groups[6].decode(errors='replace')
+                        rows.append((text, nick, jid, time, match.start()))
+        except FileNotFoundError:
+            self._offsets.pop(jid, None)
+            return False
+        except (OSError, ValueError):
+            log.error('Unable to index the log file %s', jid, exc_info=True)
+            return False
+        self._write(db, jid, rows, end)
+        return end < size
+
+    def _write(self, db: sqlite3.Connection, jid: str, rows: List[Tuple],
+               offset: int) -> None:
+        """
+        Add the messages of a log file to the index, and record the offset
+        it is now indexed to (a zero offset removes its previous messages)
+        """
+        try:
+            with db:
+                if not offset:
+                    db.execute('DELETE FROM messages WHERE jid = ?', (jid, ))
+                db.executemany(
+                    'INSERT INTO messages (text, nick, jid, time, offset) '
+                    'VALUES (?, ?, ?, ?, ?)', rows)
+                db.execute('INSERT OR REPLACE INTO files VALUES (?, ?)',
+                           (jid, offset))
+        except sqlite3.Error as exn:
+            raise LogSearchError('Unable to index the logs: %s' % exn)
+        self._offsets[jid] = offset
+
+    def step(self, budget: int = STEP_SIZE) -> bool:
+        """
+        Index a part of the logs (the recently written files first), and
+        return whether there is more to index
+        """
+        if self._dirty:
+            jid = self._dirty.pop()
+            if self._index_file(jid, budget):
+                self._dirty.add(jid)
+        elif self._backfill:
+            jid = self._backfill[-1]
+            if not self._index_file(jid, budget):
+                self._backfill.pop()
+        return self.pending
+
+    def update(self) -> None:
+        """
+        Index everything that was written to the logs since they were
+        last indexed (but do not wait for the backfill)
+        """
+        while self._dirty:
+            jid = self._dirty.pop()
+            while self._index_file(jid, STEP_SIZE):
+                pass
+
+    def search(self, terms: str, jid: Optional[str] = None,
+               limit: int = 500) -> List[SearchResult]:
+        """
+        Return the last messages (most recent first) containing all the
+        terms, optionally only in the logs of one jid
+        """
+        query = build_query(terms)
+        if not query:
+            return []
+        self.update()
+        db = self._connect()
+        sql = 'SELECT jid, time, nick, text, offset FROM messages ' \
+              'WHERE messages MATCH ?'
+        args = [query]  # type: List
+        if jid is not None:
+            sql += ' AND jid = ?'
+            args.append(jid)
+        sql += ' ORDER BY time DESC LIMIT ?'
+        args.append(limit)
+        try:
+            rows = db.execute(sql, args).fetchall()
+        except sqlite3.Error as exn:
+            raise LogSearchError('Invalid search: %s' % exn)
+        return [
+            SearchResult(jid, datetime.utcfromtimestamp(time), nick, text,
+                         offset) for jid, time, nick, text, offset in rows
+        ]
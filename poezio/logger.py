@@ -9,16 +9,26 @@ The logger module that handles logging of the poezio
 conversations and roster changes
 """
 
+import asyncio
+import io
 import mmap
 import re
-from typing import List, Dict, Optional, IO, Any
-from datetime import datetime
+from collections import OrderedDict
+from typing import List, Dict, Optional, IO, Any, Tuple
+from datetime import datetime, timedelta
 
 from poezio import common
 from poezio.config import config
+from poezio.log_index import LogIndex
+from poezio.log_search import LogSearch, SearchResult
 from poezio.xhtml import clean_text
 from poezio.theming import dump_tuple, get_theme
 
+try:
+    from poezio.poopt import parse_logs
+except ImportError:  # poopt built from an older version
+    parse_logs = None
+
 import logging
 
 log = logging.getLogger(__name__)
@@ -75,8 +85,22 @@ class Logger:
 
     def __init__(self):
         self._roster_logfile = None  # Optional[IO[Any]]
-        # a dict of 'groupchatname': file-object (opened)
-        self._fds = {}  # type: Dict[str, IO[Any]]
+        # a dict of 'groupchatname': file-object (opened), the least
+        # recently used first; at most max_open_log_files are kept open
+        self._fds = OrderedDict()  # type: OrderedDict[str, IO[Any]]
+        # number of messages logged to a file that was already opened, or
+        # that had to be (re)opened, to size max_open_log_files
+        self.fd_hits = 0
+        self.fd_misses = 0
+        # with log_index, the size of the opened log files, and their index
+        self._sizes = {}  # type: Dict[str, int]
+        self._indexes = {}  # type: Dict[str, LogIndex]
+        # with log_search, the full-text index of the logs
+        self._search = None  # type: Optional[LogSearch]
+        # with log_flush_interval, the number of characters written and not
+        # flushed yet in each log file (None being the roster log)
+        self._pending = {}  # type: Dict[Optional[str], int]
+        self._flush_handle = None  # type: Optional[asyncio.TimerHandle]
 
     def __del__(self):
         for opened_file in self._fds.values():
@@ -85,22 +109,44 @@ class Logger:
                     opened_file.close()
                 except:  # Can't close? too bad
                     pass
+        for index in self._indexes.values():
+            try:
+                index.close()
+            except:
+                pass
+        if self._search is not None:
+            try:
+                self._search.close()
+            except:
+                pass
 
     def close(self, jid) -> None:
         jid = str(jid).replace('/', '\\')
+        if jid in self._pending:
+            self.flush_all()
         if jid in self._fds:
             self._fds[jid].close()
             log.debug('Log file for %s closed.', jid)
             del self._fds[jid]
+        self._sizes.pop(jid, None)
+        if jid in self._indexes:
+            self._indexes.pop(jid).close()
         return None
 
     def reload_all(self) -> None:
         """Close and reload all the file handles (on SIGHUP)"""
+        self.flush_all()
         for opened_file in self._fds.values():
             if opened_file:
                 opened_file.close()
+        for index in self._indexes.values():
+            index.close()
+        self._indexes = {}
+        self._sizes = {}
+        if self._search is not None:
+            self._search.close()
         log.debug('All log file handles closed')
-        for room in self._fds:
+        for room in list(self._fds):
             self._check_and_create_log_dir(room)
             log.debug('Log handle for %s re-created', room)
         return None
@@ -123,15 +169,46 @@ class Logger:
         if not open_fd:
             return None
         filename = log_dir / room
+        if config.get('log_flush_interval') > 0:
+            # large enough to hold what is written between two flushes
+            buffering = max(io.DEFAULT_BUFFER_SIZE,
+                            config.get('log_buffer_size'))
+        else:
+            buffering = -1
         try:
-            fd = filename.open('a', encoding='utf-8')
+            fd = filename.open('a', encoding='utf-8', buffering=buffering)
             self._fds[room] = fd
+            self._sizes.pop(room, None)
+            self._close_unused_fds()
             return fd
         except IOError:
             log.error(
                 'Unable to open the log file (%s)', filename, exc_info=True)
         return None
 
+    def _close_unused_fds(self) -> None:
+        """
+        Close the least recently used log files (and their index) above
+        max_open_log_files, they will be reopened when needed
+        """
+        limit = max(1, config.get('max_open_log_files'))
+        while len(self._fds) > limit:
+            jid, fd = self._fds.popitem(last=False)
+            pending = self._pending.pop(jid, None)
+            try:
+                fd.close()
+            except OSError:
+                log.error(
+                    'Unable to close the log file (%s)',
+                    log_dir / jid,
+                    exc_info=True)
+            if jid in self._indexes:
+                self._indexes[jid].close()
+            if pending is not None and config.get('log_search'):
+                self.get_search().notify(jid)
+            log.debug('Log file for %s closed (%s hits, %s misses).', jid,
+                      self.fd_hits, self.fd_misses)
+
     def get_logs(self, jid: str,
                  nb: int = 10) -> Optional[List[Dict[str, Any]]]:
         """
@@ -150,6 +227,8 @@ class Logger:
             return None
 
         self._check_and_create_log_dir(jid, open_fd=False)
+        if jid in self._pending:
+            self.flush_all()
 
         filename = log_dir / jid
         try:
@@ -169,21 +248,133 @@ class Logger:
         # do that efficiently, instead of seek()s and read()s which are costly.
         with fd:
             try:
-                lines = get_lines_from_fd(fd, nb=nb)
+                data = get_data_from_fd(fd, nb=nb)
             except Exception:  # file probably empty
                 log.error(
                     'Unable to mmap the log file for (%s)',
                     filename,
                     exc_info=True)
                 return None
-        return parse_log_lines(lines)
+        return parse_log_data(data)
+
+    def _get_index(self, jid: str) -> LogIndex:
+        """
+        Get the index of a log file, up to date with what was written in it
+        """
+        index = self._indexes.get(jid)
+        if index is None:
+            index = LogIndex(log_dir / jid, log_dir / '.index' / jid)
+            index.update()
+            self._indexes[jid] = index
+        return index
+
+    def get_logs_at(self,
+                    jid: str,
+                    nb: int = 10,
+                    date: Optional[datetime] = None,
+                    identifier: Optional[str] = None
+                    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get nb messages from the log history for the given jid, starting
+        from the first message logged at or after date (a local time),
+        or from the message with the given id.
+        The index of the log file is used to seek directly to it (and
+        is built first if it does not exist).
+        """
+        if not config.get_by_tabname('use_log', jid) or nb <= 0:
+            return None
+        if jid in self._pending:
+            self.flush_all()
+        index = self._get_index(jid)
+        index.update()
+        if identifier is not None:
+            offset = index.find_id(identifier)
+        elif date is not None:
+            offset = index.find_date(common.get_utc_time(date))
+        else:
+            offset = None
+        if offset is None:
+            return []
+        filename = log_dir / jid
+        try:
+            with filename.open('rb') as fd:
+                data = get_data_from_offset(fd, offset, nb=nb)
+        except (OSError, ValueError):
+            log.error(
+                'Unable to read the log file (%s)', filename, exc_info=True)
+            return None
+        return parse_log_data(data)
+
+    def get_logs_around(self, jid: str, offset: int, nb: int = 5
+                        ) -> Optional[Tuple[List[Dict[str, Any]], int]]:
+        """
+        Get the message logged at offset in the log file of the given jid,
+        with the nb messages before and after it, and the position of that
+        message in the returned list.
+        """
+        if jid in self._pending:
+            self.flush_all()
+        filename = log_dir / jid
+        try:
+            with filename.open('rb') as fd:
+                data, position = get_data_around_offset(
+                    fd, offset, before=nb, after=nb)
+        except (OSError, ValueError):
+            log.error(
+                'Unable to read the log file (%s)', filename, exc_info=True)
+            return None
+        return parse_log_data(data), position
+
+    def get_search(self) -> LogSearch:
+        """
+        Get the full-text index of the logs, queuing all the existing log
+        files for indexing the first time
+        """
+        if self._search is None:
+            self._search = LogSearch(log_dir, log_dir / '.index' / 'search.db')
+            self._search.backfill()
+        return self._search
+
+    def update_search(self) -> bool:
+        """
+        Index a part of the logs for /search, and return whether there is
+        more to index
+        """
+        return self.get_search().step()
+
+    def search(self, terms: str,
+               jid: Optional[str] = None) -> List[SearchResult]:
+        """
+        Search the messages containing all the terms in the logs (raises a
+        LogSearchError if the index is not usable)
+        """
+        self.flush_all()
+        return self.get_search().search(terms, jid=jid)
+
+    def _index_message(self, jid: str, fd: IO[Any], logged_msg: str,
+                       date: Optional[datetime],
+                       identifier: Optional[str]) -> None:
+        """
+        Add a message that is about to be written in fd to the index
+        """
+        size = self._sizes.get(jid)
+        if size is None:
+            fd.flush()
+            index = self._get_index(jid)
+            size = (log_dir / jid).stat().st_size
+        else:
+            index = self._get_index(jid)
+        utc_time = common.get_utc_time(date) if date else common.get_utc_time()
+        index.add(size, utc_time, identifier)
+        self._sizes[jid] = size + len(logged_msg.encode('utf-8'))
 
     def log_message(self,
                     jid: str,
                     nick: str,
                     msg: str,
                     date: Optional[datetime] = None,
-                    typ: int = 1) -> bool:
+                    typ: int = 1,
+                    identifier: Optional[str] = None) -> bool:
         """
         log the message in the appropriate jid's file
         type:
@@ -196,15 +387,20 @@ class Logger:
         logged_msg = build_log_message(nick, msg, date=date, typ=typ)
         if not logged_msg:
             return True
-        if jid in self._fds.keys():
+        if jid in self._fds:
+            self.fd_hits += 1
             fd = self._fds[jid]
+            self._fds.move_to_end(jid)
         else:
+            self.fd_misses += 1
             option_fd = self._check_and_create_log_dir(jid)
             if option_fd is None:
                 return True
             fd = option_fd
         filename = log_dir / jid
         try:
+            if config.get('log_index'):
+                self._index_message(jid, fd, logged_msg, date, identifier)
             fd.write(logged_msg)
         except OSError:
             log.error(
@@ -212,17 +408,66 @@ class Logger:
                 filename,
                 exc_info=True)
             return False
+        return self._written(jid, len(logged_msg))
+
+    def _written(self, jid: Optional[str], size: int) -> bool:
+        """
+        Called when size characters were written in the log file of jid
+        (or in the roster log if jid is None): flush it, or if
+        log_flush_interval is set, let the writes pile up until they get
+        too big or the interval has elapsed.
+        """
+        interval = config.get('log_flush_interval')
+        if interval > 0:
+            pending = self._pending.get(jid, 0) + size
+            if pending < config.get('log_buffer_size'):
+                self._pending[jid] = pending
+                if self._flush_handle is None:
+                    self._flush_handle = asyncio.get_event_loop().call_later(
+                        interval, self.flush_all)
+                return True
+        self._pending.pop(jid, None)
+        return self._flush(jid)
+
+    def _flush(self, jid: Optional[str]) -> bool:
+        """
+        Flush the log file of jid (or the roster log if jid is None),
+        and its index
+        """
+        if jid is None:
+            fd = self._roster_logfile
+            filename = log_dir / 'roster.log'
         else:
-            try:
-                fd.flush()  # TODO do something better here?
-            except OSError:
-                log.error(
-                    'Unable to flush the log file (%s)',
-                    filename,
-                    exc_info=True)
-                return False
+            fd = self._fds.get(jid)
+            filename = log_dir / jid
+        if fd is None:
+            return True
+        try:
+            fd.flush()
+            if jid in self._indexes:
+                self._indexes[jid].flush()
+        except OSError:
+            log.error(
+                'Unable to flush the log file (%s)', filename, exc_info=True)
+            return False
+        if jid is not None and config.get('log_search'):
+            self.get_search().notify(jid)
         return True
 
+    def flush_all(self) -> bool:
+        """
+        Flush all the writes waiting in the log files (on a timer, and
+        before the log files are read, reloaded, or poezio exits)
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        success = True
+        pending, self._pending = self._pending, {}
+        for jid in pending:
+            success = self._flush(jid) and success
+        return success
+
     def log_roster_change(self, jid: str, message: str) -> bool:
         """
         Log a roster change
@@ -246,18 +491,17 @@ class Logger:
             lines = message.split('\n')
             first_line = lines.pop(0)
             nb_lines = str(len(lines)).zfill(3)
-            self._roster_logfile.write(
-                'MI %s %s %s %s\n' % (str_time, nb_lines, jid, first_line))
-            for line in lines:
-                self._roster_logfile.write(' %s\n' % line)
-            self._roster_logfile.flush()
+            logged_msg = 'MI %s %s %s %s\n' % (str_time, nb_lines, jid,
+                                               first_line)
+            logged_msg += ''.join(' %s\n' % line for line in lines)
+            self._roster_logfile.write(logged_msg)
         except:
             log.error(
                 'Unable to write in the log file (%s)',
                 filename,
                 exc_info=True)
             return False
-        return True
+        return self._written(None, len(logged_msg))
 
 
 def build_log_message(nick: str,
@@ -290,9 +534,9 @@ def build_log_message(nick: str,
     return logged_msg + ''.join(' %s\n' % line for line in lines)
 
 
-def get_lines_from_fd(fd: IO[Any], nb: int = 10) -> List[str]:
+def get_data_from_fd(fd: IO[Any], nb: int = 10) -> bytes:
     """
-    Get the last log lines from a fileno
+    Get the raw log data of the last nb messages from a fileno
     """
     with mmap.mmap(fd.fileno(), 0, prot=mmap.PROT_READ) as m:
         pos = m.rfind(b"\nM")  # start of messages begin with MI or MR,
@@ -305,8 +549,73 @@ def get_lines_from_fd(fd: IO[Any], nb: int = 10) -> List[str]:
         if pos == -1:  # If we don't have enough lines in the file
             pos = 1  # 1, because we do -1 just on the next line
             # to get 0 (start of the file)
-        lines = m[pos - 1:].decode(errors='replace').splitlines()
-    return lines
+        data = m[pos - 1:]
+    return data
+
+
+def get_data_from_offset(fd: IO[Any], offset: int, nb: int = 10) -> bytes:
+    """
+    Get the raw log data of the nb messages starting at offset from a fileno
+    """
+    with mmap.mmap(fd.fileno(), 0, prot=mmap.PROT_READ) as m:
+        pos = offset
+        count = 0
+        while pos != -1 and count < nb:
+            count += 1
+            pos = m.find(b"\nM", pos + 1)
+        if pos == -1:  # If we don't have enough lines in the file
+            pos = len(m)
+        data = m[offset:pos]
+    return data
+
+
+def get_data_around_offset(fd: IO[Any], offset: int, before: int = 5,
+                           after: int = 5) -> Tuple[bytes, int]:
+    """
+    Get the raw log data of the message starting at offset from a fileno,
+    and of the messages around it, with the number of messages before it
+    """
+    with mmap.mmap(fd.fileno(), 0, prot=mmap.PROT_READ) as m:
+        start = offset
+        count = 0
+        while start > 0 and count < before:
+            count += 1
+            start = m.rfind(b"\nM", 0, start) + 1
+        end = offset
+        for _ in range(after + 1):
+            end = m.find(b"\nM", end + 1)
+            if end == -1:
+                end = len(m)
+                break
+        data = m[start:end]
+    return data, count
+
+
+def parse_log_data(data: bytes) -> List[Dict[str, Any]]:
+    """
+    Parse raw log data into poezio log objects, in one pass with
+    poopt.parse_logs, or with parse_log_lines if it is not available
+    """
+    if parse_logs is None:
+        return parse_log_lines(data.decode(errors='replace').splitlines())
+    messages = []
+    color = '\x19%s}' % dump_tuple(get_theme().COLOR_LOG_MSG)
+    # the local time is computed once per hour of logs
+    offsets = {}  # type: Dict[Tuple[int, int, int, int], timedelta]
+    for year, month, day, hour, minute, second, nick, text in parse_logs(
+            data):
+        time = datetime(year, month, day, hour, minute, second)
+        key = (year, month, day, hour)
+        offset = offsets.get(key)
+        if offset is None:
+            utc_hour = datetime(year, month, day, hour)
+            offset = offsets[key] = common.get_local_time(utc_hour) - utc_hour
+        message = {'history': True, 'time': time + offset}
+        if nick is not None:
+            message['nickname'] = nick
+        message['txt'] = color + text
+        messages.append(message)
+    return messages
 
 
 def parse_log_lines(lines: List[str]) -> List[Dict[str, Any]]:
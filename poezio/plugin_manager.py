@@ -105,6 +105,7 @@ class PluginManager:
             try:
                 for command in self.commands[name].keys():
                     del self.core.commands[command]
+                    self.core.completion.commands.discard(command)
                 for key in self.keys[name].keys():
                     del self.core.key_func[key]
                 for tab in list(self.tab_commands[name].keys()):
@@ -150,6 +151,7 @@ class PluginManager:
         commands = self.commands[module_name]
         commands[name] = Command(handler, help, completion, short, usage)
         self.core.commands[name] = commands[name]
+        self.core.completion.commands.add(name)
 
     def del_command(self, module_name, name):
         """
@@ -159,6 +161,7 @@ class PluginManager:
             del self.commands[module_name][name]
             if name in self.core.commands:
                 del self.core.commands[name]
+                self.core.completion.commands.discard(name)
 
     def add_tab_command(self,
                         module_name,
@@ -314,6 +314,183 @@ static PyObject* poopt_cut_by_columns(PyObject* self, PyObject* args)
   return Py_BuildValue("s#", start, ptr - start);
 }
 
+/**
+   Read n decimal digits, return -1 if one of them is not a digit.
+*/
+static long read_digits(const char* str, size_t n)
+{
+  long res = 0;
+  for (size_t i = 0; i < n; i++)
+    {
+      if (str[i] < '0' || str[i] > '9')
+        return -1;
+      res = res * 10 + (str[i] - '0');
+    }
+  return res;
+}
+
+/**
+   parse_logs: takes the raw content of a log file (as bytes, or any object
+   supporting the buffer protocol, like a mmap), and returns a list of
+   tuples, one for each message:
+   (year, month, day, hour, minute, second, nick, text)
+   nick being None for the MI lines, and text including the following lines
+   of the message, without their leading space.
+
+   It is the equivalent of parse_log_line() called on each line of the
+   file, done in one pass.  The lines that can not be parsed are ignored.
+*/
+PyDoc_STRVAR(poopt_parse_logs_doc, "parse_logs(data)\n\n\nReturn a list of (year, month, day, hour, minute, second, nick, text) tuples, one for each message of the log data.");
+static PyObject* poopt_parse_logs(PyObject* self, PyObject* args)
+{
+  Py_buffer view;
+  if (PyArg_ParseTuple(args, "y*", &view) == 0)
+    return NULL;
+
+  const char* ptr = view.buf;
+  const char* const end = ptr + view.len;
+  PyObject* retlist = PyList_New(0);
+  /* Where the lines of a multi-line message are joined */
+  char* text_buf = NULL;
+  size_t text_buf_size = 0;
+
+  if (retlist == NULL)
+    goto error;
+
+  while (ptr < end)
+    {
+      const char* eol = memchr(ptr, '\n', end - ptr);
+      if (eol == NULL)
+        eol = end;
+      const char* const line = ptr;
+      ptr = eol + 1;
+
+      /* "MR 20170909T09:09:09Z 000 " */
+      const size_t line_len = eol - line;
+      if (line_len < 24 || line[0] != 'M' || (line[1] != 'R' && line[1] != 'I')
+          || line[2] != ' ' || line[11] != 'T' || line[14] != ':'
+          || line[17] != ':' || line[20] != 'Z' || line[21] != ' ')
+        continue;
+      const long year = read_digits(line + 3, 4);
+      const long month = read_digits(line + 7, 2);
+      const long day = read_digits(line + 9, 2);
+      const long hour = read_digits(line + 12, 2);
+      const long minute = read_digits(line + 15, 2);
+      const long second = read_digits(line + 18, 2);
+      if (year < 0 || month < 0 || day < 0 || hour < 0 || minute < 0 || second < 0)
+        continue;
+      const char* pos = line + 22;
+      long nb_lines = 0;
+      if (pos == eol || *pos < '0' || *pos > '9')
+        continue;
+      while (pos < eol && *pos >= '0' && *pos <= '9')
+        nb_lines = nb_lines * 10 + (*pos++ - '0');
+      if (pos == eol || *pos != ' ')
+        continue;
+      pos++;
+
+      const char* nick = NULL;
+      size_t nick_len = 0;
+      if (line[1] == 'R')
+        {
+          /* "<nick> " followed by the first no-break space of the line
+             (the nick can not contain one) */
+          const char* nbsp = pos;
+          while (nbsp + 1 < eol && (nbsp[0] != '\xc2' || nbsp[1] != '\xa0'))
+            nbsp++;
+          if (*pos != '<' || nbsp + 1 >= eol || nbsp - pos < 4
+              || nbsp[-2] != '>' || nbsp[-1] != ' ')
+            continue;
+          nick = pos + 1;
+          nick_len = nbsp - 2 - nick;
+          pos = nbsp + 2;
+        }
+
+      /* The text, and the nb_lines following lines */
+      const char* text = pos;
+      size_t text_len = eol - pos;
+      if (nb_lines > 0 && ptr < end)
+        {
+          size_t used = 0;
+          if (text_buf_size < text_len + 1)
+            {
+              PyMem_Free(text_buf);
+              text_buf_size = (text_len + 1) * 2;
+              text_buf = PyMem_Malloc(text_buf_size);
+              if (text_buf == NULL)
+                {
+                  PyErr_NoMemory();
+                  goto error;
+                }
+            }
+          memcpy(text_buf, text, text_len);
+          used = text_len;
+          while (nb_lines > 0 && ptr < end)
+            {
+              const char* next_eol = memchr(ptr, '\n', end - ptr);
+              if (next_eol == NULL)
+                next_eol = end;
+              /* The line, without its first character */
+              const char* const next = ptr == next_eol ? ptr : ptr + 1;
+              const size_t next_len = next_eol - next;
+              if (text_buf_size < used + 1 + next_len)
+                {
+                  text_buf_size = (used + 1 + next_len) * 2;
+                  char* const new_buf = PyMem_Realloc(text_buf, text_buf_size);
+                  if (new_buf == NULL)
+                    {
+                      PyErr_NoMemory();
+                      goto error;
+                    }
+                  text_buf = new_buf;
+                }
+              text_buf[used++] = '\n';
+              memcpy(text_buf + used, next, next_len);
+              used += next_len;
+              ptr = next_eol + 1;
+              nb_lines--;
+            }
+          text = text_buf;
+          text_len = used;
+        }
+
+      PyObject* py_nick;
+      if (nick != NULL)
+        py_nick = PyUnicode_DecodeUTF8(nick, nick_len, "replace");
+      else
+        {
+          py_nick = Py_None;
+          Py_INCREF(py_nick);
+        }
+      PyObject* py_text = PyUnicode_DecodeUTF8(text, text_len, "replace");
+      if (py_nick == NULL || py_text == NULL)
+        {
+          Py_XDECREF(py_nick);
+          Py_XDECREF(py_text);
+          goto error;
+        }
+      PyObject* tmp = Py_BuildValue("(llllllNN)", year, month, day, hour,
+                                    minute, second, py_nick, py_text);
+      if (tmp == NULL)
+        goto error;
+      if (PyList_Append(retlist, tmp) != 0)
+        {
+          Py_DECREF(tmp);
+          goto error;
+        }
+      Py_DECREF(tmp);
+    }
+  PyMem_Free(text_buf);
+  PyBuffer_Release(&view);
+  return retlist;
+
+ error:
+  PyMem_Free(text_buf);
+  PyBuffer_Release(&view);
+  Py_XDECREF(retlist);
+  return NULL;
+}
+
 /***
     Module initialization. Just taken from the xxmodule.c template from the
     python sources.
@@ -419,6 +596,7 @@ static PyMethodDef poopt_methods[] = {
   {"cut_text", poopt_cut_text, METH_VARARGS, poopt_cut_text_doc},
   {"wcswidth", poopt_wcswidth, METH_VARARGS, poopt_wcswidth_doc},
   {"cut_by_columns", poopt_cut_by_columns, METH_VARARGS, poopt_cut_by_columns_doc},
+  {"parse_logs", poopt_parse_logs, METH_VARARGS, poopt_parse_logs_doc},
   {}           /* sentinel */
 };
 
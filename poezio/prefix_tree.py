@@ -0,0 +1,89 @@
+"""
+A case-insensitive prefix tree of words, used by the completions of the
+commands (see poezio.core.completions) to find the candidates starting
+with what was typed without filtering and sorting all of them each time.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Set
+
+# key of the words ending at a node, in its dict (the other keys are
+# single characters)
+WORDS = ''
+
+
+class PrefixTree:
+    """
+    A set of words, that can be listed by (case-insensitive) prefix, in
+    case-insensitive alphabetical order
+    """
+
+    def __init__(self, words: Iterable[str] = ()) -> None:
+        self._root = {}  # type: Dict
+        self._words = set()  # type: Set[str]
+        for word in words:
+            self.add(word)
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._words
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._words)
+
+    def add(self, word: str) -> None:
+        if word in self._words:
+            return
+        self._words.add(word)
+        node = self._root
+        for char in word.lower():
+            node = node.setdefault(char, {})
+        node.setdefault(WORDS, set()).add(word)
+
+    def discard(self, word: str) -> None:
+        if word not in self._words:
+            return
+        self._words.discard(word)
+        chars = word.lower()
+        path = [self._root]
+        for char in chars:
+            path.append(path[-1][char])
+        path[-1][WORDS].discard(word)
+        # remove the nodes left without words
+        for i in range(len(chars), 0, -1):
+            node = path[i]
+            if node.get(WORDS):
+                break
+            node.pop(WORDS, None)
+            if node:
+                break
+            del path[i - 1][chars[i - 1]]
+
+    def clear(self) -> None:
+        self._root = {}
+        self._words = set()
+
+    def sync(self, words: Iterable[str]) -> None:
+        """Make the tree contain exactly these words"""
+        words = set(words)
+        for word in self._words - words:
+            self.discard(word)
+        for word in words - self._words:
+            self.add(word)
+
+    def complete(self, prefix: str) -> List[str]:
+        """The words starting with prefix, case-insensitively"""
+        node = self._root
+        for char in prefix.lower():
+            node = node.get(char)
+            if node is None:
+                return []
+        result = []  # type: List[str]
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            result.extend(sorted(node.get(WORDS, ())))
+            stack.extend(node[char] for char in sorted(node, reverse=True)
+                         if char != WORDS)
+        return result
@@ -139,6 +139,14 @@ class Roster:
         self.groups[name] = RosterGroup(
             name, folded=name in self.folded_groups)
 
+    @property
+    def nb_items(self) -> int:
+        """
+        The number of items of the slixmpp roster, which gets one for each
+        JID a presence is received from
+        """
+        return len(self.__node) if self.__node is not None else 0
+
     def add(self, jid):
         """Subscribe to a jid"""
         self.__node.subscribe(jid)
@@ -14,7 +14,6 @@ revolving around chats.
 """
 
 import logging
-import string
 import time
 from datetime import datetime
 from xml.etree import cElementTree as ET
@@ -26,7 +25,7 @@ from poezio.core.structs import Command, Completion, Status
 from poezio import timed_events
 from poezio import windows
 from poezio import xhtml
-from poezio.common import safeJID
+from poezio.common import parse_str_to_date, safeJID
 from poezio.config import config
 from poezio.decorators import refresh_wrapper
 from poezio.logger import logger
@@ -491,6 +490,14 @@ class ChatTab(Tab):
             shortdesc='Send custom XHTML.')
         self.register_command(
             'clear', self.command_clear, shortdesc='Clear the current buffer.')
+        self.register_command(
+            'jump_date',
+            self.command_jump_date,
+            usage='<date> [number]',
+            desc='Display number (10 by default) messages from the logs, '
+            'starting at date (YYYY-MM-DD, YYYY-MM-DDTHH:MM or '
+            'YYYY-MM-DDTHH:MM:SS).',
+            shortdesc='Display the logs from a date.')
         self.register_command(
             'correct',
             self.command_correct,
@@ -513,6 +520,11 @@ class ChatTab(Tab):
     def general_jid(self) -> JID:
         return NotImplementedError
 
+    @property
+    def log_name(self) -> str:
+        """The name of the log file of the messages of this tab"""
+        return safeJID(self.name).bare
+
     def load_logs(self, log_nb: int) -> Optional[List[Dict[str, Any]]]:
         logs = logger.get_logs(safeJID(self.name).bare, log_nb)
         return logs
@@ -521,12 +533,14 @@ class ChatTab(Tab):
                     txt: str,
                     nickname: str,
                     time: Optional[datetime] = None,
-                    typ=1):
+                    typ=1,
+                    identifier: Optional[str] = None):
         """
         Log the messages in the archives.
         """
-        name = safeJID(self.name).bare
-        if not logger.log_message(name, nickname, txt, date=time, typ=typ):
+        if not logger.log_message(
+                self.log_name, nickname, txt, date=time, typ=typ,
+                identifier=identifier):
             self.core.information('Unable to write in the log file', 'Error')
 
     def add_message(self,
@@ -540,7 +554,8 @@ class ChatTab(Tab):
                     history=None,
                     typ=1,
                     highlight=False):
-        self.log_message(txt, nickname, time=time, typ=typ)
+        self.log_message(
+            txt, nickname, time=time, typ=typ, identifier=identifier)
         self._text_buffer.add_message(
             txt,
             time=time,
@@ -559,7 +574,7 @@ class ChatTab(Tab):
                        user=None,
                        jid=None,
                        nickname=None):
-        self.log_message(txt, nickname, typ=1)
+        self.log_message(txt, nickname, typ=1, identifier=new_id)
         message = self._text_buffer.modify_message(
             txt, old_id, new_id, time=time, user=user, jid=jid)
         if message:
@@ -572,18 +587,13 @@ class ChatTab(Tab):
         """
         Complete the input with words recently said
         """
-        # build the list of the recent words
-        char_we_dont_want = string.punctuation + ' ’„“”…«»'
-        words = []
-        for msg in self._text_buffer.messages[:-40:-1]:
-            if not msg:
-                continue
-            txt = xhtml.clean_text(msg.txt)
-            for char in char_we_dont_want:
-                txt = txt.replace(char, ' ')
-            for word in txt.split():
-                if len(word) >= 4 and word not in words:
-                    words.append(word)
+        if self.input.last_completion:
+            # the input only cycles through the words it already found
+            words = []
+        else:
+            text = self.input.text[:self.input.pos]
+            prefix = text[text.rfind(' ') + 1:]
+            words = self._text_buffer.words.complete(prefix)
         words.extend([word for word in config.get('words').split(':') if word])
         self.input.auto_completion(words, ' ', quotify=False)
 
@@ -634,6 +644,43 @@ class ChatTab(Tab):
         self._text_buffer.messages = []
         self.text_win.rebuild_everything(self._text_buffer)
 
+    @command_args_parser.quoted(1, 1, ['10'])
+    def command_jump_date(self, args):
+        """
+        /jump_date <date> [number]
+        """
+        if args is None:
+            return self.core.command.help('jump_date')
+        date = parse_str_to_date(args[0])
+        if date is None or not args[1].isdigit():
+            return self.core.command.help('jump_date')
+        logs = logger.get_logs_at(self.log_name, int(args[1]), date=date)
+        if logs is None:
+            return self.core.information('Unable to read the logs', 'Error')
+        if not logs:
+            return self.core.information(
+                'No message logged after %s' % args[0], 'Info')
+        # the logs go before the messages already displayed, so only the
+        # ones older than them are shown
+        messages = self._text_buffer.messages
+        if messages:
+            logs = [
+                message for message in logs
+                if message['time'] < messages[0].time
+            ]
+            if not logs:
+                return self.core.information(
+                    'The messages logged after %s are already displayed' %
+                    args[0], 'Info')
+        nb = self._text_buffer.prepend_messages(logs)
+        if not nb:
+            return self.core.information(
+                'No room left in the buffer for the logs, /clear it first',
+                'Info')
+        # show the first one
+        self.text_win.scroll_up(len(self.text_win.built_lines))
+        self.core.refresh_window()
+
     def check_send_chat_state(self):
         "If we should send a chat state"
         return True
@@ -736,7 +783,7 @@ class ChatTab(Tab):
         self.input.refresh()
 
     def get_conversation_messages(self):
-        return self._text_buffer.messages
+        return list(self._text_buffer.messages)
 
     def check_scrolled(self):
         if self.text_win.pos != 0:
@@ -90,6 +90,8 @@ class BookmarksTab(Tab):
         for bm in self.removed_bookmarks:
             if bm in self.bookmarks:
                 self.bookmarks.remove(bm)
+        # the bookmarks were edited in place
+        self.bookmarks.changed()
 
         def send_cb(success):
             if success:
@@ -0,0 +1,95 @@
+"""
+A tab listing the messages of the logs matching a /search, most recent
+first.  The user can display the messages around one of them, and go
+back to the results.
+"""
+
+import logging
+from typing import Dict, Callable, List
+
+from poezio import common
+from poezio.core.structs import Command
+from poezio.log_search import SearchResult
+from poezio.logger import logger
+from poezio.tabs import ListTab
+from poezio.xhtml import clean_text
+
+log = logging.getLogger(__name__)
+
+# number of messages displayed before and after a result
+CONTEXT_SIZE = 10
+
+
+class LogSearchTab(ListTab):
+    plugin_commands = {}  # type: Dict[str, Command]
+    plugin_keys = {}  # type: Dict[str, Callable]
+
+    def __init__(self, core, terms: str, results: List[SearchResult]):
+        ListTab.__init__(self, core, 'Search: %s' % terms,
+                         "“Enter”: show the context of the message.",
+                         '', (('date', 0), ('room', 1), ('nick', 2),
+                              ('message', 3)))
+        self.terms = terms
+        self.key_func['^M'] = self.toggle_context
+        self.results = [self.result_line(result) for result in results]
+        # the index of the result whose context is displayed, if any
+        self.context_of = None
+        self.show_results()
+
+    @staticmethod
+    def result_line(result: SearchResult):
+        time = common.get_local_time(result.time)
+        return (time.strftime('%Y-%m-%d %H:%M:%S'), result.jid, result.nick,
+                result.text.replace('\n', ' '), result.offset)
+
+    def get_columns_sizes(self):
+        return {
+            'date': 20,
+            'room': int((self.width - 20) * 2 / 8),
+            'nick': int((self.width - 20) / 8),
+            'message': self.width - 20 - int((self.width - 20) * 2 / 8) -
+            int((self.width - 20) / 8)
+        }
+
+    def show_results(self):
+        self.listview.empty()
+        self.listview.set_lines(self.results)
+        if self.context_of is not None:
+            self.listview.select_row(self.context_of)
+        self.context_of = None
+        self.info_header.message = '%s results for “%s”' % (len(
+            self.results), self.terms)
+        if logger.get_search().pending:
+            self.info_header.message += ' (indexing the logs…)'
+
+    def show_context(self):
+        row = self.listview.get_selected_row()
+        if not row:
+            return
+        index = self.listview.lines.index(row)
+        jid, offset = row[1], row[4]
+        context = logger.get_logs_around(jid, offset, nb=CONTEXT_SIZE)
+        if not context:
+            self.core.information('Unable to read the logs of %s' % jid,
+                                  'Error')
+            return
+        messages, position = context
+        lines = []
+        for message in messages:
+            lines.append((message['time'].strftime('%Y-%m-%d %H:%M:%S'), jid,
+                          message.get('nickname', ''),
+                          clean_text(message['txt']).replace('\n', ' ')))
+        self.context_of = index
+        self.listview.empty()
+        self.listview.set_lines(lines)
+        self.listview.select_row(position)
+        self.info_header.message = 'Context in %s (“Enter”: back to the ' \
+            'results)' % jid
+
+    def toggle_context(self):
+        if self.context_of is None:
+            self.show_context()
+        else:
+            self.show_results()
+        self.refresh()
+        self.core.doupdate()
@@ -7,14 +7,15 @@ It keeps track of many things such as part/joins, maintains an
 user list, and updates private tabs when necessary.
 """
 
-import bisect
 import curses
 import logging
 import os
 import random
 import re
 from datetime import datetime
-from typing import Dict, Callable, List, Optional, Union, Set
+from time import monotonic
+from typing import (Dict, Callable, List, Optional, Pattern, Union, Set,
+                    Tuple)
 
 from slixmpp import JID
 from poezio.tabs import ChatTab, Tab, SHOW_NAME
@@ -32,7 +33,7 @@ from poezio.decorators import refresh_wrapper, command_args_parser
 from poezio.logger import logger
 from poezio.roster import roster
 from poezio.theming import get_theme, dump_tuple
-from poezio.user import User
+from poezio.user import User, UserTable
 from poezio.core.structs import Completion, Status
 
 log = logging.getLogger(__name__)
@@ -42,6 +43,25 @@ STATUS_XPATH = '{%s}x/{%s}status' % (NS_MUC_USER, NS_MUC_USER)
 
 COMPARE_USERS_LAST_TALKED = lambda x: x.last_talked
 
+# joins and parts in a row, in a batch of presences, from which they are
+# summarised (see MucTab.process_presence_batch)
+PRESENCE_SUMMARY_THRESHOLD = 5
+# nicks listed in such a line
+PRESENCE_SUMMARY_NICKS = 20
+
+
+def build_highlight_regex(nick: str, words: str) -> Optional[Pattern]:
+    """
+    Compile our nick (as a whole word) and the highlight_on words
+    (separated by colons, matched anywhere) into a single case-insensitive
+    regex, or None if there is nothing to match
+    """
+    alternatives = [r'\b%s\b' % re.escape(nick)] if nick else []
+    alternatives.extend(re.escape(word) for word in words.split(':') if word)
+    if not alternatives:
+        return None
+    return re.compile('|'.join(alternatives), re.IGNORECASE)
+
 
 class MucTab(ChatTab):
     """
@@ -56,6 +76,9 @@ class MucTab(ChatTab):
         ChatTab.__init__(self, core, jid)
         self.joined = False
         self._state = 'disconnected'
+        # compiled from our nick and highlight_on, see highlight_regex
+        self._highlight_regex = None  # type: Optional[Pattern]
+        self._highlight_regex_built = False
         # our nick in the MUC
         self.own_nick = nick
         # self User object
@@ -64,14 +87,22 @@ class MucTab(ChatTab):
         self.password = password
         # buffered presences
         self.presence_buffer = []
+        # presences received since joining, waiting for the next batch
+        self.presence_batch = []
+        self.presence_batch_event = None
+        # while a batch is handled, (joined, line, nick) of the users who
+        # joined or left since the last other line written
+        self._batch_run = None  # type: Optional[List[Tuple[bool, str, str]]]
         # userlist
-        self.users = []  # type: List[User]
+        self.users = UserTable()
         # private conversations
         self.privates = []  # type: List[Tab]
         self.topic = ''
         self.topic_from = ''
         # Self ping event, so we can cancel it when we leave the room
         self.self_ping_event = None
+        # monotonic() of the last message, which postpones the self-ping
+        self.last_message_time = 0.0
         # UI stuff
         self.topic_win = windows.Topic()
         self.text_win = windows.TextWin()
@@ -94,6 +125,32 @@ class MucTab(ChatTab):
     def general_jid(self):
         return self.name
 
+    @property
+    def own_nick(self) -> str:
+        return self._own_nick
+
+    @own_nick.setter
+    def own_nick(self, value: str) -> None:
+        self._own_nick = value
+        self.reset_highlight_regex()
+
+    @property
+    def highlight_regex(self) -> Optional[Pattern]:
+        """
+        The regex matching the messages highlighting us, compiled once
+        until our nick or the highlight_on option changes
+        """
+        if not self._highlight_regex_built:
+            self._highlight_regex = build_highlight_regex(
+                self.own_nick,
+                config.get_by_tabname('highlight_on', self.general_jid))
+            self._highlight_regex_built = True
+        return self._highlight_regex
+
+    def reset_highlight_regex(self) -> None:
+        self._highlight_regex = None
+        self._highlight_regex_built = False
+
     def check_send_chat_state(self) -> bool:
         "If we should send a chat state"
         return self.joined
@@ -204,7 +261,7 @@ class MucTab(ChatTab):
             return self.core.information(
                 'The affiliation must be one of ' +
                 ', '.join(valid_affiliations), 'Error')
-        if nick_or_jid in [user.nick for user in self.users]:
+        if self.users.get(nick_or_jid) is not None:
             muc.set_user_affiliation(
                 self.core.xmpp,
                 self.name,
@@ -432,16 +489,131 @@ class MucTab(ChatTab):
                 self.presence_buffer.append(presence)
                 return
         else:
+            delay = config.get('presence_batch_delay')
+            if delay > 0:
+                self.presence_batch.append(presence)
+                if self.presence_batch_event is None:
+                    self.presence_batch_event = timed_events.DelayedEvent(
+                        delay, self.process_presence_batch)
+                    self.core.add_timed_event(self.presence_batch_event)
+                return
             try:
                 self.handle_presence_joined(presence, status_codes)
             except PresenceError:
                 self.core.room_error(presence, presence['from'].bare)
+        self.refresh_after_presence()
+
+    def refresh_after_presence(self):
         if self.core.tabs.current_tab is self:
-            self.text_win.refresh()
-            self.user_win.refresh_if_changed(self.users)
-            self.info_header.refresh(self, self.text_win, user=self.own_user)
-            self.input.refresh()
-            self.core.doupdate()
+            self.core.frames.mark_dirty(self, self.redraw_after_presence)
+
+    def redraw_after_presence(self):
+        self.text_win.refresh()
+        self.user_win.refresh_if_changed(self.users)
+        self.info_header.refresh(self, self.text_win, user=self.own_user)
+        self.input.refresh()
+
+    def refresh_after_message(self):
+        """Redraw the windows showing a new message"""
+        self.text_win.refresh()
+        self.info_header.refresh(self, self.text_win, user=self.own_user)
+        self.input.refresh()
+
+    def process_presence_batch(self):
+        """
+        Handle all the presences received since the last batch, and
+        redraw once. When many users joined or left the room in a row
+        (without other lines between them), one line sums them up instead
+        of one line for each of them.
+        """
+        if self.presence_batch_event is not None:
+            self.core.remove_timed_event(self.presence_batch_event)
+            self.presence_batch_event = None
+        batch, self.presence_batch = self.presence_batch, []
+        if not batch:
+            return
+        self._batch_run = []
+        try:
+            for presence in batch:
+                if not self.joined:
+                    # we left the room during the batch
+                    self.handle_presence(presence)
+                    continue
+                status_codes = set()
+                for status_code in presence.xml.findall(STATUS_XPATH):
+                    status_codes.add(status_code.attrib['code'])
+                try:
+                    self.handle_presence_joined(presence, status_codes)
+                except PresenceError:
+                    self.core.room_error(presence, presence['from'].bare)
+        finally:
+            self.flush_presence_run()
+            self._batch_run = None
+        self.refresh_after_presence()
+
+    def add_presence_line(self, joined: bool, line: str, nick: str):
+        """
+        Add the line of a user who joined or left, or keep it for the
+        summary if a batch is being handled
+        """
+        if self._batch_run is not None:
+            self._batch_run.append((joined, line, nick))
+        else:
+            self.add_message(line, typ=2)
+
+    def flush_presence_run(self):
+        """
+        Write the joins and parts kept during a batch, summed up if there
+        are enough of them, before any other line. The logs always get
+        each line of the run, in order.
+        """
+        run = self._batch_run
+        if not run:
+            return
+        self._batch_run = []
+        if len(run) < PRESENCE_SUMMARY_THRESHOLD:
+            for _, line, _ in run:
+                self.add_message(line, typ=2)
+            return
+        for _, line, _ in run:
+            self.log_message(line, None, typ=2)
+        self.add_presence_summary(
+            [(line, nick) for joined, line, nick in run if joined],
+            [(line, nick) for joined, line, nick in run if not joined])
+
+    def add_presence_summary(self, joins: List[Tuple[str, str]],
+                             leaves: List[Tuple[str, str]]):
+        """
+        Add one line for the users who joined and one for those who left
+        during a batch (if it is only one, with the usual line). The joins
+        are shown first, even if some of the users left before others
+        joined. These lines are not logged.
+        """
+        theme = get_theme()
+        info_col = dump_tuple(theme.COLOR_INFORMATION_TEXT)
+        for nicks, spec, spec_col, action in (
+                (joins, theme.CHAR_JOIN, theme.COLOR_JOIN_CHAR, 'joined'),
+                (leaves, theme.CHAR_QUIT, theme.COLOR_QUIT_CHAR, 'left')):
+            if not nicks:
+                continue
+            if len(nicks) == 1:
+                self.add_message(nicks[0][0], typ=0)
+                continue
+            listed = ('\x19%s}, ' % info_col).join(
+                nick for _, nick in nicks[:PRESENCE_SUMMARY_NICKS])
+            msg = ('\x19%(color_spec)s}%(spec)s \x19%(info_col)s}%(nb)d users '
+                   '%(action)s the room: %(nicks)s') % {
+                       'color_spec': dump_tuple(spec_col),
+                       'spec': spec,
+                       'info_col': info_col,
+                       'nb': len(nicks),
+                       'action': action,
+                       'nicks': listed,
+                   }
+            if len(nicks) > PRESENCE_SUMMARY_NICKS:
+                msg += '\x19%s} and %d others' % (
+                    info_col, len(nicks) - PRESENCE_SUMMARY_NICKS)
+            self.add_message(msg, typ=0)
 
     def process_presence_buffer(self, last_presence):
         """
@@ -456,7 +628,6 @@ class MucTab(ChatTab):
             except PresenceError:
                 self.core.room_error(stanza, stanza['from'].bare)
         self.handle_presence_unjoined(last_presence, deterministic, own=True)
-        self.users.sort()
         # Enable the self ping event, to regularly check if we
         # are still in the room.
         self.enable_self_ping_event()
@@ -476,7 +647,7 @@ class MucTab(ChatTab):
         user_color = self.search_for_color(from_nick)
         new_user = User(from_nick, affiliation, show, status, role, jid,
                         deterministic, user_color)
-        self.users.append(new_user)
+        self.users.add(new_user)
         self.core.events.trigger('muc_join', presence, self)
         if own:
             status_codes = set()
@@ -620,7 +791,7 @@ class MucTab(ChatTab):
                                               self.name)
         user = User(from_nick, affiliation, show, status, role, jid,
                     deterministic, color)
-        bisect.insort_left(self.users, user)
+        self.users.add(user)
         hide_exit_join = config.get_by_tabname('hide_exit_join',
                                                self.general_jid)
         if hide_exit_join != 0:
@@ -653,13 +824,15 @@ class MucTab(ChatTab):
                            'jid_color': dump_tuple(get_theme().COLOR_MUC_JID),
                            'color_spec': spec_col,
                        }
-            self.add_message(msg, typ=2)
+            self.add_presence_line(True, msg,
+                                   '\x19%s}%s' % (color, from_nick))
         self.core.on_user_rejoined_private_conversation(self.name, from_nick)
 
     def on_user_nick_change(self, presence, user, from_nick, from_room):
         new_nick = presence.xml.find(
             '{%s}x/{%s}item' % (NS_MUC_USER, NS_MUC_USER)).attrib['nick']
         old_color = user.color
+        self.users.remove(user)
         if user.nick == self.own_nick:
             self.own_nick = new_nick
             # also change our nick in all private discussions of this room
@@ -672,8 +845,7 @@ class MucTab(ChatTab):
             color = config.get_by_tabname(new_nick, 'muc_colors') or None
             if color or deterministic:
                 user.change_color(color, deterministic)
-        self.users.remove(user)
-        bisect.insort_left(self.users, user)
+        self.users.add(user)
 
         if config.get_by_tabname('display_user_color_in_join_part',
                                  self.general_jid):
@@ -914,7 +1086,8 @@ class MucTab(ChatTab):
                              }
             if status:
                 leave_msg += ' (\x19o%s\x19%s})' % (status, info_col)
-            self.add_message(leave_msg, typ=2)
+            self.add_presence_line(False, leave_msg,
+                                   '\x19%s}%s' % (color, from_nick))
         self.core.on_user_left_private_conversation(from_room, user, status)
 
     def on_user_change_status(self, user, from_nick, from_room, affiliation,
@@ -978,7 +1151,7 @@ class MucTab(ChatTab):
         self.users.remove(user)
         # finally, effectively change the user status
         user.update(affiliation, show, status, role)
-        bisect.insort_left(self.users, user)
+        self.users.add(user)
 
     def disconnect(self):
         """
@@ -986,7 +1159,11 @@ class MucTab(ChatTab):
         we can know if we can join it, send messages to it, etc
         """
         self.presence_buffer = []
-        self.users = []
+        self.presence_batch = []
+        if self.presence_batch_event is not None:
+            self.core.remove_timed_event(self.presence_batch_event)
+            self.presence_batch_event = None
+        self.users = UserTable()
         if self is not self.core.tabs.current_tab:
             self.state = 'disconnected'
         self.joined = False
@@ -998,13 +1175,15 @@ class MucTab(ChatTab):
         """
         return self.topic.replace('\n', '|')
 
-    def log_message(self, txt, nickname, time=None, typ=1):
+    def log_message(self, txt, nickname, time=None, typ=1, identifier=None):
         """
         Log the messages in the archives, if it needs
         to be
         """
         if time is None and self.joined:  # don't log the history messages
-            if not logger.log_message(self.name, nickname, txt, typ=typ):
+            if not logger.log_message(
+                    self.log_name, nickname, txt, typ=typ,
+                    identifier=identifier):
                 self.core.information('Unable to write in the log file',
                                       'Error')
 
@@ -1012,10 +1191,7 @@ class MucTab(ChatTab):
         """
         Gets the user associated with the given nick, or None if not found
         """
-        for user in self.users:
-            if user.nick == nick:
-                return user
-        return None
+        return self.users.get(nick)
 
     def add_message(self, txt, time=None, nickname=None, **kwargs):
         """
@@ -1024,12 +1200,19 @@ class MucTab(ChatTab):
         in the room anymore
         Return True if the message highlighted us. False otherwise.
         """
+        # the joins and parts kept by a batch go before this line
+        if self._batch_run:
+            self.flush_presence_run()
 
-        # reset self-ping interval
-        if self.self_ping_event:
-            self.enable_self_ping_event()
+        # postpone the self-ping (see on_self_ping_event)
+        self.last_message_time = monotonic()
 
-        self.log_message(txt, nickname, time=time, typ=kwargs.get('typ', 1))
+        self.log_message(
+            txt,
+            nickname,
+            time=time,
+            typ=kwargs.get('typ', 1),
+            identifier=kwargs.get('identifier'))
         args = dict()
         for key, value in kwargs.items():
             if key not in ('typ', 'forced_user'):
@@ -1074,7 +1257,7 @@ class MucTab(ChatTab):
                        nickname=None,
                        user=None,
                        jid=None):
-        self.log_message(txt, nickname, time=time, typ=1)
+        self.log_message(txt, nickname, time=time, typ=1, identifier=new_id)
         highlight = self.do_highlight(txt, time, nickname, corrected=True)
         message = self._text_buffer.modify_message(
             txt,
@@ -1092,19 +1275,38 @@ class MucTab(ChatTab):
     def matching_names(self):
         return [(1, safeJID(self.name).user), (3, self.name)]
 
-    def enable_self_ping_event(self):
+    def self_ping_interval(self) -> int:
         delay = config.get_by_tabname(
             "self_ping_delay", self.general_jid, default=0)
-        interval = int(
+        return int(
             config.get_by_tabname(
                 "self_ping_interval", self.general_jid, default=delay))
+
+    def enable_self_ping_event(self, delay=None):
+        interval = self.self_ping_interval()
         if interval <= 0:  # use 0 or some negative value to disable it
             return
         self.disable_self_ping_event()
         self.self_ping_event = timed_events.DelayedEvent(
-            interval, self.send_self_ping)
+            interval if delay is None else delay, self.on_self_ping_event)
         self.core.add_timed_event(self.self_ping_event)
 
+    def on_self_ping_event(self):
+        """
+        Send the self-ping, unless a message was received in the last
+        interval: the messages do not reschedule the event, they are
+        only checked here
+        """
+        self.self_ping_event = None
+        interval = self.self_ping_interval()
+        if interval <= 0:
+            return
+        quiet = monotonic() - self.last_message_time
+        if quiet < interval:
+            self.enable_self_ping_event(interval - quiet)
+        else:
+            self.send_self_ping()
+
     def disable_self_ping_event(self):
         if self.self_ping_event is not None:
             self.core.remove_timed_event(self.self_ping_event)
@@ -1259,20 +1461,11 @@ class MucTab(ChatTab):
         if (not time or corrected
             ) and nickname and nickname != self.own_nick and self.joined:
 
-            if re.search(r'\b' + self.own_nick.lower() + r'\b', txt.lower()):
+            regex = self.highlight_regex
+            if regex is not None and regex.search(txt):
                 if self.state != 'current':
                     self.state = 'highlight'
                 highlighted = True
-            else:
-                highlight_words = config.get_by_tabname(
-                    'highlight_on', self.general_jid)
-                highlight_words = highlight_words.split(':')
-                for word in highlight_words:
-                    if word and word.lower() in txt.lower():
-                        if self.state != 'current':
-                            self.state = 'highlight'
-                        highlighted = True
-                        break
         if highlighted:
             beep_on = config.get('beep_on').split()
             if 'highlight' in beep_on and 'message' not in beep_on:
@@ -1359,7 +1552,7 @@ class MucTab(ChatTab):
         if args is None:
             return self.core.command.help('version')
         nick = args[0]
-        if nick in [user.nick for user in self.users]:
+        if self.users.get(nick) is not None:
             jid = safeJID(self.name).bare
             jid = safeJID(jid + '/' + nick)
         else:
@@ -96,17 +96,22 @@ class PrivateTab(OneToOneTab):
     def remove_information_element(plugin_name):
         del PrivateTab.additional_information[plugin_name]
 
+    @property
+    def log_name(self) -> str:
+        return self.name
+
     def load_logs(self, log_nb):
         logs = logger.get_logs(
             safeJID(self.name).full.replace('/', '\\'), log_nb)
         return logs
 
-    def log_message(self, txt, nickname, time=None, typ=1):
+    def log_message(self, txt, nickname, time=None, typ=1, identifier=None):
         """
         Log the messages in the archives.
         """
         if not logger.log_message(
-                self.name, nickname, txt, date=time, typ=typ):
+                self.log_name, nickname, txt, date=time, typ=typ,
+                identifier=identifier):
             self.core.information('Unable to write in the log file', 'Error')
 
     def on_close(self):
@@ -336,7 +341,7 @@ class PrivateTab(OneToOneTab):
             },
             typ=2)
         new_jid = safeJID(self.name).bare + '/' + user.nick
-        self.name = new_jid
+        self.core.tabs.rename_tab(self, new_jid)
         return self.core.tabs.current_tab is self
 
     @refresh_wrapper.conditional
@@ -19,10 +19,35 @@ from poezio.tabs import Tab
 
 from poezio import text_buffer
 from poezio import windows
-from poezio.xhtml import clean_text
+from poezio.config import config
+from poezio.theming import get_theme
+from poezio.xhtml import xhtml_to_poezio_colors
+from poezio.xml_capture import StanzaCapture
 from poezio.decorators import command_args_parser, refresh_wrapper
 from poezio.common import safeJID
 
+try:
+    from pygments import highlight
+    from pygments.lexers import get_lexer_by_name
+    from pygments.formatters import HtmlFormatter
+    LEXER = get_lexer_by_name('xml')
+    FORMATTER = HtmlFormatter(noclasses=True)
+    PYGMENTS = True
+except ImportError:
+    PYGMENTS = False
+
+
+def colorize_stanza(text):
+    """
+    Highlight the XML of a stanza with the poezio colors, if pygments is
+    available
+    """
+    if not PYGMENTS:
+        return text
+    xhtml_text = highlight(text, LEXER, FORMATTER)
+    return xhtml_to_poezio_colors(
+        xhtml_text, force=True).rstrip('\x19o').strip()
+
 
 class MatchJID:
     def __init__(self, jid, dest=''):
@@ -30,8 +55,11 @@ class MatchJID:
         self.dest = dest
 
     def match(self, xml):
-        from_ = safeJID(xml['from'])
-        to_ = safeJID(xml['to'])
+        return self.match_jids(xml['from'], xml['to'])
+
+    def match_jids(self, from_, to_):
+        from_ = safeJID(from_)
+        to_ = safeJID(to_)
         if self.jid.full == self.jid.bare:
             from_ = from_.bare
             to_ = to_.bare
@@ -61,6 +89,12 @@ class XMLTab(Tab):
         self.name = 'XMLTab'
         self.filters = []
 
+        # the raw stanzas, added to the buffers when the tab is refreshed
+        self.capture = StanzaCapture(
+            config.get('xml_capture_size'),
+            config.get('xml_capture_spill_file'))
+        # sequence number of the first stanza not added to the buffers
+        self.synced = 0
         self.core_buffer = self.core.xml_buffer
         self.filtered_buffer = text_buffer.TextBuffer()
 
@@ -145,27 +179,100 @@ class XMLTab(Tab):
         self.filter = ','.join(filter_strings)
 
     def update_filters(self, matcher):
+        self.sync()
         if not self.filters:
-            messages = self.core_buffer.messages[:]
-            self.filtered_buffer.messages = []
             self.core_buffer.del_window(self.text_win)
-            self.filtered_buffer.add_window(self.text_win)
         else:
-            messages = self.filtered_buffer.messages
-            self.filtered_buffer.messages = []
+            self.filtered_buffer.del_window(self.text_win)
         self.filters.append(matcher)
-        new_messages = []
-        for msg in messages:
-            try:
-                if msg.txt.strip() and self.match_stanza(
-                        ElementBase(ET.fromstring(clean_text(msg.txt)))):
-                    new_messages.append(msg)
-            except ET.ParseError:
-                log.debug('Malformed XML : %s', msg.txt, exc_info=True)
-        self.filtered_buffer.messages = new_messages
+        self.filtered_buffer.messages = []
+        self.add_stanzas(self.filtered_buffer, self.filter_candidates(),
+                         self.match_captured)
+        self.filtered_buffer.add_window(self.text_win)
         self.text_win.rebuild_everything(self.filtered_buffer)
         self.gen_filter_repr()
 
+    def filter_candidates(self):
+        """
+        The captured stanzas that may match the filters: the ones found
+        in the indexes of the capture for an id or JID filter, or all of
+        them
+        """
+        candidates = None
+        for matcher_ in self.filters:
+            if isinstance(matcher_, MatchJID):
+                found = self.capture.by_jid(matcher_.jid.bare)
+            elif isinstance(matcher_, matcher.MatcherId):
+                found = self.capture.by_id(matcher_._criteria)
+            else:
+                continue
+            if candidates is None or len(found) < len(candidates):
+                candidates = found
+        if candidates is None:
+            candidates, _ = self.capture.since(0)
+        return candidates
+
+    def sync(self):
+        """
+        Add the stanzas captured since the last time to the buffers
+        """
+        stanzas, self.synced = self.capture.since(self.synced)
+        if not stanzas:
+            return
+        self.add_stanzas(self.core_buffer, stanzas)
+        if self.filters:
+            self.add_stanzas(self.filtered_buffer, stanzas,
+                             self.match_captured)
+
+    @staticmethod
+    def add_stanzas(buffer, stanzas, match=None):
+        """
+        Highlight and add the stanzas (matching match) to a buffer, only
+        the last ones if they do not all fit in it
+        """
+        limit = buffer.messages.maxlen
+        selected = []
+        for stanza in reversed(stanzas):
+            if len(selected) == limit:
+                break
+            if match is None or match(stanza):
+                selected.append(stanza)
+        theme = get_theme()
+        for stanza in reversed(selected):
+            buffer.add_message(
+                colorize_stanza(stanza.text),
+                time=stanza.time,
+                nickname=theme.CHAR_XML_IN
+                if stanza.incoming else theme.CHAR_XML_OUT)
+
+    def match_captured(self, stanza):
+        """
+        Check a captured stanza against the filters, only parsing it for
+        the ones that need more than its top-level attributes
+        """
+        element = None
+        for matcher_ in self.filters:
+            if isinstance(matcher_, MatchJID):
+                if not matcher_.match_jids(stanza.from_, stanza.to):
+                    return False
+            elif isinstance(matcher_, matcher.MatcherId):
+                if stanza.id != matcher_._criteria:
+                    return False
+            else:
+                try:
+                    if element is None:
+                        element = ElementBase(ET.fromstring(stanza.text))
+                    if not matcher_.match(element):
+                        return False
+                except ET.ParseError:
+                    log.debug('Malformed XML : %s', stanza.text,
+                              exc_info=True)
+                    return False
+                except Exception:
+                    log.debug('', exc_info=True)
+                    return False
+        return True
+
     def on_freeze(self):
         """
         Freeze the display.
@@ -257,13 +364,16 @@ class XMLTab(Tab):
         """/dump <filename>"""
         if args is None:
             return self.core.command.help('dump')
+        stanzas, _ = self.capture.since(0)
         if self.filters:
-            xml = self.filtered_buffer.messages[:]
-        else:
-            xml = self.core_buffer.messages[:]
-        text = '\n'.join(
-            ('%s %s %s' % (msg.str_time, msg.nickname, clean_text(msg.txt))
-             for msg in xml))
+            stanzas = [
+                stanza for stanza in stanzas if self.match_captured(stanza)
+            ]
+        theme = get_theme()
+        text = '\n'.join(('%s %s %s' % (stanza.time.strftime('%H:%M:%S'),
+                                        theme.CHAR_XML_IN if stanza.incoming
+                                        else theme.CHAR_XML_OUT, stanza.text)
+                          for stanza in stanzas))
         filename = os.path.expandvars(os.path.expanduser(args[0]))
         try:
             with open(filename, 'w') as fd:
@@ -302,6 +412,8 @@ class XMLTab(Tab):
         """
         /clear
         """
+        self.capture.clear()
+        self.synced = self.capture.next_seq
         self.core_buffer.messages = []
         self.filtered_buffer.messages = []
         self.text_win.rebuild_everything(self.filtered_buffer)
@@ -345,6 +457,7 @@ class XMLTab(Tab):
         self.input.resize(1, self.width, self.height - 1, 0)
 
     def refresh(self):
+        self.sync()
         if self.need_resize:
             self.resize()
         log.debug('  TAB   Refresh: %s', self.__class__.__name__)
@@ -371,6 +484,7 @@ class XMLTab(Tab):
     def on_close(self):
         super().on_close()
         self.command_clear()
+        self.capture.close()
         self.core.xml_tab = False
 
     def on_info_win_size_changed(self):
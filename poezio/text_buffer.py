@@ -11,16 +11,19 @@ independently by their TextWins.
 import logging
 log = logging.getLogger(__name__)
 
-from typing import Union, Optional, List, Tuple
+from collections import deque
+from typing import Any, Dict, Deque, Iterable, List, Union, Optional, Tuple
 from datetime import datetime
 from poezio.config import config
+from poezio.formatted_text import FormattedText
 from poezio.theming import get_theme, dump_tuple
+from poezio.word_index import WordIndex
 
 
 class Message:
     __slots__ = ('txt', 'nick_color', 'time', 'str_time', 'nickname', 'user',
                  'identifier', 'highlight', 'me', 'old_message', 'revisions',
-                 'jid', 'ack')
+                 'jid', 'ack', 'wrapped', '_formatted')
 
     def __init__(self,
                  txt: str,
@@ -71,12 +74,34 @@ class Message:
         self.revisions = revisions
         self.jid = jid
         self.ack = ack
+        # cache of the lines this message was cut into, by text width
+        # (see BaseTextWin.wrap_message)
+        self.wrapped = None  # type: Optional[Dict]
+        self._formatted = None  # type: Optional[FormattedText]
+
+    @property
+    def formatted(self) -> FormattedText:
+        """
+        The text compiled into its plain text and formatting codes, once
+        (again if the text was changed since)
+        """
+        formatted = self._formatted
+        if formatted is None or formatted.source is not self.txt:
+            formatted = self._formatted = FormattedText(self.txt)
+        return formatted
+
+    @property
+    def plain(self) -> str:
+        """The text without its formatting"""
+        return self.formatted.plain
 
     def _other_elems(self) -> str:
         "Helper for the repr_message function"
         acc = []
         fields = list(self.__slots__)
         fields.remove('old_message')
+        fields.remove('wrapped')
+        fields.remove('_formatted')
         for field in fields:
             acc.append('%s=%s' % (field, repr(getattr(self, field))))
         return 'Message(%s, %s' % (', '.join(acc), 'old_message=')
@@ -110,10 +135,25 @@ class AckError(Exception):
     pass
 
 
+# the arguments of Message that may be missing from the ones given to
+# TextBuffer.prepend_messages
+PREPEND_DEFAULTS = {
+    'time': None,
+    'nickname': None,
+    'nick_color': None,
+    'history': False,
+    'user': None,
+    'identifier': None
+}
+
+
 class TextBuffer:
     """
-    This class just keep trace of messages, in a list with various
+    This class just keep trace of messages, in a bounded ring with various
     information and attributes.
+
+    Messages are also indexed by their identifier, so that corrections and
+    receipts do not need to walk the whole buffer.
     """
 
     def __init__(self, messages_nb_limit: Optional[int] = None) -> None:
@@ -121,19 +161,86 @@ class TextBuffer:
         if messages_nb_limit is None:
             messages_nb_limit = config.get('max_messages_in_memory')
         self._messages_nb_limit = messages_nb_limit  # type: int
-        # Message objects
-        self.messages = []  # type: List[Message]
+        # Message objects, the oldest ones are dropped by the deque itself
+        self._messages = deque(
+            maxlen=messages_nb_limit)  # type: Deque[Message]
+        # absolute sequence number of self._messages[0]
+        self._first_seq = 0
+        # identifier -> absolute sequence number of the most recent
+        # message with that identifier
+        self._index = {}  # type: Dict[str, int]
+        # the words of the messages, built when first needed
+        self._words = None  # type: Optional[WordIndex]
         # we keep track of one or more windows
         # so we can pass the new messages to them, as they are added, so
         # they (the windows) can build the lines from the new message
         self._windows = []
 
+    @property
+    def messages(self) -> Deque[Message]:
+        return self._messages
+
+    @property
+    def first_seq(self) -> int:
+        """
+        The sequence number of the oldest message in the buffer: each
+        message keeps its own, from the oldest to the newest, until it is
+        dropped
+        """
+        return self._first_seq
+
+    @messages.setter
+    def messages(self, messages: Iterable[Message]) -> None:
+        """
+        Replace the whole content of the buffer (e.g. on /clear),
+        and rebuild the identifier index. The new messages get new
+        sequence numbers.
+        """
+        self._first_seq += len(self._messages)
+        self._messages = deque(messages, maxlen=self._messages_nb_limit)
+        self._index = {}
+        self._words = None
+        for i, msg in enumerate(self._messages):
+            if msg.identifier:
+                self._index[msg.identifier] = self._first_seq + i
+
     def add_window(self, win) -> None:
         self._windows.append(win)
 
+    @property
+    def words(self) -> WordIndex:
+        """
+        The index of the words of the messages, kept up to date once it
+        has been built
+        """
+        if self._words is None:
+            self._words = WordIndex(self._messages_nb_limit)
+            for msg in self._messages:
+                self._words.add(msg.plain)
+        return self._words
+
     @property
     def last_message(self) -> Optional[Message]:
-        return self.messages[-1] if self.messages else None
+        return self._messages[-1] if self._messages else None
+
+    def _append(self, msg: Message) -> None:
+        """
+        Append a message to the ring, evicting the oldest one (and its
+        index entry) if the buffer is full.
+        """
+        messages = self._messages
+        seq = self._first_seq + len(messages)
+        if len(messages) == messages.maxlen:
+            evicted = messages[0]
+            if (evicted.identifier
+                    and self._index.get(evicted.identifier) == self._first_seq):
+                del self._index[evicted.identifier]
+            self._first_seq += 1
+        if msg.identifier:
+            self._index[msg.identifier] = seq
+        messages.append(msg)
+        if self._words is not None:
+            self._words.add(msg.plain)
 
     def add_message(self,
                     txt: str,
@@ -162,38 +269,68 @@ class TextBuffer:
             highlight=highlight,
             jid=jid,
             ack=ack)
-        self.messages.append(msg)
-
-        while len(self.messages) > self._messages_nb_limit:
-            self.messages.pop(0)
+        self._append(msg)
 
         ret_val = 0
         show_timestamps = config.get('show_timestamps')
         nick_size = config.get('max_nick_length')
         for window in self._windows:  # make the associated windows
-            # build the lines from the new message
-            nb = window.build_new_message(
-                msg,
-                history=history,
-                highlight=highlight,
-                timestamp=show_timestamps,
-                nick_size=nick_size)
+            if window.deferred:
+                # the window is not displayed, it will build the lines
+                # when it needs them
+                window.add_pending_message(self)
+                nb = 1
+            else:
+                # build the lines from the new message
+                nb = window.build_new_message(
+                    msg,
+                    history=history,
+                    highlight=highlight,
+                    timestamp=show_timestamps,
+                    nick_size=nick_size)
+                if window.pos != 0:
+                    window.scroll_up(nb)
             if ret_val == 0:
                 ret_val = nb
-            if window.pos != 0:
-                window.scroll_up(nb)
 
         return min(ret_val, 1)
 
+    def prepend_messages(self, messages: List[Dict[str, Any]]) -> int:
+        """
+        Add messages older than the ones of the buffer (e.g. read from the
+        logs, as dicts of the arguments of add_message) before them, and
+        rebuild the lines of its windows. The buffer never drops newer
+        messages for them: only the most recent ones that fit are added,
+        and their number is returned.
+        """
+        messages = messages[len(messages) -
+                            (self._messages.maxlen - len(self._messages)):]
+        if not messages:
+            return 0
+        new = [
+            Message(**dict(PREPEND_DEFAULTS, **message))
+            for message in messages
+        ]
+        self._first_seq -= len(new)
+        for i, msg in reversed(list(enumerate(new))):
+            # the index keeps the most recent message with an identifier
+            if msg.identifier:
+                self._index.setdefault(msg.identifier, self._first_seq + i)
+        self._messages.extendleft(reversed(new))
+        # rebuilt with the older messages first, when needed
+        self._words = None
+        for window in self._windows:
+            window.rebuild_everything(self)
+        return len(new)
+
     def _find_message(self, old_id: str) -> int:
         """
         Find a message in the text buffer from its message id
         """
-        for i in range(len(self.messages) - 1, -1, -1):
-            msg = self.messages[i]
-            if msg.identifier == old_id:
-                return i
-        return -1
+        seq = self._index.get(old_id)
+        if seq is None:
+            return -1
+        return seq - self._first_seq
 
     def ack_message(self, old_id: str, jid: str) -> Union[None, bool, Message]:
         """Mark a message as acked"""
@@ -213,7 +350,7 @@ class TextBuffer:
         i = self._find_message(old_id)
         if i == -1:
             return None
-        msg = self.messages[i]
+        msg = self._messages[i]
         if msg.ack == 1:  # Message was already acked
             return False
         if msg.jid != jid:
@@ -223,6 +360,7 @@ class TextBuffer:
         msg.ack = value
         if append:
             msg.txt += append
+            msg.wrapped = None
         return msg
 
     def modify_message(self,
@@ -245,7 +383,7 @@ class TextBuffer:
                 old_id)
             raise CorrectionError("nothing to replace")
 
-        msg = self.messages[i]
+        msg = self._messages[i]
 
         if msg.user and msg.user is not user:
             raise CorrectionError("Different users")
@@ -273,7 +411,14 @@ class TextBuffer:
             old_message=msg,
             revisions=msg.revisions + 1,
             jid=jid)
-        self.messages[i] = message
+        self._messages[i] = message
+        if self._words is not None:
+            self._words.replace(i, message.plain)
+        seq = self._first_seq + i
+        if self._index.get(old_id) == seq:
+            del self._index[old_id]
+        if new_id:
+            self._index[new_id] = seq
         log.debug('Replacing message %s with %s.', old_id, new_id)
         return message
 
@@ -281,5 +426,5 @@ class TextBuffer:
         self._windows.remove(win)
 
     def __del__(self):
-        size = len(self.messages)
+        size = len(self._messages)
         log.debug('** Deleting %s messages from textbuffer', size)
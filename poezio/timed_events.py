@@ -10,11 +10,19 @@ Timed events are the standard way to schedule events for later in poezio.
 Once created, they must be added to the list of checked events with
 :py:func:`Core.add_timed_event` (within poezio) or with
 :py:func:`.PluginAPI.add_timed_event` (within a plugin).
+
+The events are run by a :py:class:`TimerWheel`: adding or removing one
+only costs a dict operation, and the event loop is only woken up when
+the next events are due, instead of scheduling each event in the loop.
 """
 
+import asyncio
+import logging
 from datetime import datetime
-from asyncio import Handle
-from typing import Callable, Union, Optional, Tuple, Any
+from math import ceil
+from typing import Callable, Dict, List, Union, Optional, Tuple, Any
+
+log = logging.getLogger(__name__)
 
 
 class DelayedEvent:
@@ -35,8 +43,8 @@ class DelayedEvent:
         self.callback = callback  # type: Callable
         self.args = args  # type: Tuple[Any, ...]
         self.delay = delay  # type: Union[int, float]
-        # An asyncio handler, as returned by call_later() or call_at()
-        self.handler = None  # type: Optional[Handle]
+        # The Timer of the event once it is added, used to cancel it
+        self.handler = None  # type: Optional[Timer]
 
 
 class TimedEvent(DelayedEvent):
@@ -57,3 +65,126 @@ class TimedEvent(DelayedEvent):
         delta = date - datetime.now()
         delay = delta.total_seconds()
         DelayedEvent.__init__(self, delay, callback, *args)
+
+
+class Timer:
+    """
+    An event in a TimerWheel, due at a given tick of the wheel
+    """
+    __slots__ = ('wheel', 'event', 'due')
+
+    def __init__(self, wheel: 'TimerWheel', event: DelayedEvent,
+                 due: int) -> None:
+        self.wheel = wheel
+        self.event = event
+        self.due = due
+
+    def cancel(self) -> None:
+        """Remove the event from the wheel, if it was not run yet"""
+        self.wheel.remove(self)
+
+
+class TimerWheel:
+    """
+    A hashed timer wheel: the time is cut into ticks of resolution
+    seconds, and each event is put in the slot of the tick at which it is
+    due (modulo the number of slots, the events due in more than a turn
+    of the wheel waiting in their slot for the right turn).
+
+    Only one call is scheduled in the event loop, at the next tick with
+    events (and moved only if an event is added before it), so that the
+    events added and removed often (the chat state and self-ping delays,
+    for example) never touch the loop. The events are run at most
+    resolution seconds late.
+    """
+
+    def __init__(self, resolution: float = 0.05, size: int = 1024,
+                 loop=None) -> None:
+        self.resolution = resolution
+        self.size = size
+        self._loop = loop
+        self._slots = [{} for _ in range(size)]  # type: List[Dict[Timer, None]]
+        self._count = 0
+        # loop time of the tick 0
+        self._start = None  # type: Optional[float]
+        # the last tick whose events were run
+        self._tick = 0
+        # the call scheduled in the loop, and its tick
+        self._handle = None  # type: Optional[asyncio.TimerHandle]
+        self._wake_tick = None  # type: Optional[int]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _get_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        return self._loop
+
+    def add(self, event: DelayedEvent) -> Timer:
+        """Schedule an event, and return its Timer"""
+        loop = self._get_loop()
+        if self._start is None:
+            self._start = loop.time()
+        elapsed = loop.time() - self._start
+        due = max(
+            ceil((elapsed + event.delay) / self.resolution), self._tick + 1)
+        timer = Timer(self, event, due)
+        self._slots[due % self.size][timer] = None
+        self._count += 1
+        event.handler = timer
+        self._schedule(due)
+        return timer
+
+    def remove(self, timer: Timer) -> None:
+        slot = self._slots[timer.due % self.size]
+        if timer in slot:
+            del slot[timer]
+            self._count -= 1
+
+    def _schedule(self, tick: int) -> None:
+        if self._wake_tick is not None and self._wake_tick <= tick:
+            return
+        if self._handle is not None:
+            self._handle.cancel()
+        self._wake_tick = tick
+        self._handle = self._get_loop().call_at(
+            self._start + tick * self.resolution, self._run)
+
+    def _next_tick(self) -> Optional[int]:
+        """The next tick with events (possibly due in a later turn)"""
+        if not self._count:
+            return None
+        slots, size = self._slots, self.size
+        for tick in range(self._tick + 1, self._tick + size + 1):
+            if slots[tick % size]:
+                return tick
+        return None
+
+    def _run(self) -> None:
+        now = int((self._get_loop().time() - self._start) / self.resolution)
+        # the loop can wake us up a bit early
+        now = max(now, self._wake_tick)
+        self._handle = self._wake_tick = None
+        due = []  # type: List[Timer]
+        slots, size = self._slots, self.size
+        for tick in range(max(self._tick + 1, now - size + 1), now + 1):
+            slot = slots[tick % size]
+            if not slot:
+                continue
+            for timer in [timer for timer in slot if timer.due <= now]:
+                del slot[timer]
+                due.append(timer)
+        self._tick = now
+        self._count -= len(due)
+        due.sort(key=lambda timer: timer.due)
+        for timer in due:
+            event = timer.event
+            try:
+                event.callback(*event.args)
+            except Exception:
+                log.error('Error in the timed event %s', event.callback,
+                          exc_info=True)
+        next_tick = self._next_tick()
+        if next_tick is not None:
+            self._schedule(next_tick)
@@ -13,7 +13,7 @@ import logging
 from datetime import timedelta, datetime
 from hashlib import md5
 from random import choice
-from typing import Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 from poezio import xhtml, colors
 from poezio.theming import get_theme
@@ -132,3 +132,108 @@ class User:
         if ROLE_DICT[self.role] == ROLE_DICT[b.role]:
             return self.nick.lower() <= b.nick.lower()
         return ROLE_DICT[self.role] >= ROLE_DICT[b.role]
+
+
+def sort_key(user: User) -> Tuple[int, str]:
+    """
+    The key ordering the users like their comparison operators do: by
+    decreasing role, then by nick (case-insensitive)
+    """
+    return (-ROLE_DICT[user.role], user.nick.lower())
+
+
+class UserTable:
+    """
+    The users of a room, indexed by nick, and sorted (see sort_key) for
+    the user list.
+
+    Adding or removing a user only updates the index: the sorted list is
+    rebuilt when it is next read (usually once per frame, when the user
+    list is drawn), from the previous one and the users added since, so
+    that a burst of joins is sorted once instead of being inserted one by
+    one.
+
+    It can be iterated over, indexed and sliced like the sorted list of
+    the users. A user must be removed from the table before its nick or
+    role is changed, and added back afterwards.
+    """
+
+    def __init__(self) -> None:
+        self._by_nick = {}  # type: Dict[str, User]
+        # id of each user -> its key and nick when it was added
+        self._entries = {}  # type: Dict[int, Tuple[Tuple[int, str], str]]
+        # the users, sorted when they were last read
+        self._sorted = []  # type: List[User]
+        # the users added since then, and whether some were removed
+        self._added = {}  # type: Dict[int, User]
+        self._removed = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[User]:
+        return iter(self._view())
+
+    def __getitem__(self, index: Union[int, slice]):
+        return self._view()[index]
+
+    def __contains__(self, user: User) -> bool:
+        return id(user) in self._entries
+
+    def __repr__(self) -> str:
+        return 'UserTable(%r)' % self._view()
+
+    def _view(self) -> List[User]:
+        """The sorted list of the users"""
+        if not self._added and not self._removed:
+            return self._sorted
+        entries, added = self._entries, self._added
+        # the users added again are taken from added
+        users = [
+            user for user in self._sorted
+            if id(user) in entries and id(user) not in added
+        ]
+        users.extend(added.values())
+        # mostly sorted already: timsort merges the new users in
+        users.sort(key=lambda user: entries[id(user)][0])
+        self._sorted = users
+        self._added = {}
+        self._removed = False
+        return users
+
+    def get(self, nick: str) -> Optional[User]:
+        """
+        Get the user with that nick, or None
+        """
+        return self._by_nick.get(nick)
+
+    def add(self, user: User) -> None:
+        """
+        Add a user (replacing the one with the same nick, if any)
+        """
+        previous = self._by_nick.get(user.nick)
+        if previous is not None:
+            self.remove(previous)
+        self._by_nick[user.nick] = user
+        self._entries[id(user)] = (sort_key(user), user.nick)
+        self._added[id(user)] = user
+
+    def remove(self, user: User) -> None:
+        """
+        Remove a user, raise a ValueError if it is not in the table
+        """
+        entry = self._entries.pop(id(user), None)
+        if entry is None:
+            raise ValueError('%r is not in the table' % user)
+        nick = entry[1]
+        if self._by_nick.get(nick) is user:
+            del self._by_nick[nick]
+        if self._added.pop(id(user), None) is None:
+            self._removed = True
+
+    def clear(self) -> None:
+        self._by_nick.clear()
+        self._entries.clear()
+        self._sorted = []
+        self._added.clear()
+        self._removed = False
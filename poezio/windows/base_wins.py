@@ -13,13 +13,14 @@ import logging
 log = logging.getLogger(__name__)
 
 import curses
-import string
 
-from typing import Optional, Tuple
+from typing import Optional, Sequence, Tuple
 
+from poezio.formatted_text import FormattedText, FORMAT_CHAR
 from poezio.theming import to_curses_attr, read_tuple
 
-FORMAT_CHAR = '\x19'
+ATTR_ITALIC = curses.A_ITALIC if hasattr(curses,
+                                         'A_ITALIC') else curses.A_REVERSE
 # These are non-printable chars, so they should never appear in the input,
 # I guess. But maybe we can find better chars that are even less risky.
 format_chars = '\x0E\x0F\x10\x11\x12\x13\x14\x15\x16\x17\x18\x1A'
@@ -96,57 +97,67 @@ class Win:
         For example:
         \x19bhello → hello in bold
         \x191}Bonj\x192}our → 'Bonj' in red and 'our' in green
-        next_attr_char is the \x19 delimiter
-        attr_char is the char following it, it can be
-        one of 'u', 'b', 'i', 'c[0-9]'
+        (see poezio.formatted_text)
         """
         if y is not None and x is not None:
             self.move(y, x)
-        next_attr_char = text.find(FORMAT_CHAR)
-        attr_italic = curses.A_ITALIC if hasattr(
-            curses, 'A_ITALIC') else curses.A_REVERSE
-        while next_attr_char != -1 and text:
-            if next_attr_char + 1 < len(text):
-                attr_char = text[next_attr_char + 1].lower()
-            else:
-                attr_char = str()
-            if next_attr_char != 0:
-                self.addstr(text[:next_attr_char])
-            if attr_char == 'o':
-                self._win.attrset(0)
-            elif attr_char == 'u':
-                self._win.attron(curses.A_UNDERLINE)
-            elif attr_char == 'b':
-                self._win.attron(curses.A_BOLD)
-            elif attr_char == 'i':
-                self._win.attron(attr_italic)
-            if (attr_char in string.digits
-                    or attr_char == '-') and attr_char != '':
-                color_str = text[next_attr_char +
-                                 1:text.find('}', next_attr_char)]
-                if ',' in color_str:
-                    tup, char = read_tuple(color_str)
-                    self._win.attron(to_curses_attr(tup))
-                    if char:
-                        if char == 'o':
-                            self._win.attrset(0)
-                        elif char == 'u':
-                            self._win.attron(curses.A_UNDERLINE)
-                        elif char == 'b':
-                            self._win.attron(curses.A_BOLD)
-                        elif char == 'i':
-                            self._win.attron(attr_italic)
-                    else:
-                        # this will reset previous bold/uderline sequences if any was used
-                        self._win.attroff(curses.A_UNDERLINE)
-                        self._win.attroff(curses.A_BOLD)
-                elif color_str:
-                    self._win.attron(to_curses_attr((int(color_str), -1)))
-                text = text[next_attr_char + len(color_str) + 2:]
+        formatted = FormattedText(text)
+        self.addstr_formatted(formatted, 0, len(formatted.plain))
+
+    def addstr_formatted(self,
+                         formatted: FormattedText,
+                         start: int,
+                         end: int,
+                         prepend: Sequence[str] = ()) -> None:
+        """
+        Write the part of a compiled text between start and end (offsets
+        in its plain text), after setting the prepend formatting codes
+        """
+        for code in prepend:
+            self.apply_format(code)
+        plain, offsets, codes = formatted.plain, formatted.offsets, formatted.codes
+        first, last = formatted.codes_between(start, end)
+        pos = start
+        for i in range(first, last):
+            offset = offsets[i]
+            if offset != pos:
+                self.addstr(plain[pos:offset])
+                pos = offset
+            self.apply_format(codes[i])
+        if pos != end:
+            self.addstr(plain[pos:end])
+
+    def apply_format(self, code: str) -> None:
+        """
+        Set the attribute of a formatting code (see
+        poezio.formatted_text.compile_formatting)
+        """
+        if code == 'o':
+            self._win.attrset(0)
+        elif code == 'u':
+            self._win.attron(curses.A_UNDERLINE)
+        elif code == 'b':
+            self._win.attron(curses.A_BOLD)
+        elif code == 'i':
+            self._win.attron(ATTR_ITALIC)
+        elif ',' in code:
+            tup, char = read_tuple(code)
+            self._win.attron(to_curses_attr(tup))
+            if char:
+                if char == 'o':
+                    self._win.attrset(0)
+                elif char == 'u':
+                    self._win.attron(curses.A_UNDERLINE)
+                elif char == 'b':
+                    self._win.attron(curses.A_BOLD)
+                elif char == 'i':
+                    self._win.attron(ATTR_ITALIC)
             else:
-                text = text[next_attr_char + 2:]
-            next_attr_char = text.find(FORMAT_CHAR)
-        self.addstr(text)
+                # this will reset previous bold/uderline sequences if any was used
+                self._win.attroff(curses.A_UNDERLINE)
+                self._win.attroff(curses.A_BOLD)
+        elif code:
+            self._win.attron(to_curses_attr((int(code), -1)))
 
     def finish_line(self, color: Optional[Tuple] = None) -> None:
         """
@@ -159,6 +159,15 @@ class ListWin(Win):
             self._starting_pos -= self.height // 2
         return True
 
+    def select_row(self, index: int) -> None:
+        """
+        Select the given row, and scroll to it
+        """
+        if not self.lines:
+            return
+        self._selected_row = max(0, min(index, len(self.lines) - 1))
+        self._starting_pos = max(0, self._selected_row - self.height // 2)
+
 
 class ColumnHeaderWin(Win):
     """
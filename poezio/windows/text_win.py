@@ -5,32 +5,127 @@ Can be locked, scrolled, has a separator, etc…
 
 import logging
 import curses
+from itertools import islice
 from math import ceil, log10
-from typing import Optional, List, Union
+from typing import Iterable, Iterator, Optional, List, Tuple, Union
 
-from poezio.windows.base_wins import Win, FORMAT_CHAR
-from poezio.windows.funcs import truncate_nick, parse_attrs
+from poezio.windows.base_wins import Win
+from poezio.windows.funcs import truncate_nick
 
 from poezio import poopt
 from poezio.config import config
+from poezio.formatted_text import apply_codes
 from poezio.theming import to_curses_attr, get_theme, dump_tuple
 from poezio.text_buffer import Message
 
 log = logging.getLogger(__name__)
 
 
-# msg is a reference to the corresponding Message object. text_start and
-# text_end are the position delimiting the text in this line.
+# msg is a reference to the corresponding Message object. start_pos and
+# end_pos are the positions delimiting the text of this line in the plain
+# text of the message, and prepend the formatting codes in effect at its
+# start (see poezio.formatted_text).
 class Line:
     __slots__ = ('msg', 'start_pos', 'end_pos', 'prepend')
 
-    def __init__(self, msg: Message, start_pos: int, end_pos: int, prepend: str) -> None:
+    def __init__(self, msg: Message, start_pos: int, end_pos: int,
+                 prepend: Tuple[str, ...]) -> None:
         self.msg = msg
         self.start_pos = start_pos
         self.end_pos = end_pos
         self.prepend = prepend
 
 
+class LineBuffer:
+    """
+    The list of built lines of a text window.
+
+    Lines are mostly appended at the end and dropped from the front when
+    the window holds too many of them. Dropping them only moves a start
+    offset (and clears the old slots, so the Lines are not kept alive);
+    the underlying list is compacted once half of it is dead, which makes
+    trimming O(1) amortized. Indexing and slicing (including the negative
+    slices used to render the bottom of the window) work like on a list.
+    """
+    __slots__ = ('_lines', '_start')
+
+    def __init__(self, lines: Iterable[Optional[Line]] = ()) -> None:
+        self._lines = list(lines)  # type: List[Optional[Line]]
+        self._start = 0
+
+    def __len__(self) -> int:
+        return len(self._lines) - self._start
+
+    def __iter__(self) -> Iterator[Optional[Line]]:
+        return islice(self._lines, self._start, None)
+
+    def __contains__(self, item: Optional[Line]) -> bool:
+        try:
+            self._lines.index(item, self._start)
+        except ValueError:
+            return False
+        return True
+
+    def _absolute(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('LineBuffer index out of range')
+        return self._start + index
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                return self._lines[self._start + start:self._start + stop]
+            return [
+                self._lines[self._start + i] for i in range(start, stop, step)
+            ]
+        return self._lines[self._absolute(key)]
+
+    def append(self, line: Optional[Line]) -> None:
+        self._lines.append(line)
+
+    def prepend(self, lines: List[Optional[Line]]) -> None:
+        self._lines[self._start:self._start] = lines
+
+    def extend(self, lines: Iterable[Optional[Line]]) -> None:
+        self._lines.extend(lines)
+
+    def insert(self, index: int, line: Optional[Line]) -> None:
+        if index >= len(self):
+            self._lines.append(line)
+        else:
+            self._lines.insert(self._absolute(max(index, -len(self))), line)
+
+    def pop(self, index: int = -1) -> Optional[Line]:
+        return self._lines.pop(self._absolute(index))
+
+    def index(self, line: Optional[Line]) -> int:
+        return self._lines.index(line, self._start) - self._start
+
+    def remove(self, line: Optional[Line]) -> None:
+        del self._lines[self._lines.index(line, self._start)]
+
+    def trim(self, limit: int) -> List[Optional[Line]]:
+        """
+        Drop the oldest lines until at most `limit` lines remain,
+        and return the dropped lines, oldest first.
+        """
+        excess = len(self) - limit
+        if excess <= 0:
+            return []
+        start = self._start
+        end = start + excess
+        evicted = self._lines[start:end]
+        self._lines[start:end] = [None] * excess
+        self._start = end
+        if self._start * 2 > len(self._lines):
+            del self._lines[:self._start]
+            self._start = 0
+        return evicted
+
+
 class BaseTextWin(Win):
     def __init__(self, lines_nb_limit: Optional[int] = None) -> None:
         if lines_nb_limit is None:
@@ -40,12 +135,25 @@ class BaseTextWin(Win):
         self.pos = 0
         # Each new message is built and kept here.
         # on resize, we rebuild all the messages
-        self.built_lines = []  # type: List[Union[None, Line]]
+        self.built_lines = LineBuffer()
 
         self.lock = False
         self.lock_buffer = []  # type: List[Union[None, Line]]
         self.separator_after = None  # type: Optional[Line]
 
+        # With lazy_layout, the text buffer whose older messages are still
+        # to be wrapped, and the sequence number (see TextBuffer.first_seq)
+        # of the oldest message already wrapped
+        self._lazy_room = None
+        self._lazy_first_seq = 0
+
+        # A deferred window is not displayed: the text buffer only tells it
+        # how many messages were added, and their lines are built when
+        # they are needed (see build_pending_messages)
+        self.deferred = False
+        self._pending_room = None
+        self._nb_pending = 0
+
     def toggle_lock(self) -> bool:
         if self.lock:
             self.release_lock()
@@ -61,9 +169,53 @@ class BaseTextWin(Win):
             self.built_lines.append(line)
         self.lock = False
 
+    def defer(self) -> None:
+        self.deferred = True
+
+    def resume(self) -> None:
+        self.deferred = False
+        self.build_pending_messages()
+
+    # TODO: figure out the type of room.
+    def add_pending_message(self, room) -> None:
+        """
+        Remember that a message was added to room while deferred
+        """
+        self._pending_room = room
+        self._nb_pending += 1
+
+    def build_pending_messages(self) -> int:
+        """
+        Build the lines of the messages added while the window was
+        deferred, and return the number of lines built.
+        """
+        room = self._pending_room
+        if room is None:
+            return 0
+        # Each message takes at least one line, older ones would not fit
+        nb_pending = min(self._nb_pending, len(room.messages),
+                         self.lines_nb_limit)
+        self._pending_room = None
+        self._nb_pending = 0
+        messages = list(islice(reversed(room.messages), nb_pending))
+        with_timestamps = config.get('show_timestamps')
+        nick_size = config.get('max_nick_length')
+        nb_lines = 0
+        for message in reversed(messages):
+            nb_lines += self.build_new_message(
+                message,
+                highlight=message.highlight,
+                timestamp=with_timestamps,
+                nick_size=nick_size)
+        if self.pos != 0:
+            self.scroll_up(nb_lines)
+        return nb_lines
+
     def scroll_up(self, dist: int = 14) -> bool:
+        self.build_pending_messages()
         pos = self.pos
         self.pos += dist
+        self._build_lines_until(self.pos + 2 * self.height)
         if self.pos + self.height > len(self.built_lines):
             self.pos = len(self.built_lines) - self.height
             if self.pos < 0:
@@ -71,6 +223,7 @@ class BaseTextWin(Win):
         return self.pos != pos
 
     def scroll_down(self, dist: int = 14) -> bool:
+        self.build_pending_messages()
         pos = self.pos
         self.pos -= dist
         if self.pos <= 0:
@@ -100,10 +253,28 @@ class BaseTextWin(Win):
         if not lines or not lines[0]:
             return 0
         if clean:
-            while len(self.built_lines) > self.lines_nb_limit:
-                self.built_lines.pop(0)
+            self._trim_built_lines()
         return len(lines)
 
+    def _trim_built_lines(self) -> List[Union[None, Line]]:
+        """
+        Drop the oldest lines over lines_nb_limit, and forget the
+        separator if it was one of them.
+        """
+        evicted = self.built_lines.trim(self.lines_nb_limit)
+        if evicted:
+            # the older messages would not fit either
+            self._lazy_room = None
+            if self.separator_after is not None and None in evicted:
+                self.separator_after = None
+        return evicted
+
+    def _prepend_lines(self, lines: List[Union[None, Line]]) -> None:
+        """
+        Add the lines of older messages at the top of the window.
+        """
+        self.built_lines.prepend(lines)
+
     def build_message(self, message: Message, timestamp: bool = False, nick_size: int = 10) -> List[Union[None, Line]]:
         """
         Build a list of lines from a message, without adding it
@@ -111,14 +282,52 @@ class BaseTextWin(Win):
         """
         return []
 
+    @staticmethod
+    def wrap_message(message: Message, width: int, default_color: Optional[str]
+                     ) -> List[Tuple[int, int, Tuple[str, ...]]]:
+        """
+        Cut the plain text of a message into lines fitting in width, and
+        return the start, end and formatting codes to prepend of each line
+        (default_color, a color code, if there are none).
+
+        The result is kept on the message for its last few widths, so
+        that going back to a previous size does not cut it again.
+        """
+        key = (width, default_color)
+        if message.wrapped is None:
+            message.wrapped = {}
+        elif key in message.wrapped:
+            return message.wrapped[key]
+        formatted = message.formatted
+        offsets, codes = formatted.offsets, formatted.codes
+        default = (default_color, ) if default_color else ()
+        ret = []
+        attrs = []  # type: List[str]
+        i = 0
+        for start, end in poopt.cut_text(formatted.plain, width):
+            # the codes before this line, including the ones skipped
+            # between the previous line and this one
+            first = i
+            while i < len(offsets) and offsets[i] < start:
+                i += 1
+            if i != first:
+                attrs = apply_codes(attrs, codes[first:i])
+            ret.append((start, end, tuple(attrs) if attrs else default))
+        if len(message.wrapped) >= 4:
+            del message.wrapped[next(iter(message.wrapped))]
+        message.wrapped[key] = ret
+        return ret
+
     def refresh(self) -> None:
         pass
 
-    def write_text(self, y: int, x: int, txt: str) -> None:
+    def write_line(self, y: int, x: int, line: Line) -> None:
         """
-        write the text of a line.
+        Write the text of a built line
         """
-        self.addstr_colored(txt, y, x)
+        self.move(y, x)
+        self.addstr_formatted(line.msg.formatted, line.start_pos,
+                              line.end_pos, line.prepend)
 
     def write_time(self, time: str) -> int:
         """
@@ -154,19 +363,64 @@ class BaseTextWin(Win):
 
     # TODO: figure out the type of room.
     def rebuild_everything(self, room) -> None:
-        self.built_lines = []
+        self.built_lines = LineBuffer()
+        self._lazy_room = None
+        self._pending_room = None
+        self._nb_pending = 0
+        if not self.lock and config.get('lazy_layout'):
+            # Only wrap what is displayed (plus one screen), the older
+            # messages are wrapped when we scroll up to them.
+            self._lazy_room = room
+            self._lazy_first_seq = room.first_seq + len(room.messages)
+            self._build_lines_until(self.pos + 2 * self.height)
+            return
         with_timestamps = config.get('show_timestamps')
         nick_size = config.get('max_nick_length')
         for message in room.messages:
             self.build_new_message(
                 message,
                 clean=False,
+                highlight=message.highlight,
                 timestamp=with_timestamps,
                 nick_size=nick_size)
             if self.separator_after is message:
                 self.build_new_message(None)
-        while len(self.built_lines) > self.lines_nb_limit:
-            self.built_lines.pop(0)
+        self._trim_built_lines()
+
+    def _build_lines_until(self, nb_lines: int) -> None:
+        """
+        Wrap the older messages of a lazily rebuilt window until it holds
+        at least nb_lines lines, or until there is nothing left to wrap.
+        """
+        while (self._lazy_room is not None
+               and len(self.built_lines) < nb_lines):
+            self._build_older_messages(nb_lines - len(self.built_lines))
+
+    def _build_older_messages(self, nb_messages: int) -> None:
+        """
+        Wrap at most nb_messages messages older than the oldest wrapped
+        one, and add them at the top of the window.
+        """
+        room = self._lazy_room
+        messages = room.messages
+        # 0 if it was evicted from the buffer, and so were the older ones
+        end = max(0, self._lazy_first_seq - room.first_seq)
+        start = max(0, end - nb_messages)
+        chunk = [messages[i] for i in range(start, end)]
+        with_timestamps = config.get('show_timestamps')
+        nick_size = config.get('max_nick_length')
+        lines = []  # type: List[Union[None, Line]]
+        for message in chunk:
+            lines.extend(
+                self.build_message(
+                    message, timestamp=with_timestamps, nick_size=nick_size))
+            if self.separator_after is message:
+                lines.append(None)
+        self._lazy_first_seq = room.first_seq + start
+        if start == 0:
+            self._lazy_room = None
+        self._prepend_lines(lines)
+        self._trim_built_lines()
 
     def __del__(self) -> None:
         log.debug('** TextWin: deleting %s built lines',
@@ -180,11 +434,11 @@ class TextWin(BaseTextWin):
 
         # the Lines of the highlights in that buffer
         self.highlights = []  # type: List[Line]
-        # the current HL position in that list NaN means that we’re not on
-        # an hl. -1 is a valid position (it's before the first hl of the
+        # the current HL position in that list, None means that we’re not
+        # on an hl. -1 is a valid position (it's before the first hl of the
         # list. i.e the separator, in the case where there’s no hl before
         # it.)
-        self.hl_pos = float('nan')
+        self.hl_pos = None  # type: Optional[int]
 
         # Keep track of the number of hl after the separator.
         # This is useful to make “go to next highlight“ work after a “move to separator”.
@@ -200,9 +454,10 @@ class TextWin(BaseTextWin):
         highlights, scroll to the end of the buffer.
         """
         log.debug('Going to the next highlight…')
-        if (not self.highlights or self.hl_pos != self.hl_pos
+        self.build_pending_messages()
+        if (not self.highlights or self.hl_pos is None
                 or self.hl_pos >= len(self.highlights) - 1):
-            self.hl_pos = float('nan')
+            self.hl_pos = None
             self.pos = 0
             return
         hl_size = len(self.highlights) - 1
@@ -219,7 +474,7 @@ class TextWin(BaseTextWin):
             except ValueError:
                 self.highlights = self.highlights[self.hl_pos + 1:]
                 if not self.highlights:
-                    self.hl_pos = float('nan')
+                    self.hl_pos = None
                     self.pos = 0
                     return
                 self.hl_pos = 0
@@ -236,11 +491,14 @@ class TextWin(BaseTextWin):
         highlights, scroll to the end of the buffer.
         """
         log.debug('Going to the previous highlight…')
-        if not self.highlights or self.hl_pos <= 0:
-            self.hl_pos = float('nan')
+        self.build_pending_messages()
+        self._build_lines_until(self.lines_nb_limit)
+        if not self.highlights or (self.hl_pos is not None
+                                   and self.hl_pos <= 0):
+            self.hl_pos = None
             self.pos = 0
             return
-        if self.hl_pos != self.hl_pos:
+        if self.hl_pos is None:
             self.hl_pos = len(self.highlights) - 1
         else:
             self.hl_pos -= 1
@@ -253,7 +511,7 @@ class TextWin(BaseTextWin):
             except ValueError:
                 self.highlights = self.highlights[self.hl_pos + 1:]
                 if not self.highlights:
-                    self.hl_pos = float('nan')
+                    self.hl_pos = None
                     self.pos = 0
                     return
                 self.hl_pos = 0
@@ -267,6 +525,8 @@ class TextWin(BaseTextWin):
         Scroll until separator is centered. If no separator is
         present, scroll at the top of the window
         """
+        self.build_pending_messages()
+        self._build_lines_until(self.lines_nb_limit)
         if None in self.built_lines:
             self.pos = len(self.built_lines) - self.built_lines.index(
                 None) - self.height + 1
@@ -288,9 +548,11 @@ class TextWin(BaseTextWin):
         Remove the line separator
         """
         log.debug('remove_line_separator')
+        self.build_pending_messages()
         if None in self.built_lines:
             self.built_lines.remove(None)
-            self.separator_after = None
+        # it may also be waiting to be built with the older messages
+        self.separator_after = None
 
     # TODO: figure out the type of room.
     def add_line_separator(self, room=None) -> None:
@@ -299,6 +561,7 @@ class TextWin(BaseTextWin):
         room is a textbuffer that is needed to get the previous message
         (in case of resize)
         """
+        self.build_pending_messages()
         if None not in self.built_lines:
             self.built_lines.append(None)
             self.nb_of_highlights_after_separator = 0
@@ -326,6 +589,8 @@ class TextWin(BaseTextWin):
         else:
             self.built_lines.extend(lines)
         if not lines or not lines[0]:
+            if message is None:
+                self.nb_of_highlights_after_separator = 0
             return 0
         if highlight:
             self.highlights.append(lines[0])
@@ -333,10 +598,58 @@ class TextWin(BaseTextWin):
             log.debug("Number of highlights after separator is now %s",
                       self.nb_of_highlights_after_separator)
         if clean:
-            while len(self.built_lines) > self.lines_nb_limit:
-                self.built_lines.pop(0)
+            self._trim_built_lines()
         return len(lines)
 
+    def _trim_built_lines(self) -> List[Union[None, Line]]:
+        """
+        Drop the oldest lines, and the highlights pointing to them.
+        """
+        evicted = BaseTextWin._trim_built_lines(self)
+        highlights = self.highlights
+        nb = 0
+        for line in evicted:
+            if nb < len(highlights) and highlights[nb] is line:
+                nb += 1
+        if nb:
+            del highlights[:nb]
+            if self.hl_pos is not None:
+                self.hl_pos = max(self.hl_pos - nb, -1)
+            self.nb_of_highlights_after_separator = min(
+                self.nb_of_highlights_after_separator, len(highlights))
+        return evicted
+
+    def _prepend_lines(self, lines: List[Union[None, Line]]) -> None:
+        """
+        Add the lines of older messages at the top of the window, and
+        register their highlights before the existing ones.
+        """
+        separator_built = None in self.built_lines
+        BaseTextWin._prepend_lines(self, lines)
+        highlights = [
+            line for line in lines
+            if line and line.start_pos == 0 and line.msg.highlight
+        ]
+        if not highlights:
+            return
+        self.highlights[0:0] = highlights
+        if self.hl_pos is not None:
+            self.hl_pos += len(highlights)
+        if not separator_built:
+            after_separator = 0
+            for line in reversed(lines):
+                if line is None:
+                    break
+                if line.start_pos == 0 and line.msg.highlight:
+                    after_separator += 1
+            self.nb_of_highlights_after_separator += after_separator
+
+    def rebuild_everything(self, room) -> None:
+        self.highlights = []
+        self.hl_pos = None
+        self.nb_of_highlights_after_separator = 0
+        BaseTextWin.rebuild_everything(self, room)
+
     def build_message(self, message: Optional[Message], timestamp: bool = False, nick_size: int = 10) -> List[Union[None, Line]]:
         """
         Build a list of lines from a message, without adding it
@@ -348,8 +661,8 @@ class TextWin(BaseTextWin):
         if not txt:
             return []
         if len(message.str_time) > 8:
-            default_color = (
-                FORMAT_CHAR + dump_tuple(get_theme().COLOR_LOG_MSG) + '}')  # type: Optional[str]
+            default_color = dump_tuple(
+                get_theme().COLOR_LOG_MSG)  # type: Optional[str]
         else:
             default_color = None
         ret = []  # type: List[Union[None, Line]]
@@ -373,30 +686,22 @@ class TextWin(BaseTextWin):
                 offset += 1
             if get_theme().CHAR_TIME_RIGHT and message.str_time:
                 offset += 1
-        lines = poopt.cut_text(txt, self.width - offset - 1)
-        prepend = default_color if default_color else ''
-        attrs = []  # type: List[str]
-        for line in lines:
-            saved = Line(
-                msg=message,
-                start_pos=line[0],
-                end_pos=line[1],
-                prepend=prepend)
-            attrs = parse_attrs(message.txt[line[0]:line[1]], attrs)
-            if attrs:
-                prepend = FORMAT_CHAR + FORMAT_CHAR.join(attrs)
-            else:
-                if default_color:
-                    prepend = default_color
-                else:
-                    prepend = ''
-            ret.append(saved)
+        for start, end, prepend in self.wrap_message(
+                message, self.width - offset - 1, default_color):
+            ret.append(
+                Line(
+                    msg=message,
+                    start_pos=start,
+                    end_pos=end,
+                    prepend=prepend))
         return ret
 
     def refresh(self) -> None:
         log.debug('Refresh: %s', self.__class__.__name__)
         if self.height <= 0:
             return
+        self.build_pending_messages()
+        self._build_lines_until(self.pos + self.height)
         if self.pos == 0:
             lines = self.built_lines[-self.height:]
         else:
@@ -415,9 +720,7 @@ class TextWin(BaseTextWin):
                 elif y == 0:
                     offset = self.compute_offset(msg, with_timestamps,
                                                  nick_size)
-                self.write_text(
-                    y, offset,
-                    line.prepend + line.msg.txt[line.start_pos:line.end_pos])
+                self.write_line(y, offset, line)
             else:
                 self.write_line_separator(y)
             if y != self.height - 1:
@@ -540,13 +843,15 @@ class TextWin(BaseTextWin):
         Find a message, and replace it with a new one
         (instead of rebuilding everything in order to correct a message)
         """
+        # the pending messages are built from the corrected text buffer
+        self.build_pending_messages()
         with_timestamps = config.get('show_timestamps')
         nick_size = config.get('max_nick_length')
         for i in range(len(self.built_lines) - 1, -1, -1):
             if self.built_lines[i] and self.built_lines[i].msg.identifier == old_id:
                 index = i
                 while index >= 0 and self.built_lines[index] and self.built_lines[index].msg.identifier == old_id:
-                    self.built_lines.pop(index)
+                    removed = self.built_lines.pop(index)
                     index -= 1
                 index += 1
                 lines = self.build_message(
@@ -554,6 +859,11 @@ class TextWin(BaseTextWin):
                 for line in lines:
                     self.built_lines.insert(index, line)
                     index += 1
+                if lines:
+                    for hl_index in range(len(self.highlights) - 1, -1, -1):
+                        if self.highlights[hl_index] is removed:
+                            self.highlights[hl_index] = lines[0]
+                            break
                 break
 
     def __del__(self) -> None:
@@ -571,6 +881,8 @@ class XMLTextWin(BaseTextWin):
         theme = get_theme()
         if self.height <= 0:
             return
+        self.build_pending_messages()
+        self._build_lines_until(self.pos + self.height)
         if self.pos == 0:
             lines = self.built_lines[-self.height:]
         else:
@@ -603,16 +915,13 @@ class XMLTextWin(BaseTextWin):
             # space
             offset += 1
 
-            self.write_text(
-                y, offset,
-                line.prepend + line.msg.txt[line.start_pos:line.end_pos])
+            self.write_line(y, offset, line)
             if y != self.height - 1:
                 self.addstr('\n')
         self._win.attrset(0)
         self._refresh()
 
     def build_message(self, message: Message, timestamp: bool = False, nick_size: int = 10) -> List[Line]:
-        txt = message.txt
         ret = []
         default_color = None
         nick = truncate_nick(message.nickname, nick_size)
@@ -625,24 +934,14 @@ class XMLTextWin(BaseTextWin):
             offset += 1
         if get_theme().CHAR_TIME_RIGHT and message.str_time:
             offset += 1
-        lines = poopt.cut_text(txt, self.width - offset - 1)
-        prepend = default_color if default_color else ''
-        attrs = []  # type: List[str]
-        for line in lines:
-            saved = Line(
-                msg=message,
-                start_pos=line[0],
-                end_pos=line[1],
-                prepend=prepend)
-            attrs = parse_attrs(message.txt[line[0]:line[1]], attrs)
-            if attrs:
-                prepend = FORMAT_CHAR + FORMAT_CHAR.join(attrs)
-            else:
-                if default_color:
-                    prepend = default_color
-                else:
-                    prepend = ''
-            ret.append(saved)
+        for start, end, prepend in self.wrap_message(
+                message, self.width - offset - 1, default_color):
+            ret.append(
+                Line(
+                    msg=message,
+                    start_pos=start,
+                    end_pos=end,
+                    prepend=prepend))
         return ret
 
     def write_prefix(self, nickname, color) -> None:
@@ -0,0 +1,103 @@
+"""
+Index of the words of the messages of a TextBuffer, used to complete the
+input with the words recently said (ChatTab.last_words_completion).
+
+The index follows the buffer: the words of each message are added when
+it is added to the buffer, and removed when it is dropped from it, so
+that completing never has to read the messages again. The words are kept
+sorted (case-insensitively) for the prefix lookups, and ranked by the
+number of messages they appear in, then by how recently they were said.
+"""
+
+import string
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+# shorter words are not worth completing
+MIN_WORD_LENGTH = 4
+
+NOT_IN_WORDS = str.maketrans(
+    dict.fromkeys(string.punctuation + '’„“”…«»', ' '))
+
+
+def extract_words(plain: str) -> Tuple[str, ...]:
+    """
+    The distinct words of the plain text of a message, in order
+    """
+    words = plain.translate(NOT_IN_WORDS).split()
+    return tuple(
+        dict.fromkeys(word for word in words if len(word) >= MIN_WORD_LENGTH))
+
+
+class WordIndex:
+    """
+    The words of the last size messages
+    """
+
+    def __init__(self, size: int) -> None:
+        # the words of each message, oldest first
+        self._messages = deque(maxlen=size)  # type: Deque[Tuple[str, ...]]
+        # word -> [number of messages containing it, last seen]
+        self._words = {}  # type: Dict[str, List[int]]
+        # (lowercased word, word), sorted
+        self._sorted = []  # type: List[Tuple[str, str]]
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def add(self, plain: str) -> None:
+        """
+        Index the plain text of a new message, forgetting the oldest one if
+        needed
+        """
+        if len(self._messages) == self._messages.maxlen:
+            self._forget(self._messages[0])
+        words = extract_words(plain)
+        self._messages.append(words)
+        self._learn(words)
+
+    def replace(self, index: int, plain: str) -> None:
+        """Index the new text of a corrected message"""
+        self._forget(self._messages[index])
+        words = extract_words(plain)
+        self._messages[index] = words
+        self._learn(words)
+
+    def _learn(self, words: Tuple[str, ...]) -> None:
+        self._seq += 1
+        for word in words:
+            entry = self._words.get(word)
+            if entry is None:
+                self._words[word] = [1, self._seq]
+                insort(self._sorted, (word.lower(), word))
+            else:
+                entry[0] += 1
+                entry[1] = self._seq
+
+    def _forget(self, words: Tuple[str, ...]) -> None:
+        for word in words:
+            entry = self._words[word]
+            entry[0] -= 1
+            if not entry[0]:
+                del self._words[word]
+                item = (word.lower(), word)
+                del self._sorted[bisect_left(self._sorted, item)]
+
+    def complete(self, prefix: str) -> List[str]:
+        """
+        The words starting with prefix (case-insensitively), the most
+        frequent first, and the most recent first among the equally
+        frequent ones
+        """
+        prefix = prefix.lower()
+        sorted_words = self._sorted
+        i = bisect_left(sorted_words, (prefix, ''))
+        matches = []
+        while i < len(sorted_words) and sorted_words[i][0].startswith(prefix):
+            matches.append(sorted_words[i][1])
+            i += 1
+        words = self._words
+        matches.sort(key=lambda word: (-words[word][0], -words[word][1]))
+        return matches
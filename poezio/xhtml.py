@@ -23,7 +23,6 @@ from xml import sax
 from xml.sax import saxutils
 from typing import List, Dict, Optional, Union, Tuple
 
-from slixmpp.xmlstream import ET
 from poezio.config import config
 from poezio.colors import ncurses_color_to_rgb
 
@@ -302,6 +301,8 @@ class XHTMLHandler(sax.ContentHandler):
     def __init__(self, force_ns=False,
                  tmp_image_dir: Optional[Path] = None) -> None:
         self.builder = []  # type: List[str]
+        # the text since the last tag, which can come in several pieces
+        self.text = []  # type: List[str]
         self.formatting = []  # type: List[str]
         self.attrs = []  # type: List[Dict[str, str]]
         self.list_state = []  #  type: List[Union[str, int]]
@@ -315,6 +316,7 @@ class XHTMLHandler(sax.ContentHandler):
 
     @property
     def result(self) -> str:
+        self.flush_text()
         sanitized = re.sub(poezio_color_double, r'\1',
                            ''.join(self.builder).strip())
         return re.sub(poezio_format_trim, '\x19o', sanitized)
@@ -328,9 +330,17 @@ class XHTMLHandler(sax.ContentHandler):
         self.builder.append('\x19o' + ''.join(self.formatting))
 
     def characters(self, characters: str):
-        self.builder.append(characters if self.is_pre else _trim(characters))
+        self.text.append(characters)
+
+    def flush_text(self):
+        if not self.text:
+            return
+        text = ''.join(self.text)
+        self.text.clear()
+        self.builder.append(text if self.is_pre else _trim(text))
 
     def startElementNS(self, name, _, attrs):
+        self.flush_text()
         if name[0] != XHTML_NS and not self.force_ns:
             return
 
@@ -404,6 +414,7 @@ class XHTMLHandler(sax.ContentHandler):
             self.append_formatting('\x19b')
 
     def endElementNS(self, name, _):
+        self.flush_text()
         if name[0] != XHTML_NS and not self.force_ns:
             return
 
@@ -438,14 +449,60 @@ class XHTMLHandler(sax.ContentHandler):
             builder.append(' [' + attrs['title'] + ']')
 
 
+def _split_name(name: str) -> Tuple[Optional[str], str]:
+    """Split an ElementTree name into its namespace and local name"""
+    if name[:1] == '{':
+        namespace, _, local = name[1:].partition('}')
+        return namespace, local
+    return None, name
+
+
+def walk_element(handler: XHTMLHandler, element) -> None:
+    """
+    Feed an already parsed element and its children to the handler, the
+    way the SAX parser would if it parsed them
+    """
+
+    def start(element):
+        name = _split_name(element.tag)
+        handler.startElementNS(name, None, {
+            _split_name(key): value
+            for key, value in element.attrib.items()
+        })
+        if element.text:
+            handler.characters(element.text)
+        return name
+
+    stack = [(element, start(element), iter(element))]
+    while stack:
+        element, name, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            handler.endElementNS(name, None)
+            if stack and element.tail:
+                handler.characters(element.tail)
+        elif not isinstance(child.tag, str):
+            # comments and processing instructions
+            if child.tail:
+                handler.characters(child.tail)
+        else:
+            stack.append((child, start(child), iter(child)))
+
+
 def xhtml_to_poezio_colors(xml, force=False,
                            tmp_dir: Optional[Path] = None) -> str:
+    """
+    Convert XHTML-IM to poezio colors. xml is either the already parsed
+    element, which is walked directly, or a string to parse.
+    """
+    handler = XHTMLHandler(force_ns=force, tmp_image_dir=tmp_dir)
+    if not isinstance(xml, (str, bytes)):
+        walk_element(handler, xml)
+        return handler.result
     if isinstance(xml, str):
         xml = xml.encode('utf8')
-    elif not isinstance(xml, bytes):
-        xml = ET.tostring(xml)
 
-    handler = XHTMLHandler(force_ns=force, tmp_image_dir=tmp_dir)
     parser = sax.make_parser()
     parser.setFeature(sax.handler.feature_namespaces, True)
     parser.setContentHandler(handler)
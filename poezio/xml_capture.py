@@ -0,0 +1,195 @@
+"""
+Capture of the stanzas shown in the XMLTab.
+
+While an XMLTab is opened, the stanzas sent and received are only kept as
+raw strings, in a bounded ring (xml_capture_size stanzas). Highlighting
+them and matching them against the filters is left to the XMLTab, which
+only does it for the stanzas it actually shows.
+
+Each stanza is stored with the attributes of its top-level element
+(from, to and id), and indexed by id and by bare JID, so that filtering
+by id or JID does not have to parse all the captured stanzas.
+
+If xml_capture_spill_file is set, the stanzas dropped from the ring are
+appended to that gzip-compressed file instead of being lost, so that long
+captures can be kept; the ones still in the ring are appended too when
+the capture is cleared or closed.
+"""
+
+import gzip
+import logging
+import os
+import re
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, IO, List, NamedTuple, Optional, Tuple
+from xml.sax.saxutils import unescape
+
+log = logging.getLogger(__name__)
+
+# the top-level element of a stanza, and its attributes
+START_TAG_RE = re.compile(r'<([^\s/>?!]+)([^>]*)>')
+ATTRIBUTE_RE = re.compile(r'([\w:.-]+)\s*=\s*(["\'])(.*?)\2', re.DOTALL)
+ENTITIES = {'&quot;': '"', '&apos;': "'"}
+
+CapturedStanza = NamedTuple('CapturedStanza', [('time', datetime),
+                                               ('incoming', bool),
+                                               ('text', str),
+                                               ('tag', str),
+                                               ('from_', str),
+                                               ('to', str),
+                                               ('id', str)])
+
+
+def parse_start_tag(text: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Get the name and the attributes of the top-level element of a stanza,
+    without parsing the whole of it
+    """
+    match = START_TAG_RE.search(text)
+    if match is None:
+        return '', {}
+    attributes = {
+        name: unescape(value, ENTITIES)
+        for name, _, value in ATTRIBUTE_RE.findall(match.group(2))
+    }
+    return match.group(1), attributes
+
+
+def bare_jid(jid: str) -> str:
+    """
+    The key of a JID in the index: its bare JID, with the case of the
+    localpart and domain folded like the JID normalization does
+    """
+    return jid.split('/', 1)[0].lower()
+
+
+def format_stanza(stanza: CapturedStanza) -> str:
+    """
+    The line of a stanza in the spill file
+    """
+    return '%s %s %s\n' % (stanza.time.strftime('%Y-%m-%d %H:%M:%S'),
+                           'IN' if stanza.incoming else 'OUT', stanza.text)
+
+
+class StanzaCapture:
+    """
+    A ring of the last stanzas sent or received, each one with a
+    sequence number
+    """
+
+    def __init__(self, size: int, spill_path: str = '') -> None:
+        self._stanzas = deque(
+            maxlen=max(size, 1))  # type: Deque[CapturedStanza]
+        # sequence number of self._stanzas[0]
+        self._first_seq = 0
+        # id or bare JID -> sequence numbers of the stanzas with it
+        self._ids = {}  # type: Dict[str, Deque[int]]
+        self._jids = {}  # type: Dict[str, Deque[int]]
+        self.spill_path = spill_path
+        self._spill = None  # type: Optional[IO[str]]
+
+    def __len__(self) -> int:
+        return len(self._stanzas)
+
+    @property
+    def next_seq(self) -> int:
+        """The sequence number of the next captured stanza"""
+        return self._first_seq + len(self._stanzas)
+
+    def add(self, text: str, incoming: bool) -> None:
+        """
+        Capture a stanza, dropping (or spilling) the oldest one if the ring
+        is full
+        """
+        stanzas = self._stanzas
+        seq = self.next_seq
+        if len(stanzas) == stanzas.maxlen:
+            self._drop(stanzas[0])
+            self._unindex(stanzas[0])
+            self._first_seq += 1
+        tag, attributes = parse_start_tag(text)
+        stanza = CapturedStanza(datetime.now(), incoming, text, tag,
+                                attributes.get('from', ''),
+                                attributes.get('to', ''),
+                                attributes.get('id', ''))
+        for index, key in self._keys(stanza):
+            index.setdefault(key, deque()).append(seq)
+        stanzas.append(stanza)
+
+    def _keys(self, stanza: CapturedStanza):
+        """The entries of a stanza in the indexes"""
+        if stanza.id:
+            yield self._ids, stanza.id
+        jids = {bare_jid(stanza.from_), bare_jid(stanza.to)}
+        jids.discard('')
+        for jid in jids:
+            yield self._jids, jid
+
+    def _unindex(self, stanza: CapturedStanza) -> None:
+        """Remove the oldest stanza from the indexes"""
+        for index, key in self._keys(stanza):
+            seqs = index[key]
+            seqs.popleft()
+            if not seqs:
+                del index[key]
+
+    def _drop(self, stanza: CapturedStanza) -> None:
+        if not self.spill_path:
+            return
+        if self._spill is None:
+            path = os.path.expanduser(self.spill_path)
+            try:
+                self._spill = gzip.open(path, 'at', encoding='utf-8')
+            except OSError:
+                log.error('Unable to open the XML spill file %s', path,
+                          exc_info=True)
+                self.spill_path = ''
+                return
+        self._spill.write(format_stanza(stanza))
+
+    def since(self, seq: int) -> Tuple[List[CapturedStanza], int]:
+        """
+        Return the stanzas still in the ring captured from the sequence
+        number seq, and the sequence number following them
+        """
+        start = max(seq - self._first_seq, 0)
+        stanzas = self._stanzas
+        if start == 0:
+            return list(stanzas), self.next_seq
+        return [stanzas[i] for i in range(start, len(stanzas))], self.next_seq
+
+    def _lookup(self, index: Dict[str, Deque[int]],
+                key: str) -> List[CapturedStanza]:
+        first = self._first_seq
+        stanzas = self._stanzas
+        return [stanzas[seq - first] for seq in index.get(key, ())]
+
+    def by_id(self, stanza_id: str) -> List[CapturedStanza]:
+        """The captured stanzas with that id"""
+        return self._lookup(self._ids, stanza_id)
+
+    def by_jid(self, jid: str) -> List[CapturedStanza]:
+        """
+        The captured stanzas from or to that JID, or a JID with the same
+        bare JID
+        """
+        return self._lookup(self._jids, bare_jid(jid))
+
+    def clear(self) -> None:
+        """
+        Forget (or spill) the captured stanzas, the sequence numbers go on
+        """
+        for stanza in self._stanzas:
+            self._drop(stanza)
+        self._first_seq = self.next_seq
+        self._stanzas.clear()
+        self._ids.clear()
+        self._jids.clear()
+
+    def close(self) -> None:
+        """Spill the captured stanzas and close the spill file"""
+        self.clear()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Compare the speed of the log parsers: parse_log_lines (pure python, one
+line at a time) and parse_log_data (poopt.parse_logs, in one pass).
+
+Parses the given log file, or generated logs if none is given.
+"""
+
+import argparse
+import datetime
+import timeit
+
+from poezio import logger
+from poezio.logger import build_log_message, parse_log_data, parse_log_lines
+
+
+def generate_logs(nb_messages: int) -> bytes:
+    "Generate logs looking like the ones of a busy room"
+    date = datetime.datetime(2017, 9, 9, 9, 9, 9)
+    messages = []
+    for i in range(nb_messages):
+        date += datetime.timedelta(seconds=37)
+        if i % 10 == 0:
+            messages.append(
+                build_log_message('', 'nick%d has joined' % (i % 50),
+                                  date=date, typ=2))
+        elif i % 7 == 0:
+            messages.append(
+                build_log_message('nick%d' % (i % 50),
+                                  'a message\non several\nlines', date=date))
+        else:
+            messages.append(
+                build_log_message('nick%d' % (i % 50),
+                                  'message number %d, with some text' % i,
+                                  date=date))
+    return ''.join(messages).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('logfile', nargs='?', help='a poezio log file')
+    parser.add_argument(
+        '-n', '--messages', type=int, default=10000,
+        help='number of messages to generate (default: 10000)')
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=10,
+        help='number of runs of each parser (default: 10)')
+    args = parser.parse_args()
+
+    if args.logfile:
+        with open(args.logfile, 'rb') as fd:
+            data = fd.read()
+    else:
+        data = generate_logs(args.messages)
+
+    def python_parser():
+        return parse_log_lines(data.decode(errors='replace').splitlines())
+
+    def poopt_parser():
+        return parse_log_data(data)
+
+    if logger.parse_logs is None:
+        print('poopt.parse_logs is not available, rebuild poopt (make)')
+        return
+    nb = len(poopt_parser())
+    assert python_parser() == poopt_parser()
+    print('%d messages, %d bytes' % (nb, len(data)))
+    for name, func in (('parse_log_lines', python_parser),
+                       ('parse_log_data', poopt_parser)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('%-16s %8.2f ms (%.2f µs/message)' % (name, best * 1000,
+                                                    best * 1e6 / nb))
+
+
+if __name__ == '__main__':
+    main()
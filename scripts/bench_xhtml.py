@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Compare the speed of the XHTML-IM conversions of a received message: the
+element walked directly (xhtml_to_poezio_colors on the parsed body), and
+the element serialized then parsed again with SAX (the former way).
+
+Uses generated message bodies, with some formatting, links and lists.
+"""
+
+import argparse
+import timeit
+from xml.etree import ElementTree as ET
+
+from poezio import xhtml
+
+
+class ConfigShim:
+    "The config is not loaded outside of poezio"
+
+    def get(self, *args, **kwargs):
+        return True
+
+
+def generate_bodies(nb_messages: int):
+    "Generate parsed XHTML-IM bodies looking like the ones of a busy room"
+    bodies = []
+    for i in range(nb_messages):
+        content = [
+            '<p>message number %d, with <strong>some</strong> ' % i,
+            '<span style="color: #%06x">colored</span> text' % (i * 4099 %
+                                                              0xffffff),
+        ]
+        if i % 5 == 0:
+            content.append(' and <a href="https://example.com/%d">a link</a>'
+                           % i)
+        if i % 13 == 0:
+            content.append('</p><ul><li>one</li><li>two</li></ul><p>')
+        content.append('</p>')
+        bodies.append(
+            ET.fromstring('<body xmlns="http://www.w3.org/1999/xhtml">%s'
+                          '</body>' % ''.join(content)))
+    return bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-n', '--messages', type=int, default=10000,
+        help='number of messages to generate (default: 10000)')
+    parser.add_argument(
+        '-r', '--repeat', type=int, default=10,
+        help='number of runs of each conversion (default: 10)')
+    args = parser.parse_args()
+
+    xhtml.config = ConfigShim()
+    bodies = generate_bodies(args.messages)
+
+    def walker():
+        return [xhtml.xhtml_to_poezio_colors(body) for body in bodies]
+
+    def sax_parser():
+        return [
+            xhtml.xhtml_to_poezio_colors(ET.tostring(body)) for body in bodies
+        ]
+
+    assert walker() == sax_parser()
+    print('%d messages' % len(bodies))
+    for name, func in (('element walker', walker), ('tostring + SAX',
+                                                    sax_parser)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print('%-16s %8.2f ms (%.2f µs/message)' % (name, best * 1000,
+                                                    best * 1e6 / len(bodies)))
+
+
+if __name__ == '__main__':
+    main()
@@ -123,9 +123,13 @@ setup(name="poezio",
                    'poezio_themes': 'data/themes'},
       package_data={'poezio': ['default_config.cfg']},
       scripts=['scripts/poezio_logs'],
-      entry_points={'console_scripts': ['poezio = poezio.__main__:run']},
+      entry_points={'console_scripts': [
+          'poezio = poezio.__main__:run',
+          'poezio-log-archive = poezio.log_archive:run',
+      ]},
       data_files=([('share/man/man1/', ['data/poezio.1',
-                                        'data/poezio_logs.1']),
+                                        'data/poezio_logs.1',
+                                        'data/poezio_log_archive.1']),
                    ('share/poezio/', ['README.rst', 'COPYING', 'CHANGELOG'])]
                   + find_doc('share/doc/poezio/source', 'source')
                   + find_doc('share/doc/poezio/html', 'build/html')),
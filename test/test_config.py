@@ -110,3 +110,65 @@ class TestTabNames(object):
         assert config_obj.get_by_tabname('test_int', 'toto@toto.com', fallback=False) == ''
 
 
+
+    def test_resolved_values(self, config_obj):
+        config_obj.set_and_save('cached', 'before', section='cache@toto.com')
+        hits = config_obj.cache_info().hits
+        for _ in range(3):
+            assert config_obj.get_by_tabname('cached', 'cache@toto.com') == 'before'
+        assert config_obj.cache_info().hits == hits + 2
+
+        config_obj.set('cached', 'after', section='cache@toto.com')
+        assert config_obj.get_by_tabname('cached', 'cache@toto.com') == 'after'
+        config_obj.silent_set('cached', 'saved', section='cache@toto.com')
+        assert config_obj.get_by_tabname('cached', 'cache@toto.com') == 'saved'
+        config_obj.remove_and_save('cached', section='cache@toto.com')
+        assert config_obj.get_by_tabname('cached', 'cache@toto.com',
+                                         fallback=False) == ''
+
+        # True == 1, but they are not resolved the same way
+        config_obj.set('cached_bool', '1')
+        assert config_obj.get('cached_bool', default=True) is True
+        assert config_obj.get('cached_bool', default=1) == 1
+        assert type(config_obj.get('cached_bool', default=1)) is int
+
+        assert config_obj.get('test') == 'coucou'
+        path = config_obj.file_name
+        path.write_text(path.read_text().replace('coucou', 'reloaded'))
+        config_obj.read_file()
+        assert config_obj.get('test') == 'reloaded'
+
+
+class TestWrites(object):
+    def test_batch(self, tmp_path, monkeypatch):
+        conf = config.Config(file_name=tmp_path / 'poezio.cfg')
+        writes = []
+        write_file = conf._write_file
+        monkeypatch.setattr(conf, '_write_file',
+                            lambda lines: writes.append(1) or write_file(lines))
+        with conf.batch() as batch:
+            for i in range(10):
+                conf.silent_set('option%d' % i, str(i))
+            conf.set_and_save('nick', 'red', section='muc_colors')
+            conf.remove_and_save('option3')
+            assert not writes
+        assert batch.success and len(writes) == 1
+        content = (tmp_path / 'poezio.cfg').read_text()
+        assert content == ''.join(
+            ['[Poezio]\n'] +
+            ['option%d = %d\n' % (i, i) for i in range(10) if i != 3] +
+            ['[muc_colors]\n', 'nick = red\n'])
+
+        conf.silent_set('option3', '3')
+        assert len(writes) == 2
+
+    def test_changed_file(self, tmp_path):
+        path = tmp_path / 'poezio.cfg'
+        path.write_text('[Poezio]\nfoo = bar\n[var]\nbaz = 1\n')
+        conf = config.Config(file_name=path)
+        conf.silent_set('foo', 'other')
+        # edited behind our back: read again before writing
+        path.write_text('[Poezio]\nfoo = other\nnew = 1\n\n[var]\nbaz = 2\n')
+        conf.silent_set('last', 'value', section='var')
+        assert path.read_text() == ('[Poezio]\nfoo = other\nnew = 1\n\n'
+                                    '[var]\nbaz = 2\nlast = value\n')
@@ -0,0 +1,56 @@
+"""
+Test the EventHandler, and the stats of its handlers
+"""
+
+from poezio.events import EventHandler, HandlerStats
+
+
+def test_trigger():
+    events = EventHandler()
+    calls = []
+    events.add_event_handler('muc_msg', lambda *args: calls.append(args))
+    events.trigger('muc_msg', 1, 2)
+    events.trigger('highlight', 3)
+    events.trigger('not_an_event', 4)
+    assert calls == [(1, 2)]
+    assert events.stats is None
+
+
+def on_muc_msg(calls):
+    calls.append('muc_msg')
+
+
+def test_stats():
+    events = EventHandler()
+    calls = []
+    events.add_event_handler('muc_msg', on_muc_msg)
+    events.trigger('muc_msg', calls)
+    events.enable_stats()
+    for _ in range(3):
+        events.trigger('muc_msg', calls)
+    events.trigger('highlight')
+    assert calls == ['muc_msg'] * 4
+    assert list(events.stats) == [('muc_msg', __name__, 'on_muc_msg')]
+    stats = events.stats['muc_msg', __name__, 'on_muc_msg']
+    assert stats.calls == 3
+    assert 0 <= stats.percentile(99) <= stats.total
+    assert len(events.format_stats()) == 1
+
+    # the stats are kept once the measuring stops
+    events.disable_stats()
+    events.trigger('muc_msg', calls)
+    assert calls == ['muc_msg'] * 5
+    assert stats.calls == 3 and len(events.format_stats()) == 1
+
+    events.reset_stats()
+    assert events.stats == {} and events.format_stats() == []
+
+
+def test_percentile():
+    stats = HandlerStats()
+    assert stats.percentile(99) == 0.0
+    for i in range(1, 201):
+        stats.record(i / 1000)
+    assert stats.calls == 200
+    assert abs(stats.percentile(99) - 0.198) < 1e-9
+    assert abs(stats.percentile(50) - 0.1) < 1e-9
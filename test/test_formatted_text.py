@@ -0,0 +1,65 @@
+"""
+Test the compiled formatting of the messages (poezio.formatted_text)
+"""
+
+import pytest
+
+from poezio.formatted_text import FormattedText, compile_formatting, apply_codes
+from poezio.xhtml import clean_text
+
+CORPUS = [
+    '',
+    'no formatting',
+    '\x19bbold\x19o normal',
+    'a \x19196}colored\x19o word',
+    '\x1912,-1,b}fg bg bold\x19o',
+    '\x19u\x19i\x19b\x19o',
+    'é\x19bünïcode\x19o',
+    'trailing \x19b',
+    '\x19-1}default color',
+]
+
+
+@pytest.mark.parametrize('txt', CORPUS)
+def test_plain_is_clean_text(txt):
+    assert FormattedText(txt).plain == clean_text(txt)
+
+
+def test_compile_formatting():
+    plain, offsets, codes = compile_formatting(
+        'a\x19bb\x19196}c\x19o d\x1912,-1,b}')
+    assert plain == 'abc d'
+    assert offsets == [1, 2, 3, 5]
+    assert codes == ['b', '196', 'o', '12,-1,b']
+
+
+def test_compile_formatting_unknown_codes():
+    # unknown codes are dropped
+    assert compile_formatting('a\x19ab\x19c') == ('ab', [], [])
+
+
+def test_compile_formatting_unterminated_color():
+    # the text after a color without its } is kept
+    assert compile_formatting('a\x19196') == ('a96', [], [])
+    assert compile_formatting('a\x191 b\x19bc') == ('a bc', [3], ['b'])
+
+
+def test_compile_formatting_case():
+    # as they were displayed, the simple codes are case-insensitive
+    assert compile_formatting('\x19Bbold\x19O') == ('bold', [0, 4], ['b', 'o'])
+
+
+def test_apply_codes():
+    assert apply_codes([], ['b', '196']) == ['b', '196']
+    assert apply_codes(['b'], ['u', 'o', 'i']) == ['i']
+    assert apply_codes(['b'], []) == ['b']
+
+
+def test_codes_between():
+    formatted = FormattedText('\x19bab\x19ucd\x19o')
+    assert formatted.plain == 'abcd'
+    assert formatted.codes_between(0, 2) == (0, 1)
+    assert formatted.codes_between(2, 3) == (1, 2)
+    # the codes at the end of the text belong to its last line
+    assert formatted.codes_between(2, 4) == (1, 3)
+    assert formatted.codes_between(4, 4) == (2, 3)
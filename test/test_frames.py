@@ -0,0 +1,80 @@
+"""
+Test the coalescing of the screen updates
+"""
+
+from poezio.frames import FrameScheduler
+
+
+class FakeLoop:
+    def __init__(self):
+        self.idle = []
+        self.later = []
+
+    def idle_call(self, callback):
+        self.idle.append(callback)
+
+    def call_later(self, delay, callback, *args):
+        self.later.append((delay, callback, args))
+
+    def run_idle(self):
+        idle, self.idle = self.idle, []
+        for callback in idle:
+            callback()
+
+
+def new_scheduler(max_fps=0):
+    frames = []
+    loop = FakeLoop()
+    scheduler = FrameScheduler(
+        lambda full, redraws: frames.append((full, list(redraws.items()))),
+        max_fps, loop)
+    return scheduler, loop, frames
+
+
+def test_one_frame_per_tick():
+    scheduler, loop, frames = new_scheduler()
+    text = object()
+    redraws = {name: (lambda: None) for name in ('text', 'info', 'input')}
+    scheduler.mark_dirty(text, redraws['text'])
+    scheduler.mark_dirty(text, redraws['input'])
+    scheduler.mark_dirty(None, redraws['info'])
+    # marked again: drawn once, after the others
+    scheduler.mark_dirty(text, redraws['input'])
+    scheduler.request()
+    assert len(loop.idle) == 1 and not frames
+    loop.run_idle()
+    assert frames == [(False, [(redraws['text'], text),
+                               (redraws['info'], None),
+                               (redraws['input'], text)])]
+    loop.run_idle()
+    assert len(frames) == 1
+
+    scheduler.mark_dirty(text, redraws['text'])
+    scheduler.mark_full()
+    scheduler.mark_dirty(text, redraws['input'])
+    loop.run_idle()
+    assert frames[1] == (True, [])
+
+
+def test_flush():
+    scheduler, loop, frames = new_scheduler()
+    scheduler.request()
+    scheduler.flush()
+    assert frames == [(False, [])]
+    # the scheduled frame has nothing left to draw
+    loop.run_idle()
+    assert len(frames) == 1
+
+
+def test_max_fps():
+    scheduler, loop, frames = new_scheduler(max_fps=10)
+    scheduler.request()
+    loop.run_idle()
+    scheduler.request()
+    scheduler.request()
+    assert not loop.idle and len(loop.later) == 1
+    delay, callback, args = loop.later[0]
+    assert 0 < delay <= 0.1
+    callback(*args)
+    loop.run_idle()
+    assert len(frames) == 2
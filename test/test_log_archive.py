@@ -0,0 +1,62 @@
+"""
+Test the export and import of the logs by poezio-log-archive
+"""
+
+import datetime
+import json
+
+import pytest
+
+from poezio.common import get_utc_time
+from poezio.log_archive import run, read_log
+from poezio.logger import build_log_message
+
+DATES = [datetime.datetime(2017, month, 9, 10, 0, 0) for month in range(1, 7)]
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    logs = tmp_path / 'logs'
+    logs.mkdir()
+    for room in ('room@muc.example', 'other@muc.example'):
+        with (logs / room).open('w') as fd:
+            for i, date in enumerate(DATES):
+                fd.write(build_log_message('toto', 'message %d\nof %s' % (i, room), date=date))
+                fd.write(build_log_message('', 'toto has left', date=date, typ=2))
+    return logs
+
+
+def test_read_log(log_dir):
+    records = list(read_log(log_dir / 'room@muc.example'))
+    assert len(records) == 12
+    assert records[0] == {
+        'jid': 'room@muc.example',
+        'time': get_utc_time(DATES[0]).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'type': 'message',
+        'nick': 'toto',
+        'text': 'message 0\nof room@muc.example',
+    }
+    assert records[1]['type'] == 'info' and records[1]['nick'] is None
+
+
+@pytest.mark.parametrize('name,jobs', [('export.jsonl', 1), ('export.db', 2)])
+def test_export_import(tmp_path, log_dir, name, jobs):
+    export = str(tmp_path / name)
+    run(['-j', str(jobs), 'export', str(log_dir), '-o', export])
+    imported = tmp_path / 'imported'
+    run(['-j', str(jobs), 'import', export, '-d', str(imported)])
+    for room in ('room@muc.example', 'other@muc.example'):
+        assert (imported / room).read_text() == (log_dir / room).read_text()
+
+
+def test_date_range(tmp_path, log_dir):
+    export = tmp_path / 'export.jsonl'
+    run(['--since', '2017-02-09', '--until', '2017-04-09T10:00', 'export',
+         str(log_dir / 'room@muc.example'), '-o', str(export)])
+    records = [json.loads(line) for line in export.read_text().splitlines()]
+    assert [record['text'] for record in records if record['nick']] == [
+        'message 1\nof room@muc.example', 'message 2\nof room@muc.example']
+
+    imported = tmp_path / 'imported'
+    run(['--until', '2017-02-10', 'import', str(export), '-d', str(imported)])
+    assert list(read_log(imported / 'room@muc.example')) == records[:2]
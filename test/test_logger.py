@@ -2,6 +2,7 @@
 Test the functions in the `logger` module
 """
 import datetime
+import pytest
 from poezio.logger import LogMessage, parse_log_line, parse_log_lines, build_log_message
 from poezio.common import get_utc_time, get_local_time
 
@@ -31,3 +32,212 @@ def test_log_and_parse_messages():
         {'time': msg1['date'], 'history': True, 'txt': '\x195,-1}coucou', 'nickname': 'toto'},
         {'time': msg2['date'], 'history': True, 'txt': '\x195,-1}coucou\ncoucou', 'nickname': 'toto'},
     ]
+
+
+
+def test_parse_log_data():
+    from poezio import logger
+    from poezio.logger import parse_log_data
+    dates = [datetime.datetime(2017, month, 9, hour, 9, 9) for month in (1, 7) for hour in (0, 13)]
+    data = ''.join([
+        build_log_message('toto', 'coucou', date=dates[0]),
+        build_log_message('tata', 'multi\nline\n\nmessage', date=dates[1]),
+        build_log_message('', 'toto has joined', date=dates[2], typ=2),
+        ' orphan line\n',
+        'MR 20170909T09:09:09Z 000 <nick with space> \u00a0hi\n',
+        'MR 20170909T09:09:09Z 000 <nick> \u00a0 leading space\n',
+        'MR 20170909T09:09:09Z 000 <> \u00a0wrong\n',
+        'garbage\n',
+        build_log_message('tété', 'ünicode', date=dates[3]),
+        'MR 20170909T09:09:09Z 002 <toto> \u00a0truncated\n first',
+    ]).encode()
+    expected = parse_log_lines(data.decode().splitlines())
+    assert len(expected) == 7
+    assert parse_log_data(data) == expected
+    # the pure python fallback
+    parse_logs = logger.parse_logs
+    try:
+        logger.parse_logs = None
+        assert parse_log_data(data) == expected
+    finally:
+        logger.parse_logs = parse_logs
+
+
+def test_log_index(tmp_path):
+    from poezio.log_index import LogIndex
+    from poezio.logger import get_data_from_offset, parse_log_data
+    log_path = tmp_path / 'room@muc.example'
+    dates = [datetime.datetime(2017, 9, day, 10, 0, 0) for day in range(1, 8)]
+    with log_path.open('w') as fd:
+        for i, date in enumerate(dates):
+            fd.write(build_log_message('toto', 'message %d\nline' % i, date=date))
+
+    index = LogIndex(log_path, tmp_path / '.index' / 'room@muc.example')
+    index.update()
+    offset = index.find_date(get_utc_time(dates[3]))
+    with log_path.open('rb') as fd:
+        data = get_data_from_offset(fd, offset, nb=2)
+    messages = parse_log_data(data)
+    assert [message['time'] for message in messages] == dates[3:5]
+    assert messages[0]['txt'].endswith('message 3\nline')
+    assert index.find_date(datetime.datetime(2018, 1, 1)) is None
+
+    # new messages are indexed incrementally, with their id
+    with log_path.open('a') as fd:
+        offset = fd.tell()
+        fd.write(build_log_message('toto', 'new', date=dates[-1]))
+    index.add(offset, get_utc_time(dates[-1]), 'some-id')
+    index.flush()
+    assert index.find_id('some-id') == offset
+    assert index.find_id('other-id') is None
+    index.update()
+    assert index.find_id('some-id') == offset
+    index.close()
+
+    # a fresh index of the same file finds the same offsets
+    fresh = LogIndex(log_path, tmp_path / 'fresh')
+    fresh.update()
+    assert fresh.find_date(get_utc_time(dates[3])) == index.find_date(
+        get_utc_time(dates[3]))
+
+
+def test_log_search(tmp_path):
+    from poezio.log_search import LogSearch, build_query
+    from poezio.logger import get_data_around_offset, parse_log_data
+    room = 'room@muc.example'
+    dates = [datetime.datetime(2017, 9, day, 10, 0, 0) for day in range(1, 8)]
+    with (tmp_path / room).open('w') as fd:
+        for i, date in enumerate(dates):
+            fd.write(build_log_message('toto', 'message %d\nline Été' % i, date=date))
+            fd.write(build_log_message('', 'toto has joined', date=date, typ=2))
+    (tmp_path / 'roster.log').write_text('MI 20170909T09:09:09Z 000 message\n')
+
+    assert build_query('foo "bar" baz*') == '"foo" """bar""" "baz"*'
+    search = LogSearch(tmp_path, tmp_path / '.index' / 'search.db')
+    search.backfill()
+    # small steps, so that the messages are indexed over several ones
+    while search.step(budget=100):
+        pass
+    results = search.search('message')
+    assert [result.text for result in results] == [
+        'message %d\nline Été' % i for i in reversed(range(7))]
+    assert [result.time for result in results] == [
+        get_utc_time(date) for date in reversed(dates)]
+    assert search.search('ete') == search.search('message')
+    assert search.search('joined') == []
+    assert search.search('mess*', jid='other@muc.example') == []
+    assert [result.text for result in search.search('message 3')] == [
+        'message 3\nline Été']
+
+    # the context of a result
+    with (tmp_path / room).open('rb') as fd:
+        data, position = get_data_around_offset(fd, results[4].offset, before=2, after=1)
+    messages = parse_log_data(data)
+    assert len(messages) == 4 and position == 2
+    assert messages[position]['txt'].endswith('message 2\nline Été')
+
+    # new messages are indexed incrementally, and the offsets survive a restart
+    with (tmp_path / room).open('a') as fd:
+        fd.write(build_log_message('tata', 'something new', date=dates[-1]))
+    search.close()
+    search = LogSearch(tmp_path, tmp_path / '.index' / 'search.db')
+    search.notify(room)
+    results = search.search('new')
+    assert [(result.nick, result.text) for result in results] == [('tata', 'something new')]
+    assert len(search.search('message')) == 7
+
+    # a file emptied is removed from the index, even after a restart
+    (tmp_path / room).write_text('')
+    search.notify(room)
+    assert search.search('message') == []
+    search.close()
+    search = LogSearch(tmp_path, tmp_path / '.index' / 'search.db')
+    assert search.search('message') == []
+    search.close()
+
+
+class ConfigShim:
+    def __init__(self, options):
+        self.options = options
+
+    def get(self, option, default=None):
+        return self.options.get(option, default)
+
+    def get_by_tabname(self, option, tabname, default=None):
+        return self.get(option, default)
+
+
+@pytest.fixture
+def shim(tmp_path, monkeypatch):
+    """
+    Log in tmp_path, with the given options
+    """
+    import asyncio
+    import poezio.logger
+    shim = ConfigShim({'use_log': True, 'load_log': 10,
+                       'log_flush_interval': 0, 'max_open_log_files': 128})
+    monkeypatch.setattr(poezio.logger, 'config', shim)
+    monkeypatch.setattr(poezio.logger, 'log_dir', tmp_path)
+    loop = asyncio.new_event_loop()
+    monkeypatch.setattr(asyncio, 'get_event_loop', lambda: loop)
+    yield shim
+    loop.close()
+
+
+def test_write_behind(tmp_path, shim):
+    from poezio.logger import Logger
+    shim.options.update({'log_flush_interval': 10, 'log_buffer_size': 1000})
+
+    room = 'room@muc.example'
+    logger = Logger()
+    assert logger.log_message(room, 'toto', 'first')
+    assert logger.log_message(room, 'toto', 'second')
+    # nothing written yet, but a flush is scheduled
+    assert (tmp_path / room).read_text() == ''
+    assert logger._flush_handle is not None
+    # reading the logs flushes the pending writes
+    messages = logger.get_logs(room, 2)
+    assert messages[0]['txt'].endswith('first')
+    assert messages[1]['txt'].endswith('second')
+    assert logger._flush_handle is None
+
+    # the writes are flushed once log_buffer_size is reached
+    for i in range(2):
+        logger.log_message(room, 'toto', 'x' * 300)
+    assert (tmp_path / room).read_text().count('x' * 300) == 0
+    logger.log_message(room, 'toto', 'x' * 300)
+    assert (tmp_path / room).read_text().count('x' * 300) == 3
+    assert not logger._pending
+
+    logger.log_message(room, 'toto', 'last')
+    logger.log_roster_change('toto@example.com', 'got\nonline')
+    # the whole line written is counted, not just the message
+    assert logger._pending[None] == len(
+        'MI 20170909T09:09:09Z 001 toto@example.com got\n online\n')
+    assert logger.flush_all()
+    assert (tmp_path / room).read_text().endswith('last\n')
+    assert (tmp_path / 'roster.log').read_text().endswith('got\n online\n')
+
+    # without log_flush_interval, each message is flushed
+    shim.options['log_flush_interval'] = 0
+    logger.log_message(room, 'toto', 'now')
+    assert (tmp_path / room).read_text().endswith('now\n')
+
+
+def test_open_files_limit(tmp_path, shim):
+    from poezio.logger import Logger
+    shim.options.update({'max_open_log_files': 2, 'log_flush_interval': 10,
+                         'log_buffer_size': 1000})
+    logger = Logger()
+    for jid in ('a@example', 'b@example', 'a@example', 'c@example'):
+        logger.log_message(jid, 'toto', 'hello %s' % jid)
+    assert list(logger._fds) == ['a@example', 'c@example']
+    assert (logger.fd_hits, logger.fd_misses) == (1, 3)
+    # the closed file got its pending write flushed
+    assert (tmp_path / 'b@example').read_text().endswith('hello b@example\n')
+    assert (tmp_path / 'a@example').read_text() == ''
+    logger.log_message('b@example', 'toto', 'again')
+    assert list(logger._fds) == ['c@example', 'b@example']
+    assert (tmp_path / 'a@example').read_text().count('hello a@example') == 2
+    logger.flush_all()
+    assert (tmp_path / 'b@example').read_text().count('\nMR ') == 1
@@ -0,0 +1,156 @@
+"""
+Test the highlight regex of the MucTab, and the batches of presences
+"""
+
+from xml.etree import ElementTree as ET
+
+import pytest
+
+import poezio.core  # imported first, for the tabs to be importable
+from poezio.config import DEFAULT_CONFIG
+from poezio.tabs.muctab import (MucTab, PRESENCE_SUMMARY_THRESHOLD,
+                                build_highlight_regex)
+from poezio.text_buffer import TextBuffer
+from poezio.theming import get_theme
+from poezio.user import UserTable
+
+
+def test_highlight_regex():
+    regex = build_highlight_regex('To.to', 'poezio:c++:')
+    assert regex.search('hello to.to!')
+    assert regex.search('TO.TO: hi')
+    assert not regex.search('hello toxto')
+    assert not regex.search('hello to.tos')
+    assert regex.search('I use Poezio')
+    assert regex.search('some c++ code')
+    assert not regex.search('some c code')
+    assert build_highlight_regex('', '::') is None
+
+
+class FakePresence:
+    """A join, a leave or a status change"""
+
+    def __init__(self, kind, nick):
+        self.kind, self.nick = kind, nick
+        self.xml = ET.Element('presence')
+
+    def __getitem__(self, key):
+        return ''
+
+
+class FakeTabs:
+    current_tab = None
+
+
+class FakeCore:
+    def __init__(self):
+        self.tabs = FakeTabs()
+        self.timed_events = []
+
+    def add_timed_event(self, event):
+        self.timed_events.append(event)
+
+    def remove_timed_event(self, event):
+        self.timed_events.remove(event)
+
+
+class ConfigShim:
+    def get(self, option, default=None, section='Poezio'):
+        return DEFAULT_CONFIG['Poezio'].get(option, default)
+
+    def get_by_tabname(self, option, tabname, *args, **kwargs):
+        return self.get(option)
+
+
+@pytest.fixture
+def muc(monkeypatch):
+    import poezio.tabs.muctab
+    import poezio.text_buffer
+    for module in (poezio.tabs.muctab, poezio.text_buffer):
+        monkeypatch.setattr(module, 'config', ConfigShim())
+    tab = MucTab.__new__(MucTab)
+    tab.core = FakeCore()
+    tab.name = 'room@muc.example'
+    tab.joined = True
+    tab._state = 'normal'
+    tab.presence_batch = []
+    tab.presence_batch_event = None
+    tab._batch_run = None
+    tab.users = UserTable()
+    tab._text_buffer = TextBuffer(1000)
+    tab.logged = []
+
+    def log_message(txt, nickname, time=None, typ=1, identifier=None):
+        if typ:
+            tab.logged.append(txt)
+
+    tab.log_message = log_message
+
+    def handle_presence_joined(presence, status_codes):
+        if presence.kind == 'status':
+            tab.add_message('%s changed status' % presence.nick, typ=2)
+        else:
+            line = '%s %s' % (presence.nick, presence.kind)
+            tab.add_presence_line(presence.kind == 'joined', line,
+                                  presence.nick)
+
+    tab.handle_presence_joined = handle_presence_joined
+    return tab
+
+
+def lines(tab):
+    return [message.plain for message in tab._text_buffer.messages]
+
+
+def receive(tab, *presences):
+    for kind, nick in presences:
+        tab.handle_presence(FakePresence(kind, nick))
+
+
+def test_presence_batch(muc):
+    receive(muc, ('joined', 'a'), ('left', 'b'))
+    # nothing handled until the timed event
+    assert lines(muc) == []
+    assert muc.core.timed_events == [muc.presence_batch_event]
+    muc.process_presence_batch()
+    assert lines(muc) == ['a joined', 'b left']
+    assert muc.core.timed_events == []
+    assert muc.presence_batch_event is None
+
+
+def test_presence_summary_threshold(muc):
+    # status changes are not counted
+    receive(muc, *[('status', str(i)) for i in range(5)])
+    receive(muc, *[('joined', str(i))
+                   for i in range(PRESENCE_SUMMARY_THRESHOLD - 1)])
+    muc.process_presence_batch()
+    assert len(lines(muc)) == 5 + PRESENCE_SUMMARY_THRESHOLD - 1
+    assert not any('users' in line for line in lines(muc))
+
+    receive(muc, *[('joined', 'j%d' % i) for i in range(3)])
+    receive(muc, ('left', 'l0'), ('left', 'l1'))
+    muc.process_presence_batch()
+    assert lines(muc)[-2:] == [
+        '%s 3 users joined the room: j0, j1, j2' % get_theme().CHAR_JOIN,
+        '%s 2 users left the room: l0, l1' % get_theme().CHAR_QUIT
+    ]
+    # the logs get each line instead of the summary
+    assert muc.logged[-5:] == [
+        'j0 joined', 'j1 joined', 'j2 joined', 'l0 left', 'l1 left'
+    ]
+    assert len(muc.logged) == len(lines(muc)) + 3
+
+
+def test_presence_summary_order(muc):
+    receive(muc, *[('joined', 'a%d' % i) for i in range(5)])
+    receive(muc, ('status', 's'), ('left', 'b'))
+    receive(muc, *[('left', 'c%d' % i) for i in range(5)])
+    muc.process_presence_batch()
+    # the lines stay in the order of the presences
+    assert lines(muc) == [
+        '%s 5 users joined the room: a0, a1, a2, a3, a4' %
+        get_theme().CHAR_JOIN,
+        's changed status',
+        '%s 6 users left the room: b, c0, c1, c2, c3, c4' %
+        get_theme().CHAR_QUIT,
+    ]
@@ -2,7 +2,7 @@
 Test of the poopt module
 """
 
-from poezio.poopt import cut_text
+from poezio.poopt import cut_text, parse_logs
 
 def test_cut_text():
 
@@ -14,3 +14,18 @@ def test_cut_text():
 
     text = 'vivent les réfrigérateurs'
     assert cut_text(text, 6) == [(0, 6), (6, 10), (11, 17), (17, 23), (23, 25)]
+
+
+def test_parse_logs():
+    data = ('MR 20170909T09:09:09Z 001 <nick> \u00a0body\n next\n'
+            'MI 20171011T12:13:14Z 000 info\n'
+            'MR 20170909T09:09:09Z 000 nick> \u00a0invalid\n'
+            'MR 20170909T09:09:09Z 000 <é> \u00a0\n'
+            'MR 20170909T09:09:09Z 000 <a> b> \u00a0c\u00a0\n').encode()
+    assert parse_logs(data) == [
+        (2017, 9, 9, 9, 9, 9, 'nick', 'body\nnext'),
+        (2017, 10, 11, 12, 13, 14, None, 'info'),
+        (2017, 9, 9, 9, 9, 9, 'é', ''),
+        (2017, 9, 9, 9, 9, 9, 'a> b', 'c\u00a0'),
+    ]
+    assert parse_logs(b'') == []
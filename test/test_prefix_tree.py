@@ -0,0 +1,85 @@
+"""
+Test the PrefixTree of the completions, and how the trees of the
+bookmarks and of the roster are kept up to date
+"""
+
+from poezio.prefix_tree import PrefixTree
+
+
+def test_complete():
+    tree = PrefixTree(['toto@example.com', 'Tata@example.com', 'titi@a.b',
+                       'toto@example.com/res', 'tot'])
+    assert tree.complete('to') == [
+        'tot', 'toto@example.com', 'toto@example.com/res']
+    assert tree.complete('T') == [
+        'Tata@example.com', 'titi@a.b', 'tot', 'toto@example.com',
+        'toto@example.com/res']
+    assert tree.complete('tata') == ['Tata@example.com']
+    assert tree.complete('nobody') == []
+    assert len(tree) == 5 and 'tot' in tree
+
+
+def test_discard_and_sync():
+    tree = PrefixTree(['abc', 'abd', 'ab'])
+    tree.discard('abc')
+    tree.discard('unknown')
+    assert tree.complete('a') == ['ab', 'abd']
+    tree.discard('abd')
+    assert tree.complete('abd') == []
+    assert tree.complete('') == ['ab']
+    tree.sync(['ab', 'x', 'xy'])
+    assert tree.complete('') == ['ab', 'x', 'xy']
+    tree.sync([])
+    assert tree.complete('') == [] and len(tree) == 0
+
+
+class ConfigShim:
+    def get(self, *args, **kwargs):
+        return ''
+
+
+def test_bookmark_jids(monkeypatch):
+    import poezio.bookmarks
+    from poezio.bookmarks import Bookmark, BookmarkList
+    monkeypatch.setattr(poezio.bookmarks, 'config', ConfigShim())
+    bookmarks = BookmarkList()
+    bookmarks.append(Bookmark('room@muc.example', nick='toto'))
+    bookmarks.append(Bookmark('other@muc.example'))
+    assert bookmarks.jids.complete('') == ['other@muc.example',
+                                           'room@muc.example/toto']
+    # replaced by a bookmark with the same JID
+    bookmarks.append(Bookmark('room@muc.example'))
+    bookmarks.remove('other@muc.example')
+    assert bookmarks.jids.complete('') == ['room@muc.example']
+    bookmarks['room@muc.example'].nick = 'tata'
+    bookmarks.changed()
+    assert bookmarks.jids.complete('r') == ['room@muc.example/tata']
+    bookmarks.set([Bookmark('new@muc.example')])
+    assert bookmarks.jids.complete('') == ['new@muc.example']
+
+
+class FakeRoster:
+    def __init__(self):
+        self.contacts = []
+
+    @property
+    def nb_items(self):
+        return len(self.contacts)
+
+    def jids(self):
+        return list(self.contacts)
+
+
+def test_roster_tree(monkeypatch):
+    import poezio.core  # imported first, for the tabs to be importable
+    from poezio.core import completions
+    roster = FakeRoster()
+    monkeypatch.setattr(completions, 'roster', roster)
+    completion = completions.CompletionCore(None)
+    assert completion.roster_tree().complete('') == []
+    # items added to the roster without the roster handler
+    roster.contacts.extend(['toto@example.com', 'tata@example.com'])
+    assert completion.roster_tree().complete('t') == ['tata@example.com',
+                                                      'toto@example.com']
+    roster.contacts.remove('tata@example.com')
+    assert completion.roster_tree().complete('t') == ['toto@example.com']
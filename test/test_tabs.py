@@ -172,3 +172,42 @@ def test_set_current():
     tabs.set_current_tab(dummy2)
     assert tabs.current_tab is dummy2
 
+
+def test_by_name_and_class():
+    DummyTab.reset()
+    tabs = Tabs(h)
+    dummy = DummyTab()
+    dummy2 = DummyTab()
+    tabs.append(dummy)
+    tabs.append(dummy2)
+    assert tabs.by_name_and_class('dummy1', DummyTab) is dummy2
+    assert tabs.by_name_and_class('dummy1', Tab) is None
+    assert tabs.by_name_and_class('dummy2', DummyTab) is None
+
+    tabs.rename_tab(dummy2, 'other')
+    assert tabs.by_name_and_class('dummy1', DummyTab) is None
+    assert tabs.by_name_and_class('other', DummyTab) is dummy2
+    assert tabs['other'] is dummy2
+
+    tabs.delete(dummy2)
+    assert tabs.by_name_and_class('other', DummyTab) is None
+    tabs.replace_tabs([dummy])
+    assert tabs.by_name_and_class('dummy0', DummyTab) is dummy
+
+def test_find_match():
+    DummyTab.reset()
+    tabs = Tabs(h)
+    for _ in range(4):
+        dummy = DummyTab()
+        dummy.matching_names = lambda dummy=dummy: [(1, dummy.name.upper())]
+        tabs.append(dummy)
+    assert tabs.find_match('dummy2') is tabs[2]
+    assert tabs.find_match('dummy') is tabs[1]
+    assert tabs.find_match('dummy0') is None  # the current tab
+    assert tabs.find_match('nothing') is None
+    tabs.set_current_index(2)
+    assert tabs.find_match('dummy') is tabs[3]
+    tabs.set_current_index(3)
+    assert tabs.find_match('dummy') is tabs[0]
+    tabs.delete(tabs[0])
+    assert tabs.find_match('dummy0') is None
@@ -0,0 +1,136 @@
+"""
+Test the TextBuffer ring and its identifier index
+"""
+
+import pytest
+
+import poezio.text_buffer
+from poezio.text_buffer import TextBuffer, CorrectionError
+
+
+class ConfigShim(object):
+    def get(self, *args, **kwargs):
+        return 10
+
+
+poezio.text_buffer.config = ConfigShim()
+
+
+@pytest.fixture
+def buf():
+    return TextBuffer(messages_nb_limit=3)
+
+
+def test_add_message_evicts_oldest(buf):
+    for i in range(5):
+        buf.add_message('msg%d' % i, identifier='id%d' % i)
+    assert len(buf.messages) == 3
+    assert [msg.identifier for msg in buf.messages] == ['id2', 'id3', 'id4']
+    assert buf.last_message.identifier == 'id4'
+
+
+def test_find_message_after_eviction(buf):
+    for i in range(5):
+        buf.add_message('msg%d' % i, identifier='id%d' % i)
+    assert buf._find_message('id0') == -1
+    assert buf._find_message('id1') == -1
+    assert buf._find_message('id2') == 0
+    assert buf._find_message('id4') == 2
+
+
+def test_find_message_duplicate_identifier(buf):
+    buf.add_message('first', identifier='dup')
+    buf.add_message('second', identifier='dup')
+    buf.add_message('third', identifier='other')
+    buf.add_message('fourth', identifier='other2')
+    # the first 'dup' got evicted, the second one must still be found
+    assert buf.messages[buf._find_message('dup')].txt.startswith('second')
+
+
+def test_ack_message(buf):
+    buf.add_message('coucou', identifier='abc', jid='toto@example.com')
+    msg = buf.ack_message('abc', 'toto@example.com')
+    assert msg.ack == 1
+    assert buf.ack_message('abc', 'toto@example.com') is False
+    assert buf.ack_message('unknown', 'toto@example.com') is None
+
+
+def test_modify_message_updates_index(buf):
+    buf.add_message('coucou', identifier='old', jid='toto@example.com')
+    buf.add_message('other', identifier='other', jid='toto@example.com')
+    msg = buf.modify_message('fixed', 'old', 'new', jid='toto@example.com')
+    assert msg.revisions == 1
+    assert buf.messages[0] is msg
+    assert buf._find_message('old') == -1
+    assert buf._find_message('new') == 0
+    with pytest.raises(CorrectionError):
+        buf.modify_message('again', 'old', 'newer', jid='toto@example.com')
+
+
+def test_replace_messages(buf):
+    for i in range(3):
+        buf.add_message('msg%d' % i, identifier='id%d' % i)
+    kept = list(buf.messages)[1:]
+    buf.messages = kept
+    assert buf._find_message('id0') == -1
+    assert buf._find_message('id2') == 1
+    buf.add_message('msg3', identifier='id3')
+    buf.add_message('msg4', identifier='id4')
+    assert buf._find_message('id1') == -1
+    assert buf._find_message('id4') == 2
+    buf.messages = []
+    assert buf.last_message is None
+    assert buf._find_message('id4') == -1
+
+
+def test_words(buf):
+    buf.add_message('hello \x19bworld\x19o, the World is big')
+    buf.add_message('words and worlds')
+    completions = buf.words.complete('wor')
+    assert completions[:2] == ['words', 'worlds']
+    assert set(completions[2:]) == {'world', 'World'}
+    buf.add_message('world again')
+    assert buf.words.complete('WOR') == ['world', 'words', 'worlds', 'World']
+    # the first message is dropped from the buffer
+    buf.add_message('nothing')
+    assert buf.words.complete('wor') == ['world', 'words', 'worlds']
+    buf.add_message('fix', identifier='old', jid='toto@example.com')
+    buf.modify_message('fixed world', 'old', 'new', jid='toto@example.com')
+    assert buf.words.complete('wor')[0] == 'world'
+    assert buf.words.complete('fix') == ['fixed']
+    assert buf.words.complete('zzz') == []
+    buf.messages = []
+    assert buf.words.complete('wor') == []
+
+
+def test_prepend_messages(buf):
+    buf.add_message('live', identifier='live')
+    assert buf.words.complete('liv') == ['live']
+    nb = buf.prepend_messages([{'txt': 'log%d' % i, 'identifier': 'log%d' % i}
+                               for i in range(3)])
+    # the live message is kept, with the most recent logs that fit
+    assert nb == 2
+    assert [msg.txt for msg in buf.messages] == ['log1\x19o', 'log2\x19o',
+                                                 'live\x19o']
+    assert buf._find_message('log1') == 0
+    assert buf._find_message('live') == 2
+    assert buf.words.complete('log') == ['log2', 'log1']
+    assert buf.prepend_messages([{'txt': 'log'}]) == 0
+
+    # the older messages are evicted first
+    buf.add_message('new', identifier='new')
+    assert buf._find_message('log1') == -1
+    assert buf._find_message('new') == 2
+
+
+def test_prepend_messages_duplicate_ids(buf):
+    buf.add_message('live', identifier='dup')
+    buf.prepend_messages([{'txt': 'old', 'identifier': 'old'},
+                          {'txt': 'newer', 'identifier': 'old'}])
+    # the most recent message with an identifier is found
+    assert buf._find_message('old') == 1
+    # and the messages of the buffer are more recent than the logs
+    buf.messages = []
+    buf.add_message('live', identifier='dup')
+    buf.prepend_messages([{'txt': 'log', 'identifier': 'dup'}])
+    assert buf._find_message('dup') == 1
@@ -0,0 +1,94 @@
+"""
+Test the TimerWheel running the timed events
+"""
+
+from poezio.timed_events import DelayedEvent, TimerWheel
+
+
+class FakeHandle:
+    def __init__(self, when, callback):
+        self.when = when
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeLoop:
+    def __init__(self):
+        self.now = 100.0
+        self.handles = []
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        handle = FakeHandle(when, callback)
+        self.handles.append(handle)
+        return handle
+
+    def advance(self, seconds):
+        """Move the time forward, running the calls due by then"""
+        end = self.now + seconds
+        while True:
+            pending = [handle for handle in self.handles
+                       if not handle.cancelled and handle.when <= end]
+            if not pending:
+                break
+            handle = min(pending, key=lambda handle: handle.when)
+            self.handles.remove(handle)
+            self.now = max(self.now, handle.when)
+            handle.callback()
+        self.now = end
+
+
+def test_wheel():
+    loop = FakeLoop()
+    wheel = TimerWheel(resolution=0.1, size=16, loop=loop)
+    calls = []
+    for delay in (0.5, 0.25, 3, 120):
+        wheel.add(DelayedEvent(delay, calls.append, delay))
+    cancelled = DelayedEvent(1, calls.append, 'cancelled')
+    wheel.add(cancelled)
+    cancelled.handler.cancel()
+    assert len(wheel) == 4
+
+    loop.advance(0.2)
+    assert calls == []
+    loop.advance(0.11)
+    assert calls == [0.25]
+    loop.advance(5)
+    assert calls == [0.25, 0.5, 3]
+    # the events due in more than a turn of the wheel
+    loop.advance(100)
+    assert calls == [0.25, 0.5, 3]
+    loop.advance(20)
+    assert calls == [0.25, 0.5, 3, 120]
+    assert len(wheel) == 0
+    assert not [handle for handle in loop.handles if not handle.cancelled]
+
+
+def test_reschedule():
+    loop = FakeLoop()
+    wheel = TimerWheel(resolution=0.1, size=16, loop=loop)
+    calls = []
+
+    def again():
+        calls.append(loop.now)
+        if len(calls) < 3:
+            wheel.add(DelayedEvent(1, again))
+
+    wheel.add(DelayedEvent(1, again))
+    # postponed many times, the loop is only called for the first one
+    event = None
+    for _ in range(50):
+        if event is not None:
+            event.handler.cancel()
+        event = DelayedEvent(4, calls.append, 'paused')
+        wheel.add(event)
+    assert len(loop.handles) == 1
+
+    loop.advance(10)
+    assert len(calls) == 4 and calls[3] == 'paused'
+    assert [round(now - 100, 1) for now in calls[:3]] == [1.0, 2.0, 3.0]
@@ -0,0 +1,80 @@
+"""
+Test the UserTable of the MUC users
+"""
+
+import random
+
+from slixmpp import JID
+
+from poezio.user import User, UserTable
+
+
+def new_user(nick, role='participant'):
+    return User(nick, 'none', '', '', role, JID(''), deterministic=False)
+
+
+def test_sorted_like_users():
+    table = UserTable()
+    users = [
+        new_user(nick, role)
+        for nick, role in (('toto', 'participant'), ('Tata', 'participant'),
+                           ('zorro', 'moderator'), ('abc', 'visitor'),
+                           ('Alice', 'moderator'), ('bob', 'participant'))
+    ]
+    random.shuffle(users)
+    for user in users:
+        table.add(user)
+    assert list(table) == sorted(users)
+    assert [user.nick for user in table[:3]] == ['Alice', 'zorro', 'bob']
+    assert len(table) == 6
+    assert table.get('toto').nick == 'toto'
+    assert table.get('nobody') is None
+
+
+def test_remove_and_update():
+    table = UserTable()
+    alice, bob, carol = new_user('alice'), new_user('bob'), new_user('carol')
+    for user in (alice, bob, carol):
+        table.add(user)
+    table.remove(bob)
+    assert bob not in table
+    assert table.get('bob') is None
+    assert list(table) == [alice, carol]
+
+    # a nick change
+    table.remove(carol)
+    carol.change_nick('aaron')
+    carol.update('none', '', '', 'moderator')
+    table.add(carol)
+    assert table.get('carol') is None
+    assert table.get('aaron') is carol
+    assert list(table) == [carol, alice]
+
+    # the same nick, twice
+    other_alice = new_user('alice')
+    table.add(other_alice)
+    assert list(table) == [carol, other_alice]
+    table.clear()
+    assert not list(table) and table.get('aaron') is None
+
+
+def test_sorted_when_read():
+    table = UserTable()
+    users = [new_user('user%03d' % i) for i in range(100)]
+    random.shuffle(users)
+    for user in users[:50]:
+        table.add(user)
+    assert list(table) == sorted(users[:50])
+    # removed and added again before being read
+    table.remove(users[0])
+    table.add(users[0])
+    table.remove(users[1])
+    for user in users[50:]:
+        table.add(user)
+    table.remove(users[60])
+    expected = sorted(
+        (user for user in users if user not in (users[1], users[60])),
+        key=lambda user: user.nick)
+    assert len(table) == 98
+    assert list(table) == expected
+    assert table[0] is expected[0]
@@ -71,3 +71,147 @@ class TestInput(object):
 
         assert input.text == 'this is a line of textz'
 
+
+from poezio.windows.text_win import LineBuffer
+
+class TestLineBuffer(object):
+
+    def test_slicing(self):
+        lines = LineBuffer(range(10))
+        assert lines[-3:] == [7, 8, 9]
+        assert lines[-5:-2] == [5, 6, 7]
+        assert lines[::-3] == [9, 6, 3, 0]
+        assert lines[-1] == 9
+        assert list(lines) == list(range(10))
+
+    def test_trim(self):
+        lines = LineBuffer(range(10))
+        assert lines.trim(20) == []
+        assert lines.trim(7) == [0, 1, 2]
+        assert len(lines) == 7
+        assert lines[0] == 3
+        assert lines[-2:] == [8, 9]
+        assert lines.index(5) == 2
+        assert 2 not in lines
+        lines.extend(range(10, 20))
+        assert lines.trim(4) == list(range(3, 16))
+        assert list(lines) == [16, 17, 18, 19]
+
+    def test_insert_pop_remove(self):
+        lines = LineBuffer(range(6))
+        lines.trim(4)
+        lines.insert(1, 'a')
+        assert list(lines) == [2, 'a', 3, 4, 5]
+        assert lines.pop(1) == 'a'
+        lines.insert(10, 'b')
+        assert lines[-1] == 'b'
+        lines.remove('b')
+        assert list(lines) == [2, 3, 4, 5]
+
+import poezio.windows.text_win
+from poezio.windows.text_win import TextWin
+from poezio.text_buffer import Message
+
+class LayoutConfigShim(object):
+    lazy_layout = True
+    def get(self, option, *args, **kwargs):
+        if option == 'lazy_layout':
+            return self.lazy_layout
+        return 10
+
+class Room(object):
+    def __init__(self):
+        self.messages = []
+        self.first_seq = 0
+
+class TestLazyLayout(object):
+
+    @pytest.fixture
+    def layout_config(self, monkeypatch):
+        shim = LayoutConfigShim()
+        monkeypatch.setattr(poezio.windows.text_win, 'config', shim)
+        return shim
+
+    def build(self, nb_lines_limit=10000):
+        room = Room()
+        win = TextWin(nb_lines_limit)
+        win.width, win.height = 30, 5
+        for i in range(200):
+            msg = Message(' '.join(['word'] * (i % 13 + 1)), None, 'nick',
+                          None, False, None, str(i), highlight=not i % 7)
+            room.messages.append(msg)
+            win.build_new_message(msg, highlight=msg.highlight)
+            if i == 150:
+                win.add_line_separator(room)
+        return room, win
+
+    def snapshot(self, win):
+        lines = [(line.msg, line.start_pos, line.end_pos) if line else None
+                 for line in win.built_lines]
+        return (lines, [line.msg for line in win.highlights],
+                win.nb_of_highlights_after_separator, win.separator_after)
+
+    @pytest.mark.parametrize('limit', [10000, 300])
+    def test_lazy_rebuild_is_complete(self, layout_config, limit):
+        room, win = self.build(limit)
+        win.width = 25
+        layout_config.lazy_layout = False
+        win.rebuild_everything(room)
+        full = self.snapshot(win)
+
+        layout_config.lazy_layout = True
+        win.rebuild_everything(room)
+        assert len(win.built_lines) < len(full[0])
+        win.scroll_up(20)
+        assert len(win.built_lines) >= win.pos + win.height
+        win.scroll_to_separator()
+        assert self.snapshot(win) == full
+
+    def test_wrap_is_cached(self, layout_config):
+        room, win = self.build()
+        msg = room.messages[-1]
+        assert len(msg.wrapped) == 1
+        lines = win.wrap_message(msg, 20, None)
+        assert win.wrap_message(msg, 20, None) is lines
+
+    def test_deferred_window(self, layout_config, monkeypatch):
+        import poezio.text_buffer
+        from poezio.text_buffer import TextBuffer
+        monkeypatch.setattr(poezio.text_buffer, 'config', layout_config)
+        buf = TextBuffer(1000)
+        eager, deferred = TextWin(10000), TextWin(10000)
+        for win in (eager, deferred):
+            win.width, win.height = 30, 5
+            buf.add_window(win)
+        deferred.defer()
+        for i in range(50):
+            buf.add_message('word ' * (i % 9 + 1), nickname='nick',
+                            highlight=not i % 7)
+        assert not deferred.built_lines
+        deferred.resume()
+        assert self.snapshot(deferred) == self.snapshot(eager)
+
+    def test_lazy_rebuild_with_evictions(self, layout_config, monkeypatch):
+        import poezio.text_buffer
+        from poezio.text_buffer import TextBuffer
+        monkeypatch.setattr(poezio.text_buffer, 'config', layout_config)
+        buf = TextBuffer(40)
+        win = TextWin(10000)
+        win.width, win.height = 30, 5
+        buf.add_window(win)
+        for i in range(60):
+            buf.add_message('message %d' % i, nickname='nick')
+        win.rebuild_everything(buf)
+        wrapped = len(win.built_lines)
+        # the messages not wrapped yet are dropped from the buffer
+        for i in range(60, 90):
+            buf.add_message('message %d' % i, nickname='nick')
+        assert len(win.built_lines) == wrapped + 30
+        win._build_lines_until(10000)
+        assert [line.msg for line in win.built_lines] == list(buf.messages)
+
+        # the messages replaced in the buffer are not wrapped again
+        win.rebuild_everything(buf)
+        buf.messages = []
+        win._build_lines_until(10000)
+        assert len(win.built_lines) == 10
@@ -4,6 +4,7 @@ Test the functions in the `xhtml` module
 
 import pytest
 import xml
+from xml.etree import ElementTree as ET
 import poezio.xhtml
 from poezio.xhtml import (poezio_colors_to_html, xhtml_to_poezio_colors,
                    _parse_css as parse_css, clean_text)
@@ -91,3 +92,40 @@ def test_parse_css():
 
     example_css = 'text-decoration: underline coucou color: red;'
     assert parse_css(example_css) == ''
+
+XHTML_CORPUS = [
+    b'<p>test</p>',
+    b'<p><a href="http://perdu.com">salut</a> and <a href="http://perdu.com">http://perdu.com</a></p>',
+    b'<p><span style="font-style: italic">Test</span> <strong>bold</strong> <em>em</em></p>',
+    b'<p>several\n    lines   of\ttext,\n\n  <br/>and a break</p>',
+    b'<p>entities: &lt;b&gt; &amp; &#233;t&#xE9;</p>',
+    b'<pre>  keep\n    the   spaces\n</pre><p>after</p>',
+    b'<blockquote>quoted <cite>someone</cite></blockquote>',
+    b'<ul><li>one</li><li>two<ol><li>a</li><li>b</li></ol></li></ul><li>alone</li>',
+    b'<p><img src="http://example.com/a.png" alt="a picture"/> image</p>',
+    b'<p title="a title" xml:lang="en">titled <span title="inner">span</span></p>',
+    b'<p>tail <span style="color: red">red <span style="color:#00f">blue</span></span> text</p>',
+    b'<p>unknown <x xmlns="urn:example">namespace</x> element</p>',
+    b'<div style="font-weight:bold">Allo <div style="color:red">test <div style="color: blue">test2</div></div></div>',
+    b'<p>text <!-- comment --> with a comment</p>',
+]
+
+
+@pytest.mark.parametrize('content', XHTML_CORPUS)
+@pytest.mark.parametrize('css', [True, False])
+@pytest.mark.parametrize('force', [True, False])
+def test_xhtml_element_walker(content, css, force):
+    config.value = css
+    xhtml = (b'<body xmlns="http://www.w3.org/1999/xhtml">' + content +
+             b'</body>')
+    element = ET.fromstring(xhtml)
+    assert xhtml_to_poezio_colors(element, force=force) == \
+        xhtml_to_poezio_colors(xhtml, force=force)
+    config.value = True
+
+
+def test_xhtml_text_pieces():
+    # the text split by the parser is trimmed at once
+    xhtml = (b'<body xmlns="http://www.w3.org/1999/xhtml"><p>a \n'
+             b'  b &amp;\n c</p></body>')
+    assert xhtml_to_poezio_colors(xhtml) == 'a b & c'
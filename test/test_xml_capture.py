@@ -0,0 +1,62 @@
+"""
+Test the capture of the stanzas of the XMLTab
+"""
+
+import gzip
+
+from poezio.xml_capture import StanzaCapture
+
+
+def test_ring():
+    capture = StanzaCapture(3)
+    for i in range(5):
+        capture.add('<iq id="%d"/>' % i, incoming=bool(i % 2))
+    assert len(capture) == 3
+    stanzas, seq = capture.since(0)
+    assert [stanza.text for stanza in stanzas] == [
+        '<iq id="2"/>', '<iq id="3"/>', '<iq id="4"/>']
+    assert [stanza.incoming for stanza in stanzas] == [False, True, False]
+    assert seq == 5
+    capture.add('<iq id="5"/>', incoming=True)
+    stanzas, seq = capture.since(seq)
+    assert [stanza.text for stanza in stanzas] == ['<iq id="5"/>']
+    assert capture.since(seq) == ([], 6)
+
+    capture.clear()
+    assert len(capture) == 0
+    assert capture.since(0) == ([], 6)
+
+
+def test_spill(tmp_path):
+    spill = tmp_path / 'capture.gz'
+    capture = StanzaCapture(2, str(spill))
+    for i in range(4):
+        capture.add('<iq id="%d"/>' % i, incoming=True)
+    capture.close()
+    lines = gzip.open(str(spill), 'rt').read().splitlines()
+    # the stanzas still in the ring are spilled when closing
+    assert [line.split(' ', 2)[2] for line in lines] == [
+        'IN <iq id="%d"/>' % i for i in range(4)]
+
+
+def test_indexes():
+    capture = StanzaCapture(3)
+    capture.add('<message xmlns="jabber:client" from="Toto@Example.com/res" '
+                "to='tata@example.com' id=\"a&amp;b\"><body/></message>",
+                incoming=True)
+    capture.add('<iq to="toto@example.com" id="2"/>', incoming=False)
+    capture.add('<presence from="titi@example.com"/>', incoming=True)
+    message = capture.since(0)[0][0]
+    assert (message.tag, message.from_, message.to, message.id) == (
+        'message', 'Toto@Example.com/res', 'tata@example.com', 'a&b')
+    assert [s.id for s in capture.by_jid('toto@example.com/other')] == [
+        'a&b', '2']
+    assert capture.by_id('a&b') == [message]
+    assert capture.by_jid('nobody@example.com') == []
+
+    capture.add('<iq from="toto@example.com" id="2"/>', incoming=True)
+    assert capture.by_id('a&b') == []
+    assert [s.from_ for s in capture.by_id('2')] == ['', 'toto@example.com']
+    assert [s.id for s in capture.by_jid('toto@example.com')] == ['2', '2']
+    capture.clear()
+    assert capture.by_id('2') == []